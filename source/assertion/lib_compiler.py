@@ -0,0 +1,192 @@
+import autograd.numpy as np
+
+from assertion.lib_assertions import *
+from assertion.lib_functions import d0, d2, di, arg_max, arg_min, lin_inp, lin_out, index
+
+
+class Batch:
+    # the values of the variables for a batch of assignments, one per row, and
+    # the outputs of the model for them, each computed once
+    def __init__(self, model, vars_dict):
+        self.model = model
+        self.vars_dict = dict()
+        self.outputs = dict()
+
+        for name, value in vars_dict.items():
+            self.vars_dict[name] = value.reshape(1, -1) if np.ndim(value) == 1 else value
+
+        self.size = max(len(value) for value in self.vars_dict.values())
+
+    def get_var(self, name):
+        return self.vars_dict[name]
+
+    def get_output(self, name):
+        if name not in self.outputs:
+            self.outputs[name] = self.model.apply_batch(self.vars_dict[name])
+
+        return self.outputs[name]
+
+
+def pick(output, idxs):
+    # output[i, idxs[i]] for each row i, written with a product so autograd can follow it
+    return np.sum(output * np.eye(output.shape[1])[idxs], axis=1)
+
+
+def compile_func(node):
+    # return a function from a batch to the values of node, one per row
+    if isinstance(node, Num):
+        return lambda batch: node.value
+
+    func, names = node.func, [var.name for var in node.vars]
+    base = getattr(func, 'func', func)
+    keywords = getattr(func, 'keywords', dict())
+
+    if base == d0:
+        return lambda batch: np.sum(batch.get_var(names[0]) != batch.get_var(names[1]), axis=1)
+    elif base == d2:
+        return lambda batch: np.sqrt(np.sum((batch.get_var(names[0]) - batch.get_var(names[1])) ** 2, axis=1))
+    elif base == di:
+        return lambda batch: np.max(np.abs(batch.get_var(names[0]) - batch.get_var(names[1])), axis=1)
+    elif base == arg_max:
+        return lambda batch: np.argmax(batch.get_output(names[0]), axis=1)
+    elif base == arg_min:
+        return lambda batch: np.argmin(batch.get_output(names[0]), axis=1)
+    elif base == lin_inp:
+        coefs = keywords['coefs']
+        return lambda batch: batch.get_var(names[0]) @ coefs[:batch.get_var(names[0]).shape[1]]
+    elif base == lin_out:
+        coefs = keywords['coefs']
+        return lambda batch: batch.get_output(names[0]) @ coefs[:batch.get_output(names[0]).shape[1]]
+    elif base == index:
+        i = keywords['i']
+        return lambda batch: batch.get_var(names[0])[:, i]
+    else:
+        raise NameError('Not support yet!')
+
+
+def compare(op, lhs, rhs):
+    if op == Op.GE:
+        return lhs >= rhs
+    elif op == Op.GT:
+        return lhs > rhs
+    elif op == Op.LE:
+        return lhs <= rhs
+    elif op == Op.LT:
+        return lhs < rhs
+    elif op == Op.EQ:
+        return lhs == rhs
+    elif op == Op.NE:
+        return lhs != rhs
+
+
+def compile_term(term, kind):
+    # kind is 'bool', 'num' or 'neg_num', the batch versions of get_bool_value,
+    # get_num_value and neg_num_value of GeneralTerm
+    op = term.op
+    lhs, rhs = compile_func(term.lhs), compile_func(term.rhs)
+
+    if kind == 'bool':
+        return lambda batch: np.broadcast_to(compare(op, lhs(batch), rhs(batch)), (batch.size,))
+
+    is_arg = isinstance(term.lhs, Function) and \
+        getattr(term.lhs.func, '__name__', None) in ('arg_max', 'arg_min')
+
+    if is_arg and op != Op.EQ and op != Op.NE:
+        print('The operator should be EQ or NE.')
+        return lambda batch: np.zeros(batch.size)
+
+    # the operator whose distance is only 1e-9 when it does not hold
+    tight = Op.NE if kind == 'num' else Op.EQ
+
+    def func(batch):
+        lhs_value, rhs_value = lhs(batch), rhs(batch)
+        holds = compare(op, lhs_value, rhs_value)
+
+        if kind == 'neg_num':
+            holds = np.logical_not(holds)
+
+        if op == tight:
+            dist = 1e-9
+        elif is_arg:
+            output = batch.get_output(term.lhs.vars[0].name)
+            dist = np.abs(pick(output, lhs_value) - pick(output, rhs_value)) + 1e-9
+        else:
+            dist = np.abs(lhs_value - rhs_value) + 1e-9
+
+        return np.where(holds, 0, dist) + np.zeros(batch.size)
+
+    return func
+
+
+def compile_formula(formula, kind):
+    if isinstance(formula, TrueTerm):
+        if kind == 'bool':
+            return lambda batch: np.full(batch.size, True)
+        else:
+            value = 0 if kind == 'num' else 1
+            return lambda batch: np.full(batch.size, value)
+
+    if isinstance(formula, GeneralTerm):
+        return compile_term(formula, kind)
+
+    if isinstance(formula, Disjunction):
+        funcs = [compile_formula(conj, kind) for conj in formula.conjs]
+        is_disj = True
+    else:
+        funcs = [compile_formula(term, kind) for term in formula.terms]
+        is_disj = False
+
+    if kind == 'bool':
+        reduce = np.logical_or if is_disj else np.logical_and
+    elif is_disj == (kind == 'neg_num'):
+        # num sums over a conjunction, neg_num over a disjunction
+        reduce = np.add
+    else:
+        reduce = np.multiply
+
+    def func(batch):
+        res = funcs[0](batch)
+        for f in funcs[1:]:
+            res = reduce(res, f(batch))
+        return res
+
+    return func
+
+
+class CompiledImplication:
+    # an Implication evaluated on batches of assignments of its variables, vars_dict
+    # maps the name of each variable to an array with one value per row
+    def __init__(self, assertion, model):
+        self.vars = assertion.vars
+        self.init_dict = assertion.init_dict
+        self.model = model
+
+        self.pre_bool = compile_formula(assertion.pre, 'bool')
+        self.post_bool = compile_formula(assertion.post, 'bool')
+        self.pre_num = compile_formula(assertion.pre, 'num')
+        self.post_neg_num = compile_formula(assertion.post, 'neg_num')
+
+    def get_batch(self, vars_dict):
+        vars_dict = dict(vars_dict)
+        vars_dict.update(self.init_dict)
+
+        return Batch(self.model, vars_dict)
+
+    def get_pre_bool_value(self, vars_dict):
+        return self.pre_bool(self.get_batch(vars_dict))
+
+    def get_post_bool_value(self, vars_dict):
+        return self.post_bool(self.get_batch(vars_dict))
+
+    def get_bool_values(self, vars_dict):
+        # the pre and post conditions, computing the model once for both
+        batch = self.get_batch(vars_dict)
+        return self.pre_bool(batch), self.post_bool(batch)
+
+    def neg_num_value(self, vars_dict):
+        batch = self.get_batch(vars_dict)
+        return self.pre_num(batch) + self.post_neg_num(batch)
+
+
+def compile_assertion(assertion, model):
+    return CompiledImplication(assertion, model)
@@ -2,24 +2,13 @@ import autograd.numpy as np
 
 
 model = None
-cache = dict()
 
 def set_model(m):
     global model
     model = m
 
-def update_cache(str_x, output):
-    cache[str_x] = output
-
 def apply_model(x):
-    str_x = str(x)
-
-    if str_x in cache:
-        return cache[str_x]
-
-    output = model.apply(x)
-    update_cache(str_x, output)
-    return output
+    return model.apply_memo(x)
 
 def d0(x1, x2):
     return np.sum(x1 != x2)
@@ -0,0 +1,38 @@
+import argparse
+import json
+
+from model.lib_binary import save_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description='nSolver')
+
+    parser.add_argument('--spec', type=str, default='spec.json',
+                        help='the specification file with the layers of the model')
+    parser.add_argument('--output', type=str, default='model.bin',
+                        help='the binary model file to write')
+    parser.add_argument('--output_spec', type=str,
+                        help='the specification file using the binary model to write')
+    parser.add_argument('--dtype', type=str,
+                        help='the floating point type of the stored arrays, float64 or float32')
+
+    args = parser.parse_args()
+
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+
+    save_model(args.output, spec['model']['layers'], args.dtype)
+
+    if args.output_spec is not None:
+        del spec['model']['layers']
+        spec['model']['binary'] = args.output
+
+        if args.dtype is not None:
+            spec['model']['dtype'] = args.dtype
+
+        with open(args.output_spec, 'w') as f:
+            json.dump(spec, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import autograd.numpy as np
+import os
+
+from collections import OrderedDict
+from model.lib_binary import add_array, save_file, load_header, map_array
+from utils import read_array
+
+
+# name of the packed file written by import_dataset.py in a data directory
+PACKED = 'dataset.bin'
+
+# datasets already loaded, shared by all the users of the same directory
+datasets = dict()
+
+# the number of parsed text samples kept by a dataset, the least recently used go first
+NO_SAMPLES = 1024
+
+
+class Dataset:
+    # the samples of a data directory, one flattened sample per index, and their labels;
+    # backed by the packed file of the directory when it exists, otherwise by the
+    # text files <prefix><index>.txt, of which the last NO_SAMPLES used are kept parsed
+    def __init__(self, path, prefix='data', pathY=None):
+        self.path = path
+        self.prefix = prefix
+
+        self.data, self.offsets, self.labels = None, None, None
+        self.samples = OrderedDict()
+        self.size, self.length = None, None
+
+        packed = os.path.join(path, PACKED)
+
+        if os.path.isfile(packed):
+            header, start = load_header(packed)
+
+            self.data = map_array(packed, start, header['data'])
+            self.offsets = map_array(packed, start, header['offsets'])
+
+            if 'labels' in header:
+                self.labels = map_array(packed, start, header['labels'])
+
+            sizes = np.diff(self.offsets)
+            if len(sizes) > 0 and np.all(sizes == sizes[0]):
+                self.size = int(sizes[0])
+
+        self.set_labels(pathY)
+
+    def set_labels(self, pathY):
+        if self.labels is None and pathY is not None:
+            self.labels = read_array(pathY)
+
+    def get_file(self, idx):
+        return os.path.join(self.path, self.prefix + str(idx) + '.txt')
+
+    def __len__(self):
+        if self.offsets is not None:
+            return len(self.offsets) - 1
+
+        if self.length is None:
+            self.length = 0
+            while os.path.isfile(self.get_file(self.length)):
+                self.length += 1
+
+        return self.length
+
+    def get(self, idx):
+        # a copy, the callers may change the sample in place
+        if self.data is not None:
+            return np.array(self.data[self.offsets[idx]:self.offsets[idx + 1]])
+
+        if idx in self.samples:
+            self.samples.move_to_end(idx)
+        else:
+            self.samples[idx] = read_array(self.get_file(idx))
+
+            if len(self.samples) > NO_SAMPLES:
+                self.samples.popitem(last=False)
+
+        return self.samples[idx].copy()
+
+    def get_batch(self, idxs):
+        # samples of idxs, one per row; a slice of a packed dataset is a view
+        if self.size is not None:
+            return self.data.reshape(-1, self.size)[idxs]
+
+        if isinstance(idxs, slice):
+            idxs = range(*idxs.indices(len(self)))
+
+        return np.array([self.get(idx) for idx in idxs])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return self.get(idx)
+        else:
+            return self.get_batch(idx)
+
+
+def load_dataset(path, prefix='data', pathY=None):
+    key = (os.path.abspath(path), prefix)
+
+    if key not in datasets:
+        datasets[key] = Dataset(path, prefix, pathY)
+    else:
+        datasets[key].set_labels(pathY)
+
+    return datasets[key]
+
+
+def save_dataset(path, samples, labels=None):
+    # pack the samples, of possibly different sizes, and the labels into one file
+    samples = [np.asarray(sample).reshape(-1) for sample in samples]
+    offsets = np.cumsum([0] + [len(sample) for sample in samples])
+
+    header, arrays = dict(), []
+
+    header['data'] = add_array(arrays, np.ascontiguousarray(np.concatenate(samples)))
+    header['offsets'] = add_array(arrays, offsets.astype(np.int64))
+
+    if labels is not None:
+        header['labels'] = add_array(arrays, np.ascontiguousarray(labels))
+
+    save_file(path, header, arrays)
@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 class Display:
     def __init__(self, mean, std, resolution):
@@ -29,6 +28,9 @@ class Display:
         x0 = self.__denormalize(x0)
         x = self.__denormalize(x)
 
+        # matplotlib is slow to import and only needed to show a sample
+        import matplotlib.pyplot as plt
+
         fig, ax = plt.subplots(1, 2)
 
         ax[0].set(title='Original. Label is {}'.format(y0))
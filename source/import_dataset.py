@@ -0,0 +1,37 @@
+import argparse
+import os
+
+from dataset import Dataset, PACKED, save_dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the text samples of a data directory into one binary file')
+
+    parser.add_argument('--path', type=str,
+                        help='the data directory with one text file per sample')
+    parser.add_argument('--prefix', type=str, default='data',
+                        help='the name of the sample files before their index')
+    parser.add_argument('--labels', type=str,
+                        help='the labels file, labels.txt of the data directory by default')
+    parser.add_argument('--output', type=str,
+                        help='the packed file to write, dataset.bin of the data directory by default')
+
+    args = parser.parse_args()
+
+    pathY = args.labels
+
+    if pathY is None and os.path.isfile(os.path.join(args.path, 'labels.txt')):
+        pathY = os.path.join(args.path, 'labels.txt')
+
+    output = os.path.join(args.path, PACKED) if args.output is None else args.output
+
+    data = Dataset(args.path, args.prefix, pathY)
+    samples = [data.get(idx) for idx in range(len(data))]
+
+    save_dataset(output, samples, data.labels)
+
+    print('Packed {} samples into {}'.format(len(samples), output))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,10 @@ from assertion.AssertionVisitor import AssertionVisitor
 
 from model.lib_models import *
 from model.lib_layers import *
+from model.lib_optimizer import optimize_model
+from model.lib_binary import get_array, get_value, load_model
+from model.lib_memo import Memo
+from model.lib_cache import get_key, load_cached, save_cached
 from assertion.lib_functions import set_model
 from solver.lib_solvers import *
 from utils import *
@@ -22,8 +26,8 @@ def parse_layers(spec):
 
         if type == 'linear':
 
-            weights = np.array(ast.literal_eval(read(layer['weights'])))
-            bias = np.array(ast.literal_eval(read(layer['bias'])))
+            weights = get_array(layer, 'weights')
+            bias = get_array(layer, 'bias')
             name = layer['func'].lower() if 'func' in layer else None
 
             layers.append(Linear(weights, bias, name))
@@ -31,11 +35,11 @@ def parse_layers(spec):
         elif type == 'conv1d' or type == 'conv2d' \
             or type == 'conv3d':
 
-            filters = np.array(ast.literal_eval(read(layer['filters'])))
-            bias = np.array(ast.literal_eval(read(layer['bias'])))
+            filters = get_array(layer, 'filters')
+            bias = get_array(layer, 'bias')
 
-            stride = ast.literal_eval(read(layer['stride']))
-            padding = ast.literal_eval(read(layer['padding']))
+            stride = get_value(layer, 'stride')
+            padding = get_value(layer, 'padding')
 
             if type == 'conv1d':
                 layers.append(Conv1d(filters, bias, stride, padding))
@@ -47,10 +51,10 @@ def parse_layers(spec):
         elif type == 'maxpool1d' or type == 'maxpool2d' \
             or type == 'maxpool3d':
 
-            kernel = np.array(ast.literal_eval(read(layer['kernel'])))
+            kernel = get_array(layer, 'kernel')
 
-            stride = ast.literal_eval(read(layer['stride']))
-            padding = ast.literal_eval(read(layer['padding']))
+            stride = get_value(layer, 'stride')
+            padding = get_value(layer, 'padding')
 
             if type == 'maxpool1d':
                 layers.append(MaxPool1d(kernel, stride, padding))
@@ -61,22 +65,22 @@ def parse_layers(spec):
 
         elif type == 'resnet2l':
 
-            filters1 = np.array(ast.literal_eval(read(layer['filters1'])))
-            bias1 = np.array(ast.literal_eval(read(layer['bias1'])))
-            filters2 = np.array(ast.literal_eval(read(layer['filters2'])))
-            bias2 = np.array(ast.literal_eval(read(layer['bias2'])))
+            filters1 = get_array(layer, 'filters1')
+            bias1 = get_array(layer, 'bias1')
+            filters2 = get_array(layer, 'filters2')
+            bias2 = get_array(layer, 'bias2')
 
-            stride1 = ast.literal_eval(read(layer['stride1']))
-            padding1 = ast.literal_eval(read(layer['padding1']))
-            stride2 = ast.literal_eval(read(layer['stride2']))
-            padding2 = ast.literal_eval(read(layer['padding2']))
+            stride1 = get_value(layer, 'stride1')
+            padding1 = get_value(layer, 'padding1')
+            stride2 = get_value(layer, 'stride2')
+            padding2 = get_value(layer, 'padding2')
 
             if 'filterX' in layer:
-                filtersX = np.array(ast.literal_eval(read(layer['filtersX'])))
-                biasX = np.array(ast.literal_eval(read(layer['biasX'])))
+                filtersX = get_array(layer, 'filtersX')
+                biasX = get_array(layer, 'biasX')
 
-                strideX = ast.literal_eval(read(layer['strideX']))
-                paddingX = ast.literal_eval(read(layer['paddingX']))
+                strideX = get_value(layer, 'strideX')
+                paddingX = get_value(layer, 'paddingX')
 
                 layers.append(ResNet2l(filters1, bias1, stride1, padding1,
                     filters2, bias2, stride2, padding2,
@@ -87,26 +91,26 @@ def parse_layers(spec):
 
         elif type == 'resnet3l':
 
-            filters1 = np.array(ast.literal_eval(read(layer['filters1'])))
-            bias1 = np.array(ast.literal_eval(read(layer['bias1'])))
-            filters2 = np.array(ast.literal_eval(read(layer['filters2'])))
-            bias2 = np.array(ast.literal_eval(read(layer['bias2'])))
-            filters3 = np.array(ast.literal_eval(read(layer['filters3'])))
-            bias3 = np.array(ast.literal_eval(read(layer['bias3'])))
+            filters1 = get_array(layer, 'filters1')
+            bias1 = get_array(layer, 'bias1')
+            filters2 = get_array(layer, 'filters2')
+            bias2 = get_array(layer, 'bias2')
+            filters3 = get_array(layer, 'filters3')
+            bias3 = get_array(layer, 'bias3')
 
-            stride1 = ast.literal_eval(read(layer['stride1']))
-            padding1 = ast.literal_eval(read(layer['padding1']))
-            stride2 = ast.literal_eval(read(layer['stride2']))
-            padding2 = ast.literal_eval(read(layer['padding2']))
-            stride3 = ast.literal_eval(read(layer['stride3']))
-            padding3 = ast.literal_eval(read(layer['padding3']))
+            stride1 = get_value(layer, 'stride1')
+            padding1 = get_value(layer, 'padding1')
+            stride2 = get_value(layer, 'stride2')
+            padding2 = get_value(layer, 'padding2')
+            stride3 = get_value(layer, 'stride3')
+            padding3 = get_value(layer, 'padding3')
 
             if 'filterX' in layer:
-                filtersX = np.array(ast.literal_eval(read(layer['filtersX'])))
-                biasX = np.array(ast.literal_eval(read(layer['biasX'])))
+                filtersX = get_array(layer, 'filtersX')
+                biasX = get_array(layer, 'biasX')
 
-                strideX = ast.literal_eval(read(layer['strideX']))
-                paddingX = ast.literal_eval(read(layer['paddingX']))
+                strideX = get_value(layer, 'strideX')
+                paddingX = get_value(layer, 'paddingX')
 
                 layers.append(ResNet3l(filters1, bias1, stride1, padding1,
                     filters2, bias2, stride2, padding2,
@@ -119,32 +123,32 @@ def parse_layers(spec):
 
         elif type == 'rnn':
 
-            weights = np.array(ast.literal_eval(read(layer['weights'])))
-            bias = np.array(ast.literal_eval(read(layer['bias'])))
-            h0 = np.array(ast.literal_eval(read(layer['h0'])))
+            weights = get_array(layer, 'weights')
+            bias = get_array(layer, 'bias')
+            h0 = get_array(layer, 'h0')
             name = layer['func'].lower() if 'func' in layer else None
 
             layers.append(BasicRNN(weights, bias, h0, name))
 
         elif type == 'lstm':
 
-            weights = np.array(ast.literal_eval(read(layer['weights'])))
-            bias = np.array(ast.literal_eval(read(layer['bias'])))
+            weights = get_array(layer, 'weights')
+            bias = get_array(layer, 'bias')
 
-            h0 = np.array(ast.literal_eval(read(layer['h0'])))
-            c0 = np.array(ast.literal_eval(read(layer['c0'])))
+            h0 = get_array(layer, 'h0')
+            c0 = get_array(layer, 'c0')
 
             layers.append(LSTM(weights, bias, h0, c0))
 
         elif type == 'gru':
 
-            gate_weights = np.array(ast.literal_eval(read(layer['gate_weights'])))
-            candidate_weights = np.array(ast.literal_eval(read(layer['candidate_weights'])))
+            gate_weights = get_array(layer, 'gate_weights')
+            candidate_weights = get_array(layer, 'candidate_weights')
 
-            gate_bias = np.array(ast.literal_eval(read(layer['gate_bias'])))
-            candidate_bias = np.array(ast.literal_eval(read(layer['candidate_bias'])))
+            gate_bias = get_array(layer, 'gate_bias')
+            candidate_bias = get_array(layer, 'candidate_bias')
 
-            h0 = np.array(ast.literal_eval(read(layer['h0'])))
+            h0 = get_array(layer, 'h0')
 
             layers.append(GRU(gate_weights, candidate_weights, gate_bias, candidate_bias, h0))
 
@@ -152,10 +156,10 @@ def parse_layers(spec):
             name = layer['func'].lower()
 
             if name == 'reshape':
-                ns = ast.literal_eval(read(layer['newshape']))
+                ns = get_value(layer, 'newshape')
                 params = (ns)
             elif name == 'transpose':
-                ax = ast.literal_eval(read(layer['axes']))
+                ax = get_value(layer, 'axes')
                 params = (ax)
             else:
                 params = None
@@ -166,7 +170,7 @@ def parse_layers(spec):
 
 
 def parse_bounds(size, spec):
-    bounds = np.array(ast.literal_eval(read(spec)))
+    bounds = read_array(spec)
 
     lower = np.zeros(size)
     upper = np.zeros(size)
@@ -183,12 +187,26 @@ def parse_bounds(size, spec):
 
 
 def parse_model(spec):
-    shape = np.array(ast.literal_eval(read(spec['shape'])))
+    shape = read_array(spec['shape'])
     lower, upper = parse_bounds(np.prod(shape), spec['bounds'])
-    layers = parse_layers(spec['layers']) if 'layers' in spec else None
+    if 'binary' in spec:
+        layers = parse_layers(load_model(spec['binary']))
+    else:
+        layers = parse_layers(spec['layers']) if 'layers' in spec else None
     path = spec['path'] if 'path' in spec else None
+    threads = ast.literal_eval(read(spec['threads'])) if 'threads' in spec else None
+
+    model = Model(shape, lower, upper, layers, path, threads)
+    parse_dtype(model, spec)
+
+    return model
 
-    return Model(shape, lower, upper, layers, path)
+
+def parse_dtype(model, spec):
+    # the floating point type of the weights, inputs and polys of the model,
+    # float64 by default
+    if 'dtype' in spec:
+        model.cast(np.dtype(read(spec['dtype']).strip()).type)
 
 
 def parse_assertion(spec):
@@ -218,8 +236,9 @@ def parse_solver(spec):
         alpha = ast.literal_eval(read(spec['alpha']))
         beta = ast.literal_eval(read(spec['beta']))
         delta = ast.literal_eval(read(spec['delta']))
+        batch_size = ast.literal_eval(read(spec['batch_size'])) if 'batch_size' in spec else 100
 
-        solver = SPRT(threshold, alpha, beta, delta)
+        solver = SPRT(threshold, alpha, beta, delta, batch_size)
     elif algorithm == 'refinement':
         has_ref = ast.literal_eval(read(spec['has_ref']))
         max_ref = ast.literal_eval(read(spec['max_ref']))
@@ -243,17 +262,58 @@ def parse_solver(spec):
 
 
 def parse_display(spec):
-    mean = np.array(ast.literal_eval(read(spec['mean']))) if 'mean' in spec else np.array([0])
-    std = np.array(ast.literal_eval(read(spec['std']))) if 'std' in spec else np.array([1])
-    resolution = np.array(ast.literal_eval(read(spec['resolution']))) if 'resolution' in spec else np.empty(0)
+    mean = read_array(spec['mean']) if 'mean' in spec else np.array([0])
+    std = read_array(spec['std']) if 'std' in spec else np.array([1])
+    resolution = read_array(spec['resolution']) if 'resolution' in spec else np.empty(0)
 
     display = Display(mean, std, resolution)
 
     return display
 
 
+def parse_memo(spec):
+    # the number of entries and the bytes kept by the memo of the model outputs
+    size = ast.literal_eval(read(spec['memo_size'])) if 'memo_size' in spec else 1024
+    budget = ast.literal_eval(read(spec['memo_budget'])) if 'memo_budget' in spec else 2 ** 27
+
+    return Memo(size, budget)
+
+
+def parse_cached_model(spec, fuse):
+    # parsed models are kept in a cache directory, keyed by their spec and the
+    # files it names; pytorch models are loaded by torch itself, and binary models
+    # are not cached, a pickle would turn their shared read-only memmaps into
+    # private copies of the weights in every process
+    key = get_key(spec, fuse) if 'path' not in spec and 'binary' not in spec else None
+    model = load_cached(key) if key is not None else None
+
+    if model is None:
+        model = parse_model(spec)
+
+        if fuse is not None:
+            optimize_model(model, fuse)
+
+        if key is not None:
+            model.build_plans()
+            save_cached(key, model)
+    else:
+        parse_dtype(model, spec)
+
+    model.memo = parse_memo(spec)
+
+    return model
+
+
 def parse(spec):
-    model = parse_model(spec['model'])
+    fuse = None
+
+    if 'optimize' in spec['model'] and ast.literal_eval(read(spec['model']['optimize'])):
+        # the deeppoly based solvers need the activations as separate layers, and
+        # the repairs of dtmc and causal scale the outputs and weights of the layers
+        # as they alternate between linear layers and activations
+        fuse = spec['solver']['algorithm'] not in ('refinement', 'backdoor', 'backdoor_repair', 'dtmc', 'causal')
+
+    model = parse_cached_model(spec['model'], fuse)
     assertion = parse_assertion(spec['assert'])
     solver = parse_solver(spec['solver'])
     display = parse_display(spec['display']) if 'display' in spec else None
@@ -11,12 +11,17 @@ def main():
 
     parser.add_argument('--spec', type=str, default='spec.json',
                         help='the specification file')
+    parser.add_argument('--dtype', type=str,
+                        help='the floating point type of the model, float64 or float32')
 
     args = parser.parse_args()
 
     with open(args.spec, 'r') as f:
         spec = json.load(f)
 
+    if args.dtype is not None:
+        spec['model']['dtype'] = args.dtype
+
     model, assertion, solver, display = parse(spec)
     solver.solve(model, assertion, display)
 
@@ -0,0 +1,130 @@
+import numpy as np
+import json
+import ast
+
+from utils import read, read_array
+
+
+# layout of a binary model file:
+#   magic, header length (8 bytes little endian), json header,
+#   then the raw arrays, each starting at a multiple of ALIGN bytes
+MAGIC = b'SOCRATES'
+ALIGN = 64
+
+# keys of a layer spec holding arrays, the other keys are small values kept in the header
+ARRAY_KEYS = ['weights', 'bias', 'filters', 'kernel', 'h0', 'c0',
+    'gate_weights', 'candidate_weights', 'gate_bias', 'candidate_bias',
+    'filters1', 'bias1', 'filters2', 'bias2', 'filters3', 'bias3', 'filtersX', 'biasX']
+
+
+def get_array(layer, key):
+    # arrays of a loaded binary model are used directly, text ones are parsed
+    return read_array(layer[key])
+
+
+def get_value(layer, key):
+    value = layer[key]
+
+    if isinstance(value, str):
+        return ast.literal_eval(read(value))
+    else:
+        return value
+
+
+def align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def add_array(arrays, array):
+    # queue array to be written after the arrays already in arrays and
+    # return its header entry
+    offset = 0 if len(arrays) == 0 else align(arrays[-1][0] + arrays[-1][1].nbytes)
+    arrays.append((offset, array))
+
+    return {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+
+
+def save_file(path, header, arrays):
+    header = json.dumps(header).encode('utf-8')
+    start = align(len(MAGIC) + 8 + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+
+        for offset, array in arrays:
+            f.seek(start + offset)
+            f.write(array.tobytes())
+
+
+def load_header(path):
+    # return the json header of a binary file and the position of its first array
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+
+        if magic != MAGIC:
+            raise NameError('Not a binary file!')
+
+        size = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(size).decode('utf-8'))
+
+    return header, align(len(MAGIC) + 8 + size)
+
+
+def map_array(path, start, entry):
+    # read-only memmap of an array of the file, its pages are only read when used
+    # and are shared through the page cache by all processes mapping the same file
+    dtype, shape = np.dtype(entry['dtype']), tuple(entry['shape'])
+
+    if np.prod(shape) == 0:
+        return np.zeros(shape, dtype)
+    else:
+        return np.memmap(path, dtype, 'r', start + entry['offset'], shape)
+
+
+def save_model(path, spec, dtype=None):
+    # spec is the list of layer specs of a model, with text or array values;
+    # with dtype, the floating point arrays are stored with dtype, so a model
+    # cast to the same dtype keeps using the mapped file
+    header, arrays = [], []
+
+    for layer in spec:
+        entry = dict()
+
+        for key in layer:
+            if key in ARRAY_KEYS:
+                array = np.ascontiguousarray(get_array(layer, key))
+
+                if dtype is not None and array.dtype.kind == 'f':
+                    array = array.astype(dtype)
+
+                entry[key] = add_array(arrays, array)
+            elif key == 'type' or key == 'func':
+                entry[key] = layer[key]
+            else:
+                entry[key] = get_value(layer, key)
+
+        header.append(entry)
+
+    save_file(path, {'layers': header}, arrays)
+
+
+def load_model(path):
+    # return the list of layer specs of a binary model, the arrays are memmaps
+    header, start = load_header(path)
+
+    spec = []
+
+    for entry in header['layers']:
+        layer = dict()
+
+        for key in entry:
+            if key in ARRAY_KEYS:
+                layer[key] = map_array(path, start, entry[key])
+            else:
+                layer[key] = entry[key]
+
+        spec.append(layer)
+
+    return spec
@@ -0,0 +1,110 @@
+import hashlib
+import pickle
+import json
+import os
+
+
+# directory of the cached models, an empty SOCRATES_CACHE turns the cache off,
+# and the total size of the entries kept in it
+CACHE_DIR = os.environ.get('SOCRATES_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'socrates'))
+CACHE_SIZE = int(os.environ.get('SOCRATES_CACHE_SIZE', 2 ** 30))
+
+# version of the pickled classes, Model, the layers and the polys, bump it whenever
+# their attributes change so entries written by older code are never loaded
+FORMAT_VERSION = 4
+
+
+def get_files(value, files):
+    # the existing files named by the text values of a spec
+    if isinstance(value, dict):
+        for item in value.values():
+            get_files(item, files)
+    elif isinstance(value, list):
+        for item in value:
+            get_files(item, files)
+    elif isinstance(value, str) and os.path.isfile(value):
+        files.add(os.path.abspath(value))
+
+    return files
+
+
+def get_key(spec, *args):
+    # hash of the format version, the spec, the other arguments of the parse and
+    # the size and modification time of the files it reads, so a changed file is a new key
+    key = hashlib.sha256()
+
+    key.update(json.dumps([FORMAT_VERSION, spec, args], sort_keys=True, default=str).encode('utf-8'))
+
+    for file in sorted(get_files(spec, set())):
+        stat = os.stat(file)
+        key.update('{}:{}:{}'.format(file, stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+
+    return key.hexdigest()
+
+
+def get_entry(key):
+    return os.path.join(CACHE_DIR, key + '.pkl')
+
+
+def load_cached(key):
+    if not CACHE_DIR:
+        return None
+
+    entry = get_entry(key)
+
+    try:
+        with open(entry, 'rb') as f:
+            value = pickle.load(f)
+    except Exception:
+        # missing, or written by an older version of the code
+        return None
+
+    # the modification time of an entry is its last use
+    os.utime(entry)
+
+    return value
+
+
+def save_cached(key, value):
+    if not CACHE_DIR:
+        return
+
+    # only the user can write the entries which are unpickled
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+
+    entry = get_entry(key)
+    temp = '{}.{}.tmp'.format(entry, os.getpid())
+
+    # other processes parsing the same spec only see complete entries
+    with open(temp, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(temp, entry)
+
+    evict()
+
+
+def evict():
+    # remove the least recently used entries until the cache fits in CACHE_SIZE
+    entries = []
+
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.pkl'):
+            try:
+                stat = os.stat(os.path.join(CACHE_DIR, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+            except OSError:
+                continue
+
+    entries.sort(reverse=True)
+    total = 0
+
+    for _, size, name in entries:
+        total += size
+
+        if total > CACHE_SIZE:
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                continue
@@ -1,10 +1,17 @@
 import autograd.numpy as np
+import threading
+import weakref
 
 from solver.refinement_impl import Poly
 from utils import *
 from poly_utils import *
 
 
+# the reusable window buffers of the layers, one per layer in each thread, so the
+# threads of apply_many can share the layers; a buffer goes away with its layer
+_buffers = threading.local()
+
+
 class Layer:
     def apply(self, x):
         return x
@@ -12,6 +19,74 @@ class Layer:
     def reset(self):
         pass
 
+    def is_recurrent_layer(self):
+        return False
+
+    def has_backward(self):
+        return False
+
+    def apply_batch(self, x):
+        # apply to a batch of inputs, one per row of the leading axis
+        return self.apply(x)
+
+    def backward(self, x, output, g):
+        # vector-Jacobian product: the gradient of the input x of apply from its
+        # output and the gradient g of the output
+        raise NameError('Not support yet!')
+
+    def get_plan(self, kshape, xshape):
+        # gather indexes of the sliding windows, built once per padded input shape
+        key = tuple(xshape)
+
+        if key not in self.plans:
+            channel = xshape[0]
+
+            if len(kshape) == 1:
+                self.plans[key] = index1d(channel, self.stride, kshape[0], xshape[1])
+            elif len(kshape) == 2:
+                self.plans[key] = index2d(channel, self.stride, kshape, xshape[1:])
+            else:
+                self.plans[key] = index3d(channel, self.stride, kshape, xshape[1:])
+
+        return self.plans[key]
+
+    def get_buffer(self, shape, dtype):
+        # buffer for the windows of the inputs, only reallocated when their shape changes
+        buffers = getattr(_buffers, 'layers', None)
+
+        if buffers is None:
+            buffers = _buffers.layers = weakref.WeakKeyDictionary()
+
+        buffer = buffers.get(self)
+
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            buffers[self] = buffer
+
+        return buffer
+
+    def apply_filters(self, x_pad):
+        # the windows (n, *res, c, *kshape) of the input are copied into the buffer
+        # of the layer, and multiplied by the filters in one matmul
+        f_n, kshape = len(self.filters), self.filters.shape[2:]
+        k = len(kshape)
+
+        view = np.moveaxis(windows(x_pad, kshape, self.stride), 1, 1 + k)
+
+        cols = self.get_buffer(view.shape, x_pad.dtype)
+        cols[...] = view
+
+        res = cols.reshape(-1, self.filters[0].size) @ self.filters.reshape(f_n, -1).T
+        res = res.reshape(*view.shape[:1 + k], f_n)
+
+        return np.moveaxis(res, -1, 1) + self.bias.reshape(f_n, *[1] * k)
+
+    def cast(self, dtype):
+        # convert the floating point parameters of the layer to dtype
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray) and value.dtype.kind == 'f':
+                setattr(self, name, value.astype(dtype, copy=False))
+
     def copy(self):
         pass
 
@@ -29,114 +104,110 @@ class Function(Layer):
     def apply(self, x):
         return self.func(x)
 
-    def apply_poly(self, x_poly, lst_poly):
+    def apply_batch(self, x):
+        if self.name == 'reshape':
+            # the new shape is that of one input, the leading batch axis is kept
+            return np.reshape(x, (x.shape[0], *self.params[1:]))
+
+        return self.func(x)
+
+    def has_backward(self):
+        return self.name in ('relu', 'sigmoid', 'tanh', 'reshape', 'transpose')
+
+    def backward(self, x, output, g):
+        if self.name == 'reshape':
+            return g.reshape(x.shape)
+        elif self.name == 'transpose':
+            return np.transpose(g, np.argsort(self.params))
+        else:
+            return backward_func(self.func, output, g)
+
+    def apply_poly(self, x_poly, lst_poly, dtype):
         res = Poly()
 
         no_neurons = len(x_poly.lw)
 
-        res.lw = np.zeros(no_neurons)
-        res.up = np.zeros(no_neurons)
+        res.lw = np.zeros(no_neurons, dtype=dtype)
+        res.up = np.zeros(no_neurons, dtype=dtype)
 
-        res.le = np.zeros([no_neurons, no_neurons + 1])
-        res.ge = np.zeros([no_neurons, no_neurons + 1])
+        # each neuron only depends on the same neuron of x_poly, so le and ge keep
+        # the coefficient of that neuron and the constant
+        res.le = np.zeros([no_neurons, 2], dtype=dtype)
+        res.ge = np.zeros([no_neurons, 2], dtype=dtype)
 
         res.shape = x_poly.shape
         res.is_activation = True
 
+        lw, up = x_poly.lw, x_poly.up
+
         if self.name == 'relu':
-            for i in range(no_neurons):
-                if x_poly.up[i] <= 0:
-                    pass
-                elif x_poly.lw[i] >= 0:
-                    res.le[i,i] = 1
-                    res.ge[i,i] = 1
-
-                    res.lw[i] = x_poly.lw[i]
-                    res.up[i] = x_poly.up[i]
-                else:
-                    res.le[i,i] = x_poly.up[i] / (x_poly.up[i] - x_poly.lw[i])
-                    res.le[i,-1] = - x_poly.up[i] * x_poly.lw[i] / (x_poly.up[i] - x_poly.lw[i])
-
-                    lam = 0 if x_poly.up[i] <= -x_poly.lw[i] else 1
-
-                    res.ge[i,i] = lam
-                    res.lw[i] = 0 # it seems safe to set lw = 0 anyway
-                    # res.lw[i] = lam * x_poly.lw[i] # notice: mnist_relu_5_10.tf
-                    res.up[i] = x_poly.up[i]
-
-        elif self.name == 'sigmoid':
-            res.lw = sigmoid(x_poly.lw)
-            res.up = sigmoid(x_poly.up)
-
-            for i in range(no_neurons):
-                if x_poly.lw[i] == x_poly.up[i]:
-                    res.le[i][-1] = res.lw[i]
-                    res.ge[i][-1] = res.lw[i]
-                else:
-                    if x_poly.lw[i] > 0:
-                        lam1 = (res.up[i] - res.lw[i]) / (x_poly.up[i] - x_poly.lw[i])
-                        if x_poly.up[i] <= 0:
-                            lam2 = lam1
-                        else:
-                            ll = sigmoid(x_poly.lw[i]) * (1 - sigmoid(x_poly.lw[i]))
-                            uu = sigmoid(x_poly.up[i]) * (1 - sigmoid(x_poly.up[i]))
-                            lam2 = min(ll, uu)
-                    else:
-                        ll = sigmoid(x_poly.lw[i]) * (1 - sigmoid(x_poly.lw[i]))
-                        uu = sigmoid(x_poly.up[i]) * (1 - sigmoid(x_poly.up[i]))
-                        lam1 = min(ll, uu)
-                        if x_poly.up[i] <= 0:
-                            lam2 = (res.up[i] - res.lw[i]) / (x_poly.up[i] - x_poly.lw[i])
-                        else:
-                            lam2 = lam1
-
-                    res.ge[i,i] = lam1
-                    res.ge[i,-1] = res.lw[i] - lam1 * x_poly.lw[i]
-
-                    res.le[i,i] = lam2
-                    res.le[i,-1] = res.up[i] - lam2 * x_poly.up[i]
-
-        elif self.name == 'tanh':
-            res.lw = tanh(x_poly.lw)
-            res.up = tanh(x_poly.up)
-
-            for i in range(no_neurons):
-                if x_poly.lw[i] == x_poly.up[i]:
-                    res.le[i][-1] = res.lw[i]
-                    res.ge[i][-1] = res.lw[i]
-                else:
-                    if x_poly.lw[i] > 0:
-                        lam1 = (res.up[i] - res.lw[i]) / (x_poly.up[i] - x_poly.lw[i])
-                        if x_poly.up[i] <= 0:
-                            lam2 = lam1
-                        else:
-                            ll = 1 - pow(tanh(x_poly.lw[i]), 2)
-                            uu = 1 - pow(tanh(x_poly.up[i]), 2)
-                            lam2 = min(ll, uu)
-                    else:
-                        ll = 1 - pow(tanh(x_poly.lw[i]), 2)
-                        uu = 1 - pow(tanh(x_poly.up[i]), 2)
-                        lam1 = min(ll, uu)
-                        if x_poly.up[i] <= 0:
-                            lam2 = (res.up[i] - res.lw[i]) / (x_poly.up[i] - x_poly.lw[i])
-                        else:
-                            lam2 = lam1
-
-                    res.ge[i,i] = lam1
-                    res.ge[i,-1] = res.lw[i] - lam1 * x_poly.lw[i]
-
-                    res.le[i,i] = lam2
-                    res.le[i,-1] = res.up[i] - lam2 * x_poly.up[i]
-        
+            # the neurons with up <= 0 are always 0
+            active = (up > 0) & (lw >= 0)
+            unstable = (up > 0) & (lw < 0)
+
+            res.le[active, 0] = 1
+            res.ge[active, 0] = 1
+
+            res.lw[active] = lw[active]
+            res.up[active] = up[active]
+
+            lw_u, up_u = lw[unstable], up[unstable]
+
+            res.le[unstable, 0] = up_u / (up_u - lw_u)
+            res.le[unstable, -1] = - up_u * lw_u / (up_u - lw_u)
+
+            # the lower relation is 0 or the neuron itself, whichever loses less area
+            res.ge[unstable, 0] = np.where(up_u <= -lw_u, 0, 1)
+            res.lw[unstable] = 0 # it seems safe to set lw = 0 anyway
+            # res.lw[unstable] = res.ge[unstable, 0] * lw_u # notice: mnist_relu_5_10.tf
+            res.up[unstable] = up_u
+
+        elif self.name == 'sigmoid' or self.name == 'tanh':
+            res.lw = self.func(lw)
+            res.up = self.func(up)
+
+            flat = lw == up
+            curved = ~flat
+
+            res.le[flat, -1] = res.lw[flat]
+            res.ge[flat, -1] = res.lw[flat]
+
+            lw_c, up_c = lw[curved], up[curved]
+            f_lw, f_up = res.lw[curved], res.up[curved]
+
+            # slopes of the chord and of the least steep tangent at the bounds,
+            # the chord is below the function on the concave side lw > 0
+            # and above it on the convex side up <= 0
+            chord = (f_up - f_lw) / (up_c - lw_c)
+
+            if self.name == 'sigmoid':
+                tangent = np.minimum(f_lw * (1 - f_lw), f_up * (1 - f_up))
+            else:
+                # float_power calls the C pow, as pow(tanh(x), 2) did on scalars,
+                # the vectorized power and square round differently
+                tangent = np.minimum(1 - np.float_power(f_lw, 2), 1 - np.float_power(f_up, 2))
+
+            lam1 = np.where(lw_c > 0, chord, tangent)
+            lam2 = np.where(up_c <= 0, chord, tangent)
+
+            res.ge[curved, 0] = lam1
+            res.ge[curved, -1] = f_lw - lam1 * lw_c
+
+            res.le[curved, 0] = lam2
+            res.le[curved, -1] = f_up - lam2 * up_c
+
         elif self.name == 'reshape':
             res.lw = x_poly.lw.copy()
             res.up = x_poly.up.copy()
 
-            res.le = np.eye(no_neurons + 1)[:-1]
-            res.ge = np.eye(no_neurons + 1)[:-1]
+            res.le[:,0] = 1
+            res.ge[:,0] = 1
 
             res.shape = self.params[0]
 
+        if dtype != np.float64 and not self.is_poly_exact():
+            widen(res, x_poly, dtype)
+
         return res
 
     def is_poly_exact(self):
@@ -176,14 +247,18 @@ class Linear(Layer):
         else:
             return self.func(x @ self.weights + self.bias)
 
+    def has_backward(self):
+        return True
+
+    def backward(self, x, output, g):
+        return backward_func(self.func, output, g) @ self.weights.T
+
 
     def get_weight(self):
         return self.weights
 
 
-    def apply_poly(self, x_poly, lst_poly):
-        assert self.func == None, "self.func should be None"
-
+    def apply_poly(self, x_poly, lst_poly, dtype):
         weights = self.weights.transpose(1, 0)
         bias = self.bias.transpose(1, 0)
 
@@ -191,20 +266,48 @@ class Linear(Layer):
 
         res = Poly()
 
-        res.lw = np.zeros(no_neurons)
-        res.up = np.zeros(no_neurons)
+        res.lw = np.zeros(no_neurons, dtype=dtype)
+        res.up = np.zeros(no_neurons, dtype=dtype)
 
         res.le = np.concatenate([weights, bias], axis=1)
         res.ge = np.concatenate([weights, bias], axis=1)
 
         res.shape = (1, no_neurons)
 
-        res.back_substitute(lst_poly)
+        res.back_substitute(lst_poly, dtype)
+
+        if self.func != None:
+            res = self.__apply_func_poly(x_poly, res, dtype)
+
+        return res
+
+    def __apply_func_poly(self, x_poly, affine_poly, dtype):
+        # a fused activation is relaxed on the bounds of the affine output, then the
+        # affine output, which is exact, is substituted into the relaxation, so the
+        # poly still relates the outputs to x_poly
+        name = {relu: 'relu', sigmoid: 'sigmoid', tanh: 'tanh'}[self.func]
+        func_poly = Function(name, None).apply_poly(affine_poly, None, dtype)
+
+        res = Poly()
+
+        res.lw = func_poly.lw
+        res.up = func_poly.up
+
+        res.le = func_poly.le[:, :1] * affine_poly.le
+        res.le[:, -1] += func_poly.le[:, -1]
+
+        res.ge = func_poly.ge[:, :1] * affine_poly.ge
+        res.ge[:, -1] += func_poly.ge[:, -1]
+
+        res.shape = affine_poly.shape
+
+        if dtype != np.float64:
+            widen(res, x_poly, dtype)
 
         return res
 
     def is_poly_exact(self):
-        return True
+        return self.func == None
 
     def is_activaiton_layer(self):
         return False
@@ -226,19 +329,62 @@ class BasicRNN(Layer):
 
         self.func = get_func(name, None)
 
-    def apply(self, x):
-        x = np.concatenate((x, self.h_t), axis=1)
+    def init_state(self, n=1):
+        return (np.repeat(self.h_0, n, axis=0),)
+
+    def step(self, x, state, scale=None):
+        h_t, = state
+
+        x = np.concatenate((x, h_t), axis=1)
 
         if self.func == None:
-            self.h_t = x @ self.weights + self.bias
+            h_t = x @ self.weights + self.bias
         else:
-            self.h_t = self.func(x @ self.weights + self.bias)
+            h_t = self.func(x @ self.weights + self.bias)
+
+        if scale is not None:
+            h_t = h_t * scale
+
+        return h_t, (h_t,)
+
+    def apply_seq(self, xs, state=None, scale=None):
+        if state is None:
+            state = self.init_state(len(xs))
+
+        h_t, = state
+
+        # the input part of [x, h] @ weights does not depend on the recurrence,
+        # so it is computed for all timesteps at once
+        no_inputs = len(self.weights) - h_t.shape[1]
+        w_x, w_h = self.weights[:no_inputs], self.weights[no_inputs:]
+
+        xs_w = xs @ w_x + self.bias
+
+        hs = []
+        for t in range(xs.shape[1]):
+            h_t = xs_w[:, t] + h_t @ w_h
+
+            if self.func != None:
+                h_t = self.func(h_t)
+
+            if scale is not None:
+                h_t = h_t * scale
+
+            hs.append(h_t)
+
+        return np.stack(hs, axis=1), (h_t,)
+
+    def apply(self, x):
+        self.h_t, (self.h_t,) = self.step(x, (self.h_t,))
 
         return self.h_t
 
     def reset(self):
         self.h_t = self.h_0
 
+    def is_recurrent_layer(self):
+        return True
+
 
 class LSTM(Layer):
     def __init__(self, weights, bias, h0, c0):
@@ -251,15 +397,57 @@ class LSTM(Layer):
         self.h_t = h0.reshape(-1, h0.size)
         self.c_t = c0.reshape(-1, c0.size)
 
-    def apply(self, x):
-        x = np.concatenate((x, self.h_t), axis=1)
+    def init_state(self, n=1):
+        return np.repeat(self.h_0, n, axis=0), np.repeat(self.c_0, n, axis=0)
+
+    def step(self, x, state, scale=None):
+        h_t, c_t = state
+
+        x = np.concatenate((x, h_t), axis=1)
 
         gates = x @ self.weights + self.bias
 
         i, j, f, o = np.split(gates, 4, axis=1)
 
-        self.c_t = self.c_t * sigmoid(f) + sigmoid(i) * tanh(j)
-        self.h_t = sigmoid(o) * tanh(self.c_t)
+        c_t = c_t * sigmoid(f) + sigmoid(i) * tanh(j)
+        h_t = sigmoid(o) * tanh(c_t)
+
+        if scale is not None:
+            h_t = h_t * scale
+
+        return h_t, (h_t, c_t)
+
+    def apply_seq(self, xs, state=None, scale=None):
+        if state is None:
+            state = self.init_state(len(xs))
+
+        h_t, c_t = state
+
+        # the input part of [x, h] @ weights does not depend on the recurrence,
+        # so it is computed for all timesteps at once
+        no_inputs = len(self.weights) - h_t.shape[1]
+        w_x, w_h = self.weights[:no_inputs], self.weights[no_inputs:]
+
+        xs_w = xs @ w_x + self.bias
+
+        hs = []
+        for t in range(xs.shape[1]):
+            gates = xs_w[:, t] + h_t @ w_h
+
+            i, j, f, o = np.split(gates, 4, axis=1)
+
+            c_t = c_t * sigmoid(f) + sigmoid(i) * tanh(j)
+            h_t = sigmoid(o) * tanh(c_t)
+
+            if scale is not None:
+                h_t = h_t * scale
+
+            hs.append(h_t)
+
+        return np.stack(hs, axis=1), (h_t, c_t)
+
+    def apply(self, x):
+        self.h_t, (self.h_t, self.c_t) = self.step(x, (self.h_t, self.c_t))
 
         return self.h_t
 
@@ -267,6 +455,9 @@ class LSTM(Layer):
         self.h_t = self.h_0
         self.c_t = self.c_0
 
+    def is_recurrent_layer(self):
+        return True
+
     def get_weight(self):
         return self.weights
 
@@ -282,24 +473,73 @@ class GRU(Layer):
         self.h_0 = h0.reshape(-1, h0.size)
         self.h_t = h0.reshape(-1, h0.size)
 
-    def apply(self, x):
-        gx = np.concatenate((x, self.h_t), axis=1)
+    def init_state(self, n=1):
+        return (np.repeat(self.h_0, n, axis=0),)
+
+    def step(self, x, state, scale=None):
+        h_t, = state
+
+        gx = np.concatenate((x, h_t), axis=1)
 
         gates = sigmoid(gx @ self.gate_weights + self.gate_bias)
 
         r, u = np.split(gates, 2, axis=1)
-        r = r * self.h_t
+        r = r * h_t
 
         cx = np.concatenate((x, r), axis=1)
         c = tanh(cx @ self.candidate_weights + self.candidate_bias)
 
-        self.h_t = (1 - u) * c + u * self.h_t
+        h_t = (1 - u) * c + u * h_t
+
+        if scale is not None:
+            h_t = h_t * scale
+
+        return h_t, (h_t,)
+
+    def apply_seq(self, xs, state=None, scale=None):
+        if state is None:
+            state = self.init_state(len(xs))
+
+        h_t, = state
+
+        # the input parts of [x, h] @ gate_weights and [x, r] @ candidate_weights
+        # do not depend on the recurrence, so they are computed for all timesteps at once
+        no_inputs = len(self.gate_weights) - h_t.shape[1]
+        gw_x, gw_h = self.gate_weights[:no_inputs], self.gate_weights[no_inputs:]
+        cw_x, cw_r = self.candidate_weights[:no_inputs], self.candidate_weights[no_inputs:]
+
+        xs_gw = xs @ gw_x + self.gate_bias
+        xs_cw = xs @ cw_x + self.candidate_bias
+
+        hs = []
+        for t in range(xs.shape[1]):
+            gates = sigmoid(xs_gw[:, t] + h_t @ gw_h)
+
+            r, u = np.split(gates, 2, axis=1)
+            r = r * h_t
+
+            c = tanh(xs_cw[:, t] + r @ cw_r)
+
+            h_t = (1 - u) * c + u * h_t
+
+            if scale is not None:
+                h_t = h_t * scale
+
+            hs.append(h_t)
+
+        return np.stack(hs, axis=1), (h_t,)
+
+    def apply(self, x):
+        self.h_t, (self.h_t,) = self.step(x, (self.h_t,))
 
         return self.h_t
 
     def reset(self):
         self.h_t = self.h_0
 
+    def is_recurrent_layer(self):
+        return True
+
 
 class Conv1d(Layer):
     def __init__(self, filters, bias, stride, padding):
@@ -308,29 +548,42 @@ class Conv1d(Layer):
         self.stride = stride
         self.padding = padding
 
+        self.plans = dict()
+
     def apply(self, x):
         f_n, f_c, f_l = self.filters.shape # 2, 3, 4
-        f = self.filters.reshape(f_n, -1)  # 2, 12
-
-        b = self.bias.reshape(f_n, -1)  # 2, 1
 
         p = self.padding
-        x_pad = np.pad(x, ((0,0), (0,0), (p,p)), mode='constant')
+        x_pad = x if p == 0 else np.pad(x, ((0,0), (0,0), (p,p)), mode='constant')
         x_n, x_c, x_l = x_pad.shape  # 1, 3, 10
 
         res_l = int((x_l - f_l) / self.stride) + 1
         size = f_c * f_l
 
-        c_idx, l_idx = index1d(x_c, self.stride, (f_l), (x_l))
+        if isinstance(x_pad, np.ndarray):
+            # the windows go through the buffer of the layer, no gather needed
+            return self.apply_filters(x_pad) # n, 2, 10
+
+        # autograd traced inputs use the cached gather plan
+        f = self.filters.reshape(f_n, -1)  # 2, 12
+        b = self.bias.reshape(f_n, -1)  # 2, 1
 
-        res = x_pad[:, c_idx, l_idx] # 1, 12, 10
-        res = res.reshape(size, -1) # 12, 10
+        c_idx, l_idx = self.get_plan((f_l,), x_pad.shape[1:])
 
-        res = f @ res + b # 2, 10
-        res = res.reshape(1, f_n, res_l) # 1, 2, 10
+        res = x_pad[:, c_idx, l_idx] # n, 12, 10
+        res = res.reshape(x_n, size, -1) # n, 12, 10
+
+        res = f @ res + b # n, 2, 10
+        res = res.reshape(x_n, f_n, res_l) # n, 2, 10
 
         return res
 
+    def has_backward(self):
+        return True
+
+    def backward(self, x, output, g):
+        return conv_backward(self.filters, self.stride, self.padding, x, g)
+
 
 class Conv2d(Layer):
     def __init__(self, filters, bias, stride, padding):
@@ -339,92 +592,84 @@ class Conv2d(Layer):
         self.stride = stride
         self.padding = padding
 
+        self.plans = dict()
+
     def apply(self, x):
         f_n, f_c, f_h, f_w = self.filters.shape
-        f = self.filters.reshape(f_n, -1)
-
-        b = self.bias.reshape(f_n, -1)
 
         p = self.padding
-        x_pad = np.pad(x, ((0,0), (0,0), (p,p), (p,p)), mode='constant')
+        x_pad = x if p == 0 else np.pad(x, ((0,0), (0,0), (p,p), (p,p)), mode='constant')
         x_n, x_c, x_h, x_w = x_pad.shape
 
         res_h = int((x_h - f_h) / self.stride) + 1
         res_w = int((x_w - f_w) / self.stride) + 1
         size = f_c * f_h * f_w
 
-        c_idx, h_idx, w_idx = index2d(x_c, self.stride, (f_h, f_w), (x_h, x_w))
+        if isinstance(x_pad, np.ndarray):
+            # the windows go through the buffer of the layer, no gather needed
+            return self.apply_filters(x_pad)
+
+        # autograd traced inputs use the cached gather plan
+        f = self.filters.reshape(f_n, -1)
+        b = self.bias.reshape(f_n, -1)
+
+        c_idx, h_idx, w_idx = self.get_plan((f_h, f_w), x_pad.shape[1:])
 
         res = x_pad[:, c_idx, h_idx, w_idx]
-        res = res.reshape(size, -1)
+        res = res.reshape(x_n, size, -1)
 
         res = f @ res + b
-        res = res.reshape(1, f_n, res_h, res_w)
+        res = res.reshape(x_n, f_n, res_h, res_w)
 
         return res
 
-    def apply_poly(self, x_poly, lst_poly):
+    def has_backward(self):
+        return True
+
+    def backward(self, x, output, g):
+        return conv_backward(self.filters, self.stride, self.padding, x, g)
+
+    def apply_poly(self, x_poly, lst_poly, dtype):
+        from scipy.sparse import csr_matrix
+
         res = Poly()
 
         f_n, f_c, f_h, f_w = self.filters.shape
         x_n, x_c, x_h, x_w = x_poly.shape
 
-        x_w += 2 * self.padding
-        x_h += 2 * self.padding        
+        p = self.padding
 
-        res_h = int((x_h - f_h) / self.stride) + 1
-        res_w = int((x_w - f_w) / self.stride) + 1
+        res_h = int((x_h + 2 * p - f_h) / self.stride) + 1
+        res_w = int((x_w + 2 * p - f_w) / self.stride) + 1
 
-        len_pad = x_c * x_h * x_w
+        len_in = x_c * x_h * x_w
         len_res = f_n * res_h * res_w
 
-        res.lw = np.zeros(len_res)
-        res.up = np.zeros(len_res)
-
-        res.le = np.zeros([len_res, len_pad + 1])
-        res.ge = np.zeros([len_res, len_pad + 1])
-
         res.shape = (1, f_n, res_h, res_w)
 
-        for i in range(f_n):
-            base = np.zeros([x_c, x_h, x_w])
-            base[:f_c, :f_h, :f_w] = self.filters[i]
-            base = np.reshape(base, -1)
-            w_idx = f_w
+        # le and ge are sparse, one row per output with the weights of the filter on
+        # the inputs it reads, the padding is left out, and the bias
+        f_idx, o_h, o_w, c_idx, k_h, k_w = np.ix_(range(f_n), range(res_h), range(res_w),
+            range(f_c), range(f_h), range(f_w))
 
-            for j in range(res_h * res_w):
-                res.le[i * res_h * res_w + j] = np.append(base, [self.bias[i]])
-                res.ge[i * res_h * res_w + j] = np.append(base, [self.bias[i]])
+        h_idx = o_h * self.stride + k_h - p
+        w_idx = o_w * self.stride + k_w - p
 
-                if w_idx + self.stride <= x_w:
-                    base = np.roll(base, self.stride)
-                    w_idx += self.stride
-                else:
-                    base = np.roll(base, self.stride * x_w - w_idx + f_w)
-                    w_idx = f_w
+        valid = (h_idx >= 0) & (h_idx < x_h) & (w_idx >= 0) & (w_idx < x_w)
+        valid = np.broadcast_to(valid, (f_n, res_h, res_w, f_c, f_h, f_w))
 
-        del_idx = []
-        if self.padding > 0:
-            del_idx = del_idx + list(range(self.padding * (x_w + 1)))
-            mx = x_h - self.padding
-            for i in range(self.padding + 1, mx):
-                tmp = i * x_w
-                del_idx = del_idx + list(range(tmp - self.padding, tmp + self.padding))
-            del_idx = del_idx + list(range(mx * x_w - self.padding, x_h * x_w))
+        rows = np.broadcast_to((f_idx * res_h + o_h) * res_w + o_w, valid.shape)[valid]
+        cols = np.broadcast_to((c_idx * x_h + h_idx) * x_w + w_idx, valid.shape)[valid]
+        vals = np.broadcast_to(self.filters[f_idx, c_idx, k_h, k_w], valid.shape)[valid]
 
-            tmp = np.array(del_idx)
+        rows = np.concatenate([rows, np.arange(len_res)])
+        cols = np.concatenate([cols, np.full(len_res, len_in)])
+        vals = np.concatenate([vals, np.repeat(self.bias, res_h * res_w)])
 
-            for i in range(1, x_c):
-                offset = i * x_h * x_w
-                del_idx = del_idx + list((tmp + offset).copy())
+        res.le = csr_matrix((vals.astype(dtype), (rows, cols)), shape=(len_res, len_in + 1))
+        res.ge = res.le.copy()
 
-        res.le = np.delete(res.le, del_idx, 1)
-        res.ge = np.delete(res.ge, del_idx, 1)
-
-        res.le = np.ascontiguousarray(res.le)
-        res.ge = np.ascontiguousarray(res.ge)
-
-        res.back_substitute(lst_poly)
+        res.back_substitute(lst_poly, dtype)
 
         return res
 
@@ -439,14 +684,13 @@ class Conv3d(Layer):
         self.stride = stride
         self.padding = padding
 
+        self.plans = dict()
+
     def apply(self, x):
         f_n, f_c, f_d, f_h, f_w = self.filters.shape
-        f = self.filters.reshape(f_n, -1)
-
-        b = self.bias.reshape(f_n, -1)
 
         p = self.padding
-        x_pad = np.pad(x, ((0,0), (0,0), (p,p), (p,p), (p,p)), mode='constant')
+        x_pad = x if p == 0 else np.pad(x, ((0,0), (0,0), (p,p), (p,p), (p,p)), mode='constant')
         x_n, x_c, x_d, x_h, x_w = x_pad.shape
 
         res_d = int((x_d - f_d) / self.stride) + 1
@@ -454,16 +698,30 @@ class Conv3d(Layer):
         res_w = int((x_w - f_w) / self.stride) + 1
         size = f_c * f_d * f_h * f_w
 
-        c_idx, d_idx, h_idx, w_idx = index3d(x_c, self.stride, (f_d, f_h, f_w), (x_d, x_h, x_w))
+        if isinstance(x_pad, np.ndarray):
+            # the windows go through the buffer of the layer, no gather needed
+            return self.apply_filters(x_pad)
+
+        # autograd traced inputs use the cached gather plan
+        f = self.filters.reshape(f_n, -1)
+        b = self.bias.reshape(f_n, -1)
+
+        c_idx, d_idx, h_idx, w_idx = self.get_plan((f_d, f_h, f_w), x_pad.shape[1:])
 
         res = x_pad[:, c_idx, d_idx, h_idx, w_idx]
-        res = res.reshape(size, -1)
+        res = res.reshape(x_n, size, -1)
 
         res = f @ res + b
-        res = res.reshape(1, f_n, res_d, res_h, res_w)
+        res = res.reshape(x_n, f_n, res_d, res_h, res_w)
 
         return res
 
+    def has_backward(self):
+        return True
+
+    def backward(self, x, output, g):
+        return conv_backward(self.filters, self.stride, self.padding, x, g)
+
 
 class MaxPool1d(Layer):
     def __init__(self, kernel, stride, padding):
@@ -471,25 +729,38 @@ class MaxPool1d(Layer):
         self.stride = stride
         self.padding = padding
 
+        self.plans = dict()
+
     def apply(self, x):
         k_l = self.kernel
 
         p = self.padding
-        x_pad = np.pad(x, ((0,0), (0,0), (p,p)), mode='constant')
+        x_pad = x if p == 0 else np.pad(x, ((0,0), (0,0), (p,p)), mode='constant')
         x_n, x_c, x_l = x_pad.shape
 
         res_l = int((x_l - k_l) / self.stride) + 1
 
-        c_idx, l_idx = index1d(x_c, self.stride, self.kernel, (x_l))
+        if isinstance(x_pad, np.ndarray):
+            # reduce over the strided window view directly, no gather needed
+            return np.max(windows(x_pad, (k_l,), self.stride), axis=3)
+
+        # autograd traced inputs use the cached gather plan
+        c_idx, l_idx = self.get_plan((k_l,), x_pad.shape[1:])
 
         res = x_pad[:, c_idx, l_idx]
-        res = res.reshape(x_c, k_l, -1)
+        res = res.reshape(x_n, x_c, k_l, -1)
 
-        res = np.max(res, axis=1)
-        res = res.reshape(1, x_c, res_l)
+        res = np.max(res, axis=2)
+        res = res.reshape(x_n, x_c, res_l)
 
         return res
 
+    def has_backward(self):
+        return True
+
+    def backward(self, x, output, g):
+        return pool_backward(self.kernel, self.stride, self.padding, x, output, g)
+
 
 class MaxPool2d(Layer):
     def __init__(self, kernel, stride, padding):
@@ -497,28 +768,43 @@ class MaxPool2d(Layer):
         self.stride = stride
         self.padding = padding
 
+        self.plans = dict()
+
     def apply(self, x):
         k_h, k_w = self.kernel
 
         p = self.padding
-        x_pad = np.pad(x, ((0,0), (0,0), (p,p), (p,p)), mode='constant')
+        x_pad = x if p == 0 else np.pad(x, ((0,0), (0,0), (p,p), (p,p)), mode='constant')
         x_n, x_c, x_h, x_w = x_pad.shape
 
         res_h = int((x_h - k_h) / self.stride) + 1
         res_w = int((x_w - k_w) / self.stride) + 1
 
-        c_idx, h_idx, w_idx = index2d(x_c, self.stride, self.kernel, (x_h, x_w))
+        if isinstance(x_pad, np.ndarray):
+            # reduce over the strided window view directly, no gather needed
+            return np.max(windows(x_pad, (k_h, k_w), self.stride), axis=(4, 5))
+
+        # autograd traced inputs use the cached gather plan
+        c_idx, h_idx, w_idx = self.get_plan((k_h, k_w), x_pad.shape[1:])
 
         res = x_pad[:, c_idx, h_idx, w_idx]
 
-        res = res.reshape(x_c, k_h * k_w, -1)
+        res = res.reshape(x_n, x_c, k_h * k_w, -1)
 
-        res = np.max(res, axis=1)
-        res = res.reshape(1, x_c, res_h, res_w)
+        res = np.max(res, axis=2)
+        res = res.reshape(x_n, x_c, res_h, res_w)
 
         return res
 
-    def apply_poly(self, x_poly, lst_poly):
+    def has_backward(self):
+        return True
+
+    def backward(self, x, output, g):
+        return pool_backward(self.kernel, self.stride, self.padding, x, output, g)
+
+    def apply_poly(self, x_poly, lst_poly, dtype):
+        from scipy.sparse import csr_matrix
+
         res = Poly()
 
         k_h, k_w = self.kernel
@@ -536,86 +822,50 @@ class MaxPool2d(Layer):
         res_h = int((x_h - k_h) / self.stride) + 1
         res_w = int((x_w - k_w) / self.stride) + 1
 
-        len_pad = x_c * x_h * x_w
         len_res = x_c * res_h * res_w
 
-        c_idx, h_idx, w_idx = index2d(x_c, self.stride, self.kernel, (x_h, x_w))
-
-        res_lw, res_up = [], []
-        mx_lw_idx_lst, mx_up_idx_lst = [], []
+        c_idx, h_idx, w_idx = self.get_plan((k_h, k_w), lw_pad.shape[1:])
 
-        for c in range(x_c):
-            for i in range(res_h * res_w):
+        # the windows of all channels at once, (x_c, k_h * k_w, res_h * res_w)
+        win_lw = lw_pad[0, c_idx, h_idx, w_idx].reshape(x_c, k_h * k_w, -1)
+        win_up = up_pad[0, c_idx, h_idx, w_idx].reshape(x_c, k_h * k_w, -1)
 
-                mx_lw_val, mx_lw_idx = -1e9, None
-                
-                for k in range(k_h * k_w):
+        # the first input with the greatest lower bound is a lower relation of the
+        # max, and an upper relation too when no other input can be greater
+        mx_idx = np.argmax(win_lw, axis=1)[:, np.newaxis]
 
-                    h, w = h_idx[k, i], w_idx[k, i]
-                    val = lw_pad[0, c, h, w]
-                    
-                    if val > mx_lw_val:
-                        mx_lw_val, mx_lw_idx = val, (c, h, w)
+        mx_lw = np.take_along_axis(win_lw, mx_idx, axis=1)
+        mx_up = np.take_along_axis(win_up, mx_idx, axis=1)
 
-                mx_up_val, cnt = -1e9, 0
+        cnt = np.sum(win_up > mx_lw, axis=1) - (mx_up > mx_lw)[:, 0]
 
-                for k in range(k_h * k_w):
-
-                    h, w = h_idx[k, i], w_idx[k, i]
-                    val = up_pad[0, c, h, w]
-
-                    if val > mx_up_val:
-                        mx_up_val = val
-
-                    if mx_lw_idx != (c, h, w) and val > mx_lw_val:
-                        cnt += 1
-
-                res_lw.append(mx_lw_val)
-                res_up.append(mx_up_val)
-
-                mx_lw_idx_lst.append(mx_lw_idx)
-                if cnt > 0: mx_up_idx_lst.append(None)
-                else: mx_up_idx_lst.append(mx_lw_idx)
-
-
-        res.lw = np.array(res_lw)
-        res.up = np.array(res_up)
-
-        res.le = np.zeros([len_res, len_pad + 1])
-        res.ge = np.zeros([len_res, len_pad + 1])
+        res.lw = mx_lw.reshape(-1).astype(dtype)
+        res.up = np.max(win_up, axis=1).reshape(-1).astype(dtype)
 
         res.shape = (1, x_c, res_h, res_w)
 
-        for i in range(len_res):
-            c = mx_lw_idx_lst[i][0]
-            h = mx_lw_idx_lst[i][1]
-            w = mx_lw_idx_lst[i][2]
+        # le and ge are sparse with at most one input per row, the padding is left out
+        h = np.take_along_axis(h_idx.reshape(x_c, k_h * k_w, -1), mx_idx, axis=1).reshape(-1) - p
+        w = np.take_along_axis(w_idx.reshape(x_c, k_h * k_w, -1), mx_idx, axis=1).reshape(-1) - p
+        c = np.repeat(np.arange(x_c), res_h * res_w)
 
-            idx = c * x_h * x_w + h * x_w + w
-            res.ge[i, idx] = 1
+        x_h, x_w = x_h - 2 * p, x_w - 2 * p
+        len_in = x_c * x_h * x_w
 
-            if mx_up_idx_lst[i] is None:
-                res.le[i, -1] = res.up[i]
-            else:
-                res.le[i, idx] = 1 
+        valid = (h >= 0) & (h < x_h) & (w >= 0) & (w < x_w)
+        exact = cnt.reshape(-1) == 0
 
-        del_idx = []
-        if self.padding > 0:
-            del_idx = del_idx + list(range(self.padding * (x_w + 1)))
-            mx = x_h - self.padding
-            for i in range(self.padding + 1, mx):
-                tmp = i * x_w
-                del_idx = del_idx + list(range(tmp - self.padding, tmp + self.padding))
-            del_idx = del_idx + list(range(mx * x_h - self.padding, x_h * x_w))
+        rows = np.arange(len_res)
+        cols = (c * x_h + h) * x_w + w
 
-            tmp = np.array(del_idx)
+        res.ge = csr_matrix((np.ones(np.sum(valid), dtype=dtype), (rows[valid], cols[valid])),
+            shape=(len_res, len_in + 1))
 
-            for i in range(1, x_c):
-                offset = i * x_h * x_w
-                del_idx = del_idx + list((tmp + offset).copy())
+        le_vals = np.concatenate([np.ones(np.sum(exact & valid), dtype=dtype), res.up[~exact]])
+        le_rows = np.concatenate([rows[exact & valid], rows[~exact]])
+        le_cols = np.concatenate([cols[exact & valid], np.full(np.sum(~exact), len_in)])
 
-        res.le = np.delete(res.le, del_idx, 1)
-        res.ge = np.delete(res.ge, del_idx, 1)
+        res.le = csr_matrix((le_vals, (le_rows, le_cols)), shape=(len_res, len_in + 1))
 
         return res
 
@@ -630,27 +880,40 @@ class MaxPool3d(Layer):
         self.stride = stride
         self.padding = padding
 
+        self.plans = dict()
+
     def apply(self, x):
         k_d, k_h, k_w = self.kernel
 
         p = self.padding
-        x_pad = np.pad(x, ((0,0), (0,0), (p,p), (p,p), (p,p)), mode='constant')
+        x_pad = x if p == 0 else np.pad(x, ((0,0), (0,0), (p,p), (p,p), (p,p)), mode='constant')
         x_n, x_c, x_d, x_h, x_w = x_pad.shape
 
         res_d = int((x_d - k_d) / self.stride) + 1
         res_h = int((x_h - k_h) / self.stride) + 1
         res_w = int((x_w - k_w) / self.stride) + 1
 
-        c_idx, d_idx, h_idx, w_idx = index3d(x_c, self.stride, self.kernel, (x_d, x_h, x_w))
+        if isinstance(x_pad, np.ndarray):
+            # reduce over the strided window view directly, no gather needed
+            return np.max(windows(x_pad, (k_d, k_h, k_w), self.stride), axis=(5, 6, 7))
+
+        # autograd traced inputs use the cached gather plan
+        c_idx, d_idx, h_idx, w_idx = self.get_plan((k_d, k_h, k_w), x_pad.shape[1:])
 
         res = x_pad[:, c_idx, d_idx, h_idx, w_idx]
-        res = res.reshape(x_c, k_d * k_h * k_w, -1)
+        res = res.reshape(x_n, x_c, k_d * k_h * k_w, -1)
 
-        res = np.max(res, axis=1)
-        res = res.reshape(1, x_c, res_d, res_h, res_w)
+        res = np.max(res, axis=2)
+        res = res.reshape(x_n, x_c, res_d, res_h, res_w)
 
         return res
 
+    def has_backward(self):
+        return True
+
+    def backward(self, x, output, g):
+        return pool_backward(self.kernel, self.stride, self.padding, x, output, g)
+
 
 class ResNet2l(Layer):
     def __init__(self, filters1, bias1, stride1, padding1,
@@ -761,3 +1024,34 @@ class ResNet3l(Layer):
         res = res + x
 
         return res
+
+
+def conv_backward(filters, stride, padding, x, g):
+    # gradient of the input x of a convolution from the gradient g of its output,
+    # accumulated for each offset in the filters over the windows at that offset
+    p = padding
+    g_pad = np.zeros((*x.shape[:2], *[size + 2 * p for size in x.shape[2:]]), dtype=g.dtype)
+
+    for offset, idx in window_slices(g.shape[2:], filters.shape[2:], stride):
+        f = filters[(slice(None), slice(None), *offset)]
+        g_pad[idx] += np.moveaxis(np.tensordot(g, f, axes=([1], [0])), -1, 1)
+
+    return g_pad[(slice(None), slice(None), *[slice(p, p + size) for size in x.shape[2:]])]
+
+
+def pool_backward(kernel, stride, padding, x, output, g):
+    # gradient of the input x of a max pooling, split between the maximums of a window
+    p = padding
+    x_pad = x if p == 0 else np.pad(x, ((0,0), (0,0), *[(p,p)] * (x.ndim - 2)), mode='constant')
+
+    slices = list(window_slices(g.shape[2:], [int(k) for k in np.reshape(kernel, -1)], stride))
+
+    count = np.zeros(output.shape)
+    for _, idx in slices:
+        count += x_pad[idx] == output
+
+    g_pad = np.zeros(x_pad.shape, dtype=g.dtype)
+    for _, idx in slices:
+        g_pad[idx] += g * (x_pad[idx] == output) / count
+
+    return g_pad[(slice(None), slice(None), *[slice(p, p + size) for size in x.shape[2:]])]
@@ -0,0 +1,65 @@
+import numpy as np
+import hashlib
+
+from collections import OrderedDict
+
+
+class Memo:
+    # outputs of a model for the inputs it has seen, keyed by a digest of the
+    # bytes, shape and dtype of the input, and bounded by the number of entries
+    # and the bytes of the inputs and outputs kept, least recently used first out
+    def __init__(self, size=1024, budget=2 ** 27):
+        self.size = size
+        self.budget = budget
+
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def get_key(self, x):
+        digest = hashlib.blake2b(np.ascontiguousarray(x).data, digest_size=16).digest()
+        return digest, x.shape, x.dtype.str
+
+
+    def apply(self, func, x):
+        # func(x), computed once while x stays in the memo; the output is shared,
+        # so the callers must not change it
+        if self.size <= 0 or not isinstance(x, np.ndarray):
+            return func(x)
+
+        key = self.get_key(x)
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+        self.misses += 1
+        output = func(x)
+
+        nbytes = x.nbytes + np.asarray(output).nbytes
+
+        if nbytes <= self.budget:
+            self.entries[key] = (output, nbytes)
+            self.nbytes += nbytes
+
+            while len(self.entries) > self.size or self.nbytes > self.budget:
+                _, (_, old_nbytes) = self.entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+
+        return output
+
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0.0
+
+        return self.hits, self.misses, rate
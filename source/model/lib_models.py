@@ -1,15 +1,42 @@
 import autograd.numpy as np
-# import torch
+import os
+
+import autograd
+
+from concurrent.futures import ThreadPoolExecutor
+from model.lib_torch import TorchModel
+from model.lib_memo import Memo
+
+
+# threads of apply_many when the spec sets none: numpy already runs the matmuls
+# on several BLAS threads, a few shards are enough to overlap the rest of the work
+NO_THREADS = min(4, os.cpu_count() or 1)
+
 
 class Model:
-    def __init__(self, shape, lower, upper, layers, path):
+    def __init__(self, shape, lower, upper, layers, path, threads=None):
         self.shape = shape
         self.lower = lower
         self.upper = upper
         self.layers = layers
+        self.layer_map = None
+        self.memo = Memo()
+        self.dtype = np.float64
+
+        # the pool of apply_many, started on its first use
+        self.threads = threads
+        self.executor, self.no_workers = None, 0
 
         if layers == None and path != None:
-            self.ptmodel = torch.load(path)
+            self.ptmodel = TorchModel(path, shape, threads)
+
+
+    def __getstate__(self):
+        # the pool is not pickled with the model, the copy starts its own
+        state = self.__dict__.copy()
+        state['executor'], state['no_workers'] = None, 0
+
+        return state
 
 
     def copy(self):
@@ -28,24 +55,91 @@ class Model:
                 new_model.layers.append(layer.copy())
             new_model.ptmodel = None
 
+        new_model.layer_map = None if self.layer_map is None else self.layer_map.copy()
+        new_model.memo = Memo(self.memo.size, self.memo.budget)
+        new_model.dtype = self.dtype
+        new_model.threads = self.threads
+
         return new_model
 
 
-    def __apply_ptmodel(self, x):
-        x = torch.from_numpy(x).view(self.shape.tolist())
+    def get_layer_idx(self, idx):
+        # index in layers of the layer idx of the spec, which changes after optimize_model
+        if self.layer_map is None:
+            return idx
 
-        with torch.no_grad():
-            output = self.ptmodel(x)
+        if self.layer_map[idx] is None:
+            # the output of the layer is folded into the next layer
+            raise NameError('Not support yet!')
 
-        output = output.numpy()
+        if idx >= 0 and self.layer_map[idx] < 0:
+            # a no-op layer before the first layer, its output is the input
+            raise NameError('Not support yet!')
+
+        return self.layer_map[idx]
+
+
+    def get_layer_idxs(self, idxs):
+        # get_layer_idx of several layers of the spec, which must not collapse
+        # into the same layer, e.g. a layer and a no-op reshape after it
+        layer_idxs = [self.get_layer_idx(idx) for idx in idxs]
+
+        if len(set(layer_idxs)) < len(set(idxs)):
+            raise NameError('Not support yet!')
+
+        return layer_idxs
+
+
+    def get_spec_layer_idx(self, idx):
+        # index in the spec of the layer idx of layers, the first spec layer with
+        # its output, the spec layers after it with the same output are no-op layers
+        if self.layer_map is None:
+            return idx
+
+        return min(k for k, v in self.layer_map.items() if v == idx)
 
-        return output
+
+    def cast(self, dtype):
+        # run the layers and build the polys with dtype, e.g. np.float32
+        self.dtype = dtype
+        self.memo.clear()
+
+        if self.layers != None:
+            for layer in self.layers:
+                layer.cast(dtype)
+
+
+    def build_plans(self):
+        # trace the model once with autograd, so the conv and pool layers build
+        # the window plans of the slow path now, e.g. before the model is cached
+        if self.layers == None or self.is_recurrent():
+            return
+
+        autograd.make_vjp(self.apply_batch)(self.lower.reshape(1, -1))
+
+
+    def __to_dtype(self, x):
+        # plain arrays follow the dtype of the layers, autograd boxes are kept
+        return x.astype(self.dtype, copy=False) if isinstance(x, np.ndarray) else x
+
+
+    def __apply_ptmodel(self, x):
+        # x is one flattened input or a batch of them, one per row
+        size_i = np.prod(self.shape[1:])
+
+        return self.ptmodel.apply(x.reshape(-1, size_i))
 
 
     def apply(self, x, y=None):
         if self.layers == None:
             return self.__apply_ptmodel(x)
 
+        x = self.__to_dtype(x)
+
+        if self.is_recurrent():
+            output, _ = self.__apply_seq(x.reshape(1, -1))
+            return output if y is None else output[0, y]
+
         shape_i = [1, *self.shape[1:]]
         size_i = np.prod(shape_i)
 
@@ -66,6 +160,210 @@ class Model:
             return output[0, y]
 
 
+    def apply_memo(self, x):
+        # same as apply, the outputs of the inputs seen before are taken from the memo
+        return self.memo.apply(self.apply, x)
+
+
+    def apply_batch(self, xs):
+        if self.layers == None:
+            return self.__apply_ptmodel(xs)
+
+        xs = self.__to_dtype(xs)
+
+        if self.is_recurrent():
+            output, _ = self.__apply_seq(xs)
+            return output
+
+        shape_i = [len(xs), *self.shape[1:]]
+        output = xs.reshape(shape_i)
+
+        for layer in self.layers:
+            output = layer.apply_batch(output)
+
+        return output
+
+
+    def value_and_grad(self, x, loss, with_output=False):
+        # loss(output) for one flattened input or a batch of them, one per row,
+        # and its gradient for x: the layers are run forward keeping their inputs
+        # and outputs, then their backward are chained from the gradient of loss
+        # for the output; models with other layers are differentiated by autograd;
+        # with_output, the output of the model is returned too
+        if self.layers == None:
+            raise NameError('Not support yet!')
+
+        xs = x.reshape(1, -1) if x.ndim == 1 else x
+
+        if self.is_recurrent() or not all(layer.has_backward() for layer in self.layers):
+            vjp, output = autograd.make_vjp(self.apply_batch)(xs)
+            value, g = autograd.value_and_grad(loss)(output)
+            g = vjp(g)
+        else:
+            outputs = [self.__to_dtype(xs).reshape(len(xs), *self.shape[1:])]
+
+            for layer in self.layers:
+                outputs.append(layer.apply_batch(outputs[-1]))
+
+            output = outputs[-1]
+            value, g = autograd.value_and_grad(loss)(output)
+
+            for i in range(len(self.layers) - 1, -1, -1):
+                g = self.layers[i].backward(outputs[i], outputs[i + 1], g)
+
+        g = g.reshape(x.shape).astype(x.dtype, copy=False)
+
+        if with_output:
+            return value, g, output
+        else:
+            return value, g
+
+
+    def get_executor(self, no_threads):
+        # one pool per model, reused by every apply_many, and only replaced
+        # when more threads are asked for
+        if self.no_workers < no_threads:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+
+            self.executor = ThreadPoolExecutor(max_workers=no_threads)
+            self.no_workers = no_threads
+
+        return self.executor
+
+
+    def apply_many(self, xs, func=None, no_threads=None):
+        # split a batch of inputs into shards run by func (apply_batch by default)
+        # on the pool of the model; the layers are only read so all threads share
+        # them, and numpy releases the gil in the matmuls and gathers; the number
+        # of threads is the threads of the spec, or NO_THREADS
+        func = self.apply_batch if func is None else func
+
+        if no_threads is None:
+            no_threads = NO_THREADS if self.threads is None else self.threads
+
+        no_shards = min(no_threads, len(xs))
+
+        if no_shards <= 1:
+            return func(xs)
+
+        executor = self.get_executor(no_shards)
+        outputs = list(executor.map(func, np.array_split(xs, no_shards)))
+
+        return np.concatenate(outputs)
+
+
+    def apply_repair_batch(self, xs, repair_neuron, repair_w, repair_layer):
+        # batch version of apply_repair_fixed, layer -1 scales the inputs
+        if self.layers == None or self.is_recurrent():
+            # only work with feed-forward layers
+            raise NameError('Not support yet!')
+
+        repairs = self.__get_repairs(repair_neuron, repair_w, repair_layer)
+        output = self.__to_dtype(xs).reshape(len(xs), *self.shape[1:])
+
+        for i in range(-1, len(self.layers)):
+            if i >= 0:
+                output = self.layers[i].apply_batch(output)
+
+            if i in repairs:
+                scale = self.__get_scale(repairs[i], output.shape[1])
+                output = output * scale.reshape(-1, *[1] * (output.ndim - 2))
+
+        return output
+
+
+    def __apply_seq(self, xs, repairs=dict(), tap=None):
+        # run a batch of sequences with the same length, one row per sequence,
+        # layer by layer over all timesteps; the recurrent state is kept local
+        # so the layers are never mutated
+        size_i = np.prod(self.shape[1:])
+        output = xs.reshape(len(xs), -1, size_i)
+        no_seqs, no_steps = output.shape[0], output.shape[1]
+
+        last_recurrent = max(i for i in range(len(self.layers)) if self.layers[i].is_recurrent_layer())
+        tap_output = None
+
+        for i in range(len(self.layers)):
+            layer = self.layers[i]
+
+            if i > last_recurrent and (tap is None or tap < i):
+                # only the last timestep is needed after the recurrent layers
+                output = output[:, -1:]
+                no_steps = 1
+
+            if layer.is_recurrent_layer():
+                scale = self.__get_scale(repairs[i], layer.h_0.size) if i in repairs else None
+                output, _ = layer.apply_seq(output, None, scale)
+            else:
+                output = output.reshape(no_seqs * no_steps, *output.shape[2:])
+                output = layer.apply_batch(output)
+                if i in repairs:
+                    output = output * self.__get_scale(repairs[i], output.shape[-1])
+                output = output.reshape(no_seqs, no_steps, *output.shape[1:])
+
+            if i == tap:
+                tap_output = output
+
+        return output[:, -1], tap_output
+
+
+    def __get_repairs(self, repair_neuron, repair_w, repair_layer):
+        repairs = dict()
+
+        for l_idx in range(0, len(repair_layer)):
+            layer_idx = repair_layer[l_idx]
+            if layer_idx not in repairs:
+                repairs[layer_idx] = []
+
+            repairs[layer_idx].append((repair_neuron[l_idx], repair_w[l_idx]))
+
+        return repairs
+
+
+    def __get_scale(self, repairs, size):
+        scale = np.ones(size, dtype=self.dtype)
+
+        for n_idxs, w in repairs:
+            scale[n_idxs] = (1 + w) * scale[n_idxs]
+
+        return scale
+
+
+    def is_recurrent(self):
+        if self.layers == None:
+            return False
+
+        for layer in self.layers:
+            if layer.is_recurrent_layer():
+                return True
+
+        return False
+
+
+    def apply_range(self, output, start, end):
+        if self.layers == None or self.is_recurrent():
+            # only work with feed-forward layers
+            raise NameError('Not support yet!')
+
+        for layer in self.layers[start:end]:
+            output = layer.apply_batch(output)
+
+        return output
+
+
+    def get_activations(self, xs, layer_idx):
+        # outputs of layer layer_idx for a batch of inputs, -1 for the inputs
+        output = self.__to_dtype(xs).reshape(len(xs), *self.shape[1:])
+
+        return self.apply_range(output, 0, layer_idx + 1)
+
+
+    def run_from(self, layer_idx, activation):
+        # resume the forward pass with the (possibly edited) outputs of layer layer_idx
+        return self.apply_range(activation, layer_idx + 1, len(self.layers))
+
+
     def apply_to(self, x, idx):
         if self.layers == None:
             # only work when layers is not None
@@ -91,12 +389,32 @@ class Model:
         for i in range(len(self.layers)):
             if i == idx:
                 layer = self.layers[i]
-                output = layer.apply_poly(output, lst_poly)
+                output = layer.apply_poly(output, lst_poly, self.dtype)
                 break
 
         return output
 
 
+    def apply_taps(self, xs, taps=None):
+        # run a batch of inputs once and record the outputs of the layers in taps,
+        # or of all layers if taps is None; the records are the layer outputs
+        # themselves, not copies, and must not be modified
+        if self.layers == None or self.is_recurrent():
+            # only work with feed-forward layers
+            raise NameError('Not support yet!')
+
+        output = self.__to_dtype(xs).reshape(len(xs), *self.shape[1:])
+        records = dict()
+
+        for i in range(len(self.layers)):
+            output = self.layers[i].apply_batch(output)
+
+            if taps is None or i in taps:
+                records[i] = output
+
+        return output, records
+
+
     def apply_intermediate(self, x, layer_idx=0):
         if self.layers == None:
             return self.__apply_ptmodel(x)
@@ -110,26 +428,9 @@ class Model:
         if len != 1:
             return None, None
 
-        layer_output = []
+        output, records = self.apply_taps(x.reshape(shape_i), [layer_idx])
 
-        for i in range(len):
-            x_i = x[size_i * i : size_i * (i + 1)].reshape(shape_i)
-            output = x_i
-            j = 0
-            for layer in self.layers:
-                output = layer.apply(output)
-                #sunbing
-                #if j == 2:
-                #    output[0][20] = 0.0*output[0][20]
-                #if j == 0:
-                #    output[0][15] =  0.0*output[0][15]
-                    #output[0][13] =  0.03*output[0][13]
-                if j == layer_idx:
-                    layer_output = output[0]
-                j = j + 1
-
-        for layer in self.layers:
-            layer.reset()
+        layer_output = records[layer_idx][0] if layer_idx in records else []
 
         return output, layer_output
 
@@ -174,68 +475,32 @@ class Model:
 
 
     def apply_lstm_inter(self, x, neuron=0):
+        # x is either one flattened sequence or a batch of them, one per row
         if self.layers == None:
             return self.__apply_ptmodel(x)
 
-        shape_i = [1, *self.shape[1:]]
-        size_i = np.prod(shape_i)
-
-        length = int(x.size / size_i)
-
-        hidden_state = [] # should contain xlen elements
-
-        #lstm_cell_mean = 0
+        xs = x.reshape(1, -1) if x.ndim == 1 else x
 
-        for i in range(length):
-            x_i = x[size_i * i : size_i * (i + 1)].reshape(shape_i)
-            output = x_i
-
-            layer_index = 0
-            for layer in self.layers:
-                output = layer.apply(output)
-                if layer_index == 0:
-                    # lstm layer
-                    # test first cell: output[0][0]
-                    #lstm_cell_mean = lstm_cell_mean + output[0][0]
-                    #output[0][0] = 1.397 * output[0][0];
-                    hidden_state.append(output[0][neuron])
+        output, hidden_state = self.__apply_seq(xs, tap=0)
 
-                layer_index = layer_index + 1
+        # lstm layer: values of the neuron at every timestep, per sequence
+        hidden_state = hidden_state[:, :, neuron]
 
-        #lstm_cell_mean = lstm_cell_mean / length
-
-        for layer in self.layers:
-            layer.reset()
-
-        return output, hidden_state
+        if x.ndim == 1:
+            return output, list(hidden_state[0])
+        else:
+            return output, hidden_state
 
 
     def apply_lstm_repair(self, x, repair_neuron=0, repair_w=0.0, repair_layer=0):
+        # x is either one flattened sequence or a batch of them, one per row
         if self.layers == None:
             return self.__apply_ptmodel(x)
 
-        shape_i = [1, *self.shape[1:]]
-        size_i = np.prod(shape_i)
+        xs = x.reshape(1, -1) if x.ndim == 1 else x
 
-        length = int(x.size / size_i)
-
-        for i in range(length):
-            x_i = x[size_i * i : size_i * (i + 1)].reshape(shape_i)
-            output = x_i
-
-            layer_index = 0
-            for layer in self.layers:
-                output = layer.apply(output)
-
-                for l_idx in range(0, len(repair_layer)):
-                    if repair_layer[l_idx] == layer_index:
-                        n_idxs = repair_neuron[l_idx]
-                        output[0][n_idxs] = (1 + repair_w[l_idx]) * output[0][n_idxs]
-
-                layer_index = layer_index + 1
-
-        for layer in self.layers:
-            layer.reset()
+        repairs = self.__get_repairs(repair_neuron, repair_w, repair_layer)
+        output, _ = self.__apply_seq(xs, repairs)
 
         return output
 
@@ -343,4 +608,42 @@ class Model:
             layer.reset()
 
         return output, hidden
-#####################################################################################################################################
\ No newline at end of file
+#####################################################################################################################################
+
+
+class ActivationCache:
+    # outputs of the layers of a model for a fixed batch of inputs,
+    # computed on demand from the deepest cached layer before them
+    def __init__(self, model, xs):
+        self.model = model
+        self.activations = {-1: xs.astype(model.dtype, copy=False).reshape(len(xs), *model.shape[1:])}
+
+    def get(self, layer_idx):
+        if layer_idx not in self.activations:
+            start = max(idx for idx in self.activations if idx < layer_idx)
+            output = self.model.apply_range(self.activations[start], start + 1, layer_idx + 1)
+            self.activations[layer_idx] = output
+
+        return self.activations[layer_idx]
+
+    def preload(self, layer_idxs):
+        # compute the outputs of several layers with one traversal
+        _, records = self.model.apply_taps(self.activations[-1], layer_idxs)
+        self.activations.update(records)
+
+    def run_from(self, layer_idx, activation):
+        return self.model.run_from(layer_idx, activation)
+
+    def intervene(self, layer_idx, neuron, value):
+        # set the neuron of layer layer_idx to value and run the rest of the model
+        activation = self.get(layer_idx).copy()
+        activation[:, neuron] = value
+
+        return self.run_from(layer_idx, activation)
+
+    def scale(self, layer_idx, neuron, weight):
+        # scale the neuron of layer layer_idx by 1 + weight and run the rest of the model
+        activation = self.get(layer_idx).copy()
+        activation[:, neuron] = (1 + weight) * activation[:, neuron]
+
+        return self.run_from(layer_idx, activation)
@@ -0,0 +1,92 @@
+import autograd.numpy as np
+
+from model.lib_layers import *
+
+
+def is_noop(layer, shape):
+    if not isinstance(layer, Function):
+        return False
+
+    if layer.name == 'reshape':
+        return tuple(layer.params) == tuple(shape)
+    elif layer.name == 'transpose':
+        return tuple(layer.params) == tuple(range(len(shape)))
+    else:
+        return False
+
+
+def is_affine(layer):
+    return isinstance(layer, Linear) and layer.func == None
+
+
+def fold_linear(first, second):
+    # x @ w1 + b1 @ w2 + b2 == x @ (w1 @ w2) + (b1 @ w2 + b2)
+    new_layer = second.copy()
+
+    new_layer.weights = first.weights @ second.weights
+    new_layer.bias = first.bias @ second.weights + second.bias
+
+    return new_layer
+
+
+def fuse_activation(linear, function):
+    new_layer = linear.copy()
+    new_layer.func = function.func
+
+    return new_layer
+
+
+def optimize_layers(layers, shape, fuse=True):
+    # fold consecutive affine layers, drop reshapes/transposes that do not change
+    # the shape and, if fuse, merge linear layers with the activations after them;
+    # layer_map gives for each original layer the index of the new layer with the
+    # same output, or None if its output does not exist any more
+    new_layers, layer_map = [], {-1: -1}
+
+    output = np.zeros([1, *shape[1:]])
+
+    for i in range(len(layers)):
+        layer = layers[i]
+
+        if is_noop(layer, output.shape):
+            layer_map[i] = len(new_layers) - 1
+            continue
+
+        output = layer.apply(output)
+
+        last = new_layers[-1] if len(new_layers) > 0 else None
+        last_idx = len(new_layers) - 1
+
+        if is_affine(last) and isinstance(layer, Linear):
+            no_in, no_mid = last.weights.shape
+            no_out = layer.weights.shape[1]
+
+            # only fold when the product is not larger than the two factors
+            if no_in * no_out <= no_in * no_mid + no_mid * no_out:
+                new_layers[-1] = fold_linear(last, layer)
+                layer_map = {k: None if v == last_idx else v for k, v in layer_map.items()}
+                layer_map[i] = last_idx
+                continue
+
+        if fuse and is_affine(last) and isinstance(layer, Function) \
+            and layer.name in ('relu', 'sigmoid', 'tanh'):
+            new_layers[-1] = fuse_activation(last, layer)
+            layer_map = {k: None if v == last_idx else v for k, v in layer_map.items()}
+            layer_map[i] = last_idx
+            continue
+
+        new_layers.append(layer)
+        layer_map[i] = len(new_layers) - 1
+
+    return new_layers, layer_map
+
+
+def optimize_model(model, fuse=True):
+    if model.layers == None or model.is_recurrent():
+        # only work with feed-forward layers
+        return model
+
+    model.layers, model.layer_map = optimize_layers(model.layers, model.shape, fuse)
+    model.memo.clear()
+
+    return model
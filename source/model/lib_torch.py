@@ -0,0 +1,62 @@
+import autograd.numpy as np
+import threading
+import copy
+
+
+class TorchModel:
+    # a pytorch model saved with torch.save, run on batches of flattened numpy inputs;
+    # torch is only imported when such a model is used
+    def __init__(self, path, shape, threads=None):
+        import torch
+
+        self.torch = torch
+        self.shape = [int(size) for size in shape]
+
+        if threads is not None:
+            torch.set_num_threads(threads)
+
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+        if path is not None:
+            self.module = torch.load(path, map_location=self.device, weights_only=False)
+            self.module.eval()
+
+            self.dtype = self.get_dtype()
+
+        # one reusable input buffer per thread, so apply_many can share the model
+        self.buffers = threading.local()
+
+    def get_dtype(self):
+        for param in self.module.parameters():
+            return param.dtype
+
+        return self.torch.float32
+
+    def copy(self):
+        new_model = TorchModel(None, self.shape)
+
+        new_model.module = copy.deepcopy(self.module)
+        new_model.dtype = self.dtype
+
+        return new_model
+
+    def get_buffer(self, n):
+        # the buffer is pinned when the inputs go to the gpu, and only
+        # reallocated when the batch size changes
+        buffer = getattr(self.buffers, 'buffer', None)
+
+        if buffer is None or len(buffer) != n:
+            pin = self.device.type == 'cuda'
+            buffer = self.torch.empty((n, *self.shape[1:]), dtype=self.dtype, pin_memory=pin)
+            self.buffers.buffer = buffer
+
+        return buffer
+
+    def apply(self, xs):
+        buffer = self.get_buffer(len(xs))
+        buffer.numpy()[...] = xs.reshape(buffer.shape)
+
+        with self.torch.no_grad():
+            output = self.module(buffer.to(self.device, non_blocking=True))
+
+        return output.cpu().numpy()
@@ -1,185 +1,134 @@
 import autograd.numpy as np
 
-from ctypes import *
-
-clib = CDLL('./clib/clib.so')
-
-def back_substitute0(args):
-    idx, le_curr, ge_curr, lst_poly = args
-
-    le_curr = np.array(le_curr, dtype=np.float64)
-    ge_curr = np.array(ge_curr, dtype=np.float64)
+def margin(n, mag, dtype):
+    # bound of the rounding error in dtype of a sum of n products with total magnitude mag
+    return 2 * (n + 2) * np.finfo(dtype).eps * mag
+
+def widen(res, x_poly, dtype):
+    # move the relaxation of an activation computed in low precision outward
+    # by a bound of its rounding error, the values of the activation are at most 1
+    # in magnitude or exact
+    bound = np.maximum(np.abs(x_poly.lw), np.abs(x_poly.up))
+
+    if res.is_activation:
+        err_le = margin(4, np.abs(res.le[:, 0]) * bound + np.abs(res.le[:, -1]) + 1, dtype)
+        err_ge = margin(4, np.abs(res.ge[:, 0]) * bound + np.abs(res.ge[:, -1]) + 1, dtype)
+    else:
+        err_le = margin(4, np.abs(res.le[:, :-1]) @ bound + np.abs(res.le[:, -1]) + 1, dtype)
+        err_ge = margin(4, np.abs(res.ge[:, :-1]) @ bound + np.abs(res.ge[:, -1]) + 1, dtype)
+
+    res.le[:, -1] += err_le
+    res.ge[:, -1] -= err_ge
+
+    res.lw = res.lw - err_ge
+    res.up = res.up + err_le
+
+def is_sparse(coefs):
+    # the le and ge of the conv layers are scipy sparse matrices
+    return not isinstance(coefs, np.ndarray)
+
+def split(coefs):
+    # the positive coefficients, the negative coefficients and the constants of the
+    # rows of le or ge
+    if is_sparse(coefs):
+        const = coefs[:, -1].toarray().reshape(-1)
+        coefs = coefs[:, :-1]
+
+        return coefs.maximum(0).tocsr(), coefs.minimum(0).tocsr(), const
+    else:
+        return np.maximum(coefs[:, :-1], 0), np.minimum(coefs[:, :-1], 0), coefs[:, -1]
+
+def matmul(coefs, e_coefs):
+    if is_sparse(e_coefs) and not is_sparse(coefs):
+        return (e_coefs.T @ coefs.T).T
+    else:
+        return coefs @ e_coefs
+
+def add_const(coefs, const):
+    # coefs with const added to the last column
+    if is_sparse(coefs):
+        from scipy.sparse import csr_matrix
+
+        no_rows, no_coefs = coefs.shape
+        last = csr_matrix((const, (np.arange(no_rows), np.full(no_rows, no_coefs - 1))), shape=coefs.shape)
+
+        return (coefs + last).tocsr()
+    else:
+        coefs[:, -1] += const
+        return coefs
+
+def compose(max_curr, min_curr, const, e_max, e_min, is_activation):
+    # max_curr @ e_max + min_curr @ e_min plus const in the last column, where e_max
+    # and e_min are the le or ge of a poly, which only keep the diagonal and the
+    # constants for activations and are sparse for the conv layers
+    if is_activation:
+        const = const + max_curr @ e_max[:, -1] + min_curr @ e_min[:, -1]
+
+        if is_sparse(max_curr):
+            from scipy.sparse import hstack
+
+            coefs = max_curr.multiply(e_max[:, 0]) + min_curr.multiply(e_min[:, 0])
+            return hstack([coefs, const.reshape(-1, 1)], format='csr')
+        else:
+            coefs = max_curr * e_max[:, 0] + min_curr * e_min[:, 0]
+            return np.concatenate([coefs, const.reshape(-1, 1)], axis=1)
+    else:
+        return add_const(matmul(max_curr, e_max) + matmul(min_curr, e_min), const)
+
+def back_substitute(le_curr, ge_curr, lst_poly, dtype, get_ineq=False):
+    # bounds of all the neurons of a layer at once: the rows of le_curr and ge_curr
+    # are moved back through each previous poly with matrix products, positive
+    # coefficients take the upper relation and negative ones the lower relation;
+    # in low precision dtype every step is moved outward by a bound of its rounding error
+    exact = dtype == np.float64
 
     lst_le, lst_ge = [le_curr], [ge_curr]
-    best_lw, best_up = -1e9, 1e9
-
-    for k, e in reversed(list(enumerate(lst_poly))):
-        no_e_ns = len(e.lw)
-
-        max_le_curr = np.maximum(le_curr[:-1], 0)
-        min_le_curr = np.minimum(le_curr[:-1], 0)
-
-        max_ge_curr = np.maximum(ge_curr[:-1], 0)
-        min_ge_curr = np.minimum(ge_curr[:-1], 0)
-
-        max_le_n0id = np.array(np.nonzero(max_le_curr)[0], dtype=np.int32)
-        min_le_n0id = np.array(np.nonzero(min_le_curr)[0], dtype=np.int32)
-
-        max_ge_n0id = np.array(np.nonzero(max_ge_curr)[0], dtype=np.int32)
-        min_ge_n0id = np.array(np.nonzero(min_ge_curr)[0], dtype=np.int32)
-
-        lw, up = ge_curr[-1], le_curr[-1]
-
-        if len(max_ge_n0id) > 0:
-            lw += np.sum(max_ge_curr[max_ge_n0id] * e.lw[max_ge_n0id])
-        if len(min_ge_n0id) > 0:
-            lw += np.sum(min_ge_curr[min_ge_n0id] * e.up[min_ge_n0id])
-
-        if len(max_le_n0id) > 0:
-            up += np.sum(max_le_curr[max_le_n0id] * e.up[max_le_n0id])
-        if len(min_le_n0id) > 0:
-            up += np.sum(min_le_curr[min_le_n0id] * e.lw[min_le_n0id])
-
-        best_lw = max(best_lw, lw)
-        best_up = min(best_up, up)
-
-        if k > 0:
-            no_coefs = len(e.le[0])
-
-            le = np.zeros([no_coefs], dtype=np.float64)
-            ge = np.zeros([no_coefs], dtype=np.float64)
-
-            le_curr_ptr = le_curr.ctypes.data_as(POINTER(c_double))
-            ge_curr_ptr = ge_curr.ctypes.data_as(POINTER(c_double))
-
-            e_le, e_ge = e.le, e.ge
-
-            le_ptr = e_le.ctypes.data_as(POINTER(POINTER(c_double)))
-            ge_ptr = e_ge.ctypes.data_as(POINTER(POINTER(c_double)))
 
-            max_le_n0id_ptr = max_le_n0id.ctypes.data_as(POINTER(c_int))
-            min_le_n0id_ptr = min_le_n0id.ctypes.data_as(POINTER(c_int))
-
-            max_ge_n0id_ptr = max_ge_n0id.ctypes.data_as(POINTER(c_int))
-            min_ge_n0id_ptr = min_ge_n0id.ctypes.data_as(POINTER(c_int))
-
-            clib.array_mul_c.argtypes = (POINTER(POINTER(c_double)), POINTER(c_double), POINTER(c_int), c_int, c_int)
-            clib.array_mul_c.restype = POINTER(c_double * no_coefs)
-
-            clib.free_array.argtype = POINTER(c_double * no_coefs)
-
-            result_ptr = clib.array_mul_c(le_ptr, le_curr_ptr, max_le_n0id_ptr, len(max_le_n0id), no_coefs)
-            le += np.frombuffer(result_ptr.contents)
-            clib.free_array(result_ptr)
-
-            result_ptr = clib.array_mul_c(ge_ptr, le_curr_ptr, min_le_n0id_ptr, len(min_le_n0id), no_coefs)
-            le += np.frombuffer(result_ptr.contents)
-            clib.free_array(result_ptr)
-
-            result_ptr = clib.array_mul_c(ge_ptr, ge_curr_ptr, max_ge_n0id_ptr, len(max_ge_n0id), no_coefs)
-            ge += np.frombuffer(result_ptr.contents)
-            clib.free_array(result_ptr)
-
-            result_ptr = clib.array_mul_c(le_ptr, ge_curr_ptr, min_ge_n0id_ptr, len(min_ge_n0id), no_coefs)
-            ge += np.frombuffer(result_ptr.contents)
-            clib.free_array(result_ptr)
-
-            le[-1] = le[-1] + le_curr[-1]
-            ge[-1] = ge[-1] + ge_curr[-1]
-
-            le_curr, ge_curr = le, ge
-
-            lst_le.insert(0, le_curr)
-            lst_ge.insert(0, ge_curr)
-
-    return idx, best_lw, best_up, lst_le, lst_ge
-
-def back_substitute1(args):
-    idx, le_curr, ge_curr, lst_poly = args
-
-    lst_le, lst_ge = [le_curr], [ge_curr]
-    best_lw, best_up = -1e9, 1e9
+    best_lw = np.full(le_curr.shape[0], -1e9, dtype=dtype)
+    best_up = np.full(le_curr.shape[0], 1e9, dtype=dtype)
 
     for k, e in reversed(list(enumerate(lst_poly))):
-        no_e_ns = len(e.lw)
+        no_coefs = le_curr.shape[1]
 
-        max_le_curr = np.maximum(le_curr[:-1], 0)
-        min_le_curr = np.minimum(le_curr[:-1], 0)
+        max_le_curr, min_le_curr, const_le = split(le_curr)
+        max_ge_curr, min_ge_curr, const_ge = split(ge_curr)
 
-        max_ge_curr = np.maximum(ge_curr[:-1], 0)
-        min_ge_curr = np.minimum(ge_curr[:-1], 0)
+        lw = const_ge + max_ge_curr @ e.lw + min_ge_curr @ e.up
+        up = const_le + max_le_curr @ e.up + min_le_curr @ e.lw
 
-        max_le_n0id = np.nonzero(max_le_curr)[0]
-        min_le_n0id = np.nonzero(min_le_curr)[0]
+        if not exact:
+            lw -= margin(no_coefs, max_ge_curr @ np.abs(e.lw) - min_ge_curr @ np.abs(e.up) + np.abs(const_ge), dtype)
+            up += margin(no_coefs, max_le_curr @ np.abs(e.up) - min_le_curr @ np.abs(e.lw) + np.abs(const_le), dtype)
 
-        max_ge_n0id = np.nonzero(max_ge_curr)[0]
-        min_ge_n0id = np.nonzero(min_ge_curr)[0]
+        best_lw = np.maximum(best_lw, lw)
+        best_up = np.minimum(best_up, up)
 
-        lw, up = ge_curr[-1], le_curr[-1]
+        if k > 0:
+            le = compose(max_le_curr, min_le_curr, const_le, e.le, e.ge, e.is_activation)
+            ge = compose(max_ge_curr, min_ge_curr, const_ge, e.ge, e.le, e.is_activation)
 
-        if len(max_ge_n0id) > 0:
-            lw += np.sum(max_ge_curr[max_ge_n0id] * e.lw[max_ge_n0id])
-        if len(min_ge_n0id) > 0:
-            lw += np.sum(min_ge_curr[min_ge_n0id] * e.up[min_ge_n0id])
+            if not exact:
+                # the rounding errors of the new coefficients are moved
+                # into the constants with the ranges of the neurons they multiply
+                mag_le = compose(max_le_curr, -min_le_curr, np.abs(const_le), abs(e.le), abs(e.ge), e.is_activation)
+                mag_ge = compose(max_ge_curr, -min_ge_curr, np.abs(const_ge), abs(e.ge), abs(e.le), e.is_activation)
 
-        if len(max_le_n0id) > 0:
-            up += np.sum(max_le_curr[max_le_n0id] * e.up[max_le_n0id])
-        if len(min_le_n0id) > 0:
-            up += np.sum(min_le_curr[min_le_n0id] * e.lw[min_le_n0id])
+                err_le, _, err_const_le = split(margin(no_coefs, mag_le, dtype))
+                err_ge, _, err_const_ge = split(margin(no_coefs, mag_ge, dtype))
 
-        best_lw = max(best_lw, lw)
-        best_up = min(best_up, up)
+                e_prev = lst_poly[k - 1]
+                bound = np.maximum(np.abs(e_prev.lw), np.abs(e_prev.up))
 
-        if k > 0:
-            no_coefs = len(e.le[0])
-
-            le = np.zeros([no_coefs])
-            ge = np.zeros([no_coefs])
-
-            threshold = 1e3
-
-            if len(max_le_n0id) > 0:
-                if e.is_activation and no_coefs > threshold:
-                    for i in max_le_n0id:
-                        le[i] += max_le_curr[i] * e.le[i,i]
-                        le[-1] += max_le_curr[i] * e.le[i,-1]        
-                else:
-                    le += np.sum(max_le_curr[max_le_n0id].reshape(len(max_le_n0id), 1) * e.le[max_le_n0id], axis=0)
-            
-            if len(min_le_n0id) > 0:
-                if e.is_activation and no_coefs > threshold:
-                    for i in min_le_n0id:
-                        le[i] += min_le_curr[i] * e.ge[i,i]
-                        le[-1] += min_le_curr[i] * e.ge[i,-1]
-                else:
-                    le += np.sum(min_le_curr[min_le_n0id].reshape(len(min_le_n0id), 1) * e.ge[min_le_n0id], axis=0)
-
-            if len(max_ge_n0id) > 0:
-                if e.is_activation and no_coefs > threshold:
-                    for i in max_ge_n0id:
-                        ge[i] += max_ge_curr[i] * e.ge[i,i]
-                        ge[-1] += max_ge_curr[i] * e.ge[i,-1] 
-                else:
-                    ge += np.sum(max_ge_curr[max_ge_n0id].reshape(len(max_ge_n0id), 1) * e.ge[max_ge_n0id], axis=0)
-
-            if len(min_ge_n0id) > 0:
-                if e.is_activation and no_coefs > threshold:
-                    for i in min_ge_n0id:
-                        ge[i] += min_ge_curr[i] * e.le[i,i]
-                        ge[-1] += min_ge_curr[i] * e.le[i,-1] 
-                else:
-                    ge += np.sum(min_ge_curr[min_ge_n0id].reshape(len(min_ge_n0id), 1) * e.le[min_ge_n0id], axis=0)
-            
-            le[-1] = le[-1] + le_curr[-1]
-            ge[-1] = ge[-1] + ge_curr[-1]
+                le = add_const(le, err_le @ bound + err_const_le)
+                ge = add_const(ge, -(err_ge @ bound + err_const_ge))
 
             le_curr, ge_curr = le, ge
 
-            lst_le.insert(0, le_curr)
-            lst_ge.insert(0, ge_curr)
-
-    return idx, best_lw, best_up, lst_le, lst_ge
+            if get_ineq:
+                lst_le.insert(0, le_curr)
+                lst_ge.insert(0, ge_curr)
 
+    return best_lw, best_up, lst_le, lst_ge
 
 # def input_tighten(args):
 #     idx, x, constraints, lw_i, up_i = args
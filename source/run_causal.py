@@ -68,7 +68,7 @@ def main():
         pathX = 'benchmark/causal/FairSquare/data/'
         pathY = 'benchmark/causal/FairSquare/data/labels.txt'
 
-    y0s = np.array(ast.literal_eval(read(pathY)))
+    y0s = read_array(pathY)
 
     assertion['x0'] = pathX + 'data' + str(0) + '.txt'
 
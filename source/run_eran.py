@@ -4,6 +4,7 @@ import json
 import ast
 
 from json_parser import parse
+from dataset import load_dataset
 from utils import *
 
 import time
@@ -87,11 +88,12 @@ def main():
         pathX = 'benchmark/eran/data/mnist_fc/'
         pathY = 'benchmark/eran/data/labels/y_mnist.txt'
 
-    y0s = np.array(ast.literal_eval(read(pathY)))
+    data = load_dataset(pathX, pathY=pathY)
+    y0s = data.labels
 
     for i in range(100):
-        assertion['x0'] = pathX + 'data' + str(i) + '.txt'
-        x0 = np.array(ast.literal_eval(read(assertion['x0'])))
+        x0 = data[i]
+        assertion['x0'] = x0
 
         output_x0 = model.apply(x0)
         lbl_x0 = np.argmax(output_x0, axis=1)[0]
@@ -81,11 +81,11 @@ def main():
         pathX = 'benchmark/fairness/credit/data/'
         pathY = 'benchmark/fairness/credit/data/labels.txt'
 
-    y0s = np.array(ast.literal_eval(read(pathY)))
+    y0s = read_array(pathY)
 
     for i in range(args.num_tests):
         assertion['x0'] = pathX + 'data' + str(i) + '.txt'
-        x0 = np.array(ast.literal_eval(read(assertion['x0'])))
+        x0 = read_array(assertion['x0'])
 
         output_x0 = model.apply(x0)
         lbl_x0 = np.argmax(output_x0, axis=1)[0]
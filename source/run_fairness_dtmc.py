@@ -68,7 +68,7 @@ def main():
         pathX = '../benchmark/fairness/FairSquare/data/'
         pathY = '../benchmark/fairness/FairSquare/data/labels.txt'
 
-    y0s = np.array(ast.literal_eval(read(pathY)))
+    y0s = read_array(pathY)
 
     assertion['x0'] = pathX + 'data' + str(0) + '.txt'
 
@@ -81,7 +81,7 @@ def main():
     fixed_acc = 0
     for i in range(32000):
         assertion['x0'] = pathX + 'data' + str(i) + '.txt'
-        x0 = np.array(ast.literal_eval(read(assertion['x0'])))
+        x0 = read_array(assertion['x0'])
         x0_ = x0.copy()
         x0_[4] = 0
         #x0_[10] = 0
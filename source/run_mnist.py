@@ -64,8 +64,8 @@ def main():
         pathX = 'benchmark/mnist_challenge/x_y/x' + str(i) + '.txt'
         pathY = 'benchmark/mnist_challenge/x_y/y' + str(i) + '.txt'
 
-        x0s = np.array(ast.literal_eval(read(pathX)))
-        y0s = np.array(ast.literal_eval(read(pathY)))
+        x0s = read_array(pathX)
+        y0s = read_array(pathY)
 
         for j in range(200):
             x0 = x0s[j]
@@ -4,6 +4,7 @@ import json
 import ast
 
 from json_parser import parse
+from dataset import load_dataset
 from utils import *
 
 from solver.lib_solvers import Refinement
@@ -70,12 +71,17 @@ def main():
                         help='the data set for refinement experiments')
     parser.add_argument('--num_tests', type=int, default=100,
                         help='maximum number of tests')
+    parser.add_argument('--dtype', type=str,
+                        help='the floating point type of the model, float64 or float32')
 
     args = parser.parse_args()
 
     with open(args.spec, 'r') as f:
         spec = json.load(f)
 
+    if args.dtype is not None:
+        spec['model']['dtype'] = args.dtype
+
     add_assertion(args, spec)
     add_solver(args, spec)
 
@@ -96,11 +102,12 @@ def main():
         pathX = 'benchmark/eran/data/mnist_fc/'
         pathY = 'benchmark/eran/data/labels/y_mnist.txt'
 
-    y0s = np.array(ast.literal_eval(read(pathY)))
+    data = load_dataset(pathX, pathY=pathY)
+    y0s = data.labels
 
     for i in range(args.num_tests):
-        assertion['x0'] = pathX + 'data' + str(i) + '.txt'
-        x0 = np.array(ast.literal_eval(read(assertion['x0'])))
+        x0 = data[i]
+        assertion['x0'] = x0
 
         output_x0 = model.apply(x0)
         lbl_x0 = np.argmax(output_x0, axis=1)[0]
@@ -4,6 +4,7 @@ import json
 import ast
 
 from json_parser import parse
+from dataset import load_dataset
 from utils import *
 
 
@@ -65,11 +66,20 @@ def main():
         pathX = 'benchmark/rnn/data/wiki/'
         pathY = 'benchmark/rnn/data/wiki/labels.txt'
 
-    y0s = np.array(ast.literal_eval(read(pathY)))
+    data = load_dataset(pathX, pathY=pathY)
+    y0s = data.labels
+
+    x0s = [data[i] for i in range(100)]
+
+    if len(set(x0.size for x0 in x0s)) == 1:
+        # all texts have the same length, run them as one batch
+        output_x0s = model.apply_batch(np.array(x0s))
+    else:
+        output_x0s = np.concatenate([model.apply(x0) for x0 in x0s])
 
     for i in range(100):
-        assertion['x0'] = pathX + 'data' + str(i) + '.txt'
-        x0 = np.array(ast.literal_eval(read(assertion['x0'])))
+        x0 = x0s[i]
+        assertion['x0'] = x0
 
         shape_x0 = (int(x0.size / 50), 50)
 
@@ -77,7 +87,7 @@ def main():
         model.lower = np.full(x0.size, lower)
         model.upper = np.full(x0.size, upper)
 
-        output_x0 = model.apply(x0)
+        output_x0 = output_x0s[i].reshape(1, -1)
         lbl_x0 = np.argmax(output_x0, axis=1)[0]
 
         print('Data {}\n'.format(i))
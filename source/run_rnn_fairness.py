@@ -65,7 +65,7 @@ def main():
         pathX = '../benchmark/rnn_fairness/data/wiki/'
         pathY = '../benchmark/rnn_fairness/data/wiki/labels.txt'
 
-    y0s = np.array(ast.literal_eval(read(pathY)))
+    y0s = read_array(pathY)
 
     model.shape = (100, 50)
 
@@ -76,7 +76,7 @@ def main():
         for i in range(1000):
             assertion['x0'] = pathX + 'data' + str(i) + '.txt'
             #assertion['x0'] = pathX + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(assertion['x0'])))
+            x0 = read_array(assertion['x0'])
 
             shape_x0 = (int(x0.size / 50), 50)
 
@@ -11,11 +11,11 @@ from gurobipy import GRB
 
 from scipy.optimize import minimize
 from scipy.optimize import Bounds
-from autograd import grad
 from assertion.lib_functions import di
 from utils import *
 from poly_utils import *
 from solver.refinement_impl import Poly
+from dataset import load_dataset
 
 import matplotlib.pyplot as plt
 
@@ -38,11 +38,12 @@ class BackDoorImpl():
         dataset = spec['dataset']
 
         valid_x0s = []
-        y0s = np.array(ast.literal_eval(read(spec['pathY'])))
+
+        data = load_dataset(spec['pathX'], pathY=spec['pathY'])
+        y0s = data.labels
 
         for i in range(total_imgs):
-            pathX = spec['pathX'] + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(pathX)))
+            x0 = data[i]
 
             output_x0 = model.apply(x0).reshape(-1)
             y0 = np.argmax(output_x0)
@@ -179,30 +180,32 @@ class BackDoorImpl():
             curr_var_idx = size
 
             for poly in lst_poly[1:]:
+                poly_le, poly_ge = poly.get_dense(poly.le), poly.get_dense(poly.ge)
+
                 if first_layer:
                     for i in range(len(poly.lw)):
-                        coefs = -poly.ge[i][:-1]
-                        const = poly.ge[i][-1]
+                        coefs = -poly_ge[i][:-1]
+                        const = poly_ge[i][-1]
 
                         self.__write_constr_input_layer(prob, cnt_imgs, coefs, const, '=', backdoor_indexes, prev_var_idx, curr_var_idx + i)
                     first_layer = False
                 else:
                     for i in range(len(poly.lw)):
-                        ge, le = poly.ge[i], poly.le[i]
+                        ge, le = poly_ge[i], poly_le[i]
 
                         if np.all(ge == le):
-                            coefs = -poly.ge[i][:-1]
-                            const = poly.ge[i][-1]
+                            coefs = -poly_ge[i][:-1]
+                            const = poly_ge[i][-1]
 
                             self.__write_constr_hidden_layers(prob, cnt_imgs, coefs, const, '=', prev_var_idx, curr_var_idx + i)
                         else:
-                            coefs_ge = -poly.ge[i][:-1]
-                            const_ge = poly.ge[i][-1]
+                            coefs_ge = -poly_ge[i][:-1]
+                            const_ge = poly_ge[i][-1]
 
                             self.__write_constr_hidden_layers(prob, cnt_imgs, coefs_ge, const_ge, '>=', prev_var_idx, curr_var_idx + i)
 
-                            coefs_le = -poly.le[i][:-1]
-                            const_le = poly.le[i][-1]
+                            coefs_le = -poly_le[i][:-1]
+                            const_le = poly_le[i][-1]
 
                             self.__write_constr_hidden_layers(prob, cnt_imgs, coefs_le, const_le, '<=', prev_var_idx, curr_var_idx + i)
 
@@ -423,51 +426,45 @@ class BackDoorImpl():
 
 
     def __validate(self, model, valid_x0s, backdoor_indexes, target, stamp, rate):
-        cnt = 0
-
-        for x0, output_x0 in valid_x0s:
-            xi = x0.copy()
-            xi[backdoor_indexes] = stamp
+        xs = np.array([x0 for x0, output_x0 in valid_x0s])
+        xs[:, backdoor_indexes] = stamp
 
-            output = model.apply(xi).reshape(-1)
+        output = model.apply_many(xs)
 
-            if np.argmax(output) == target: # attack successfully
-                cnt += 1
+        cnt = np.sum(np.argmax(output, axis=1) == target) # attack successfully
 
         return (cnt / len(valid_x0s)) >= rate
 
 
     def __attack(self, model, valid_x0s, backdoor_indexes, target):
-        def obj_func(x, model, valid_x0s, backdoor_indexes, target):
-            res = 0
+        def loss(outputs, target):
+            target_score = outputs[:, target]
 
-            for x0, output_x0 in valid_x0s:
-                xi = x0.copy()
-                xi[backdoor_indexes] = x
+            outputs_no_target = outputs - np.eye(outputs.shape[1])[target] * 1e9
+            max_score = np.max(outputs_no_target, axis=1)
 
-                output = model.apply(xi).reshape(-1)
-                target_score = output[target]
+            return np.sum(np.where(target_score > max_score, 0, max_score - target_score + 1e-9))
 
-                output_no_target = output - np.eye(len(output))[target] * 1e9
-                max_score = np.max(output_no_target)
+        def obj_func(x, model, x0s, backdoor_indexes, target):
+            # all the stamped inputs are run as one batch, the gradient of the
+            # stamp is the sum of the gradients of its pixels in the inputs
+            xs = x0s.copy()
+            xs[:, backdoor_indexes] = x
 
-                if target_score > max_score:
-                    res += 0
-                else:
-                    res += max_score - target_score + 1e-9
+            res, g = model.value_and_grad(xs, lambda outputs: loss(outputs, target))
 
-            return res
+            return res, np.sum(g[:, backdoor_indexes], axis=0)
 
         x = np.zeros(len(backdoor_indexes))
         lw = model.lower[backdoor_indexes]
         up = model.upper[backdoor_indexes]
 
-        args = (model, valid_x0s, backdoor_indexes, target)
-        # jac = grad(obj_func)
-        jac = None
+        x0s = np.array([x0 for x0, output_x0 in valid_x0s])
+
+        args = (model, x0s, backdoor_indexes, target)
         bounds = Bounds(lw, up)
 
-        res = minimize(obj_func, x, args=args, jac=jac, bounds=bounds)
+        res = minimize(obj_func, x, args=args, jac=True, bounds=bounds)
 
         if res.fun <= 0: # an adversarial sample is generated
             # print('Attack target = {} with stamp = {} and position = {}'.format(target, res.x, backdoor_indexes))
@@ -11,11 +11,12 @@ from gurobipy import GRB
 
 from scipy.optimize import minimize
 from scipy.optimize import Bounds
-from autograd import grad
 from assertion.lib_functions import di
 from utils import *
 from poly_utils import *
 from solver.refinement_impl import Poly
+from model.lib_models import ActivationCache
+from dataset import load_dataset
 
 import matplotlib.pyplot as plt
 
@@ -31,7 +32,7 @@ class BackDoorRepairImpl():
         known_stamp = spec['known_stamp']
         pathX, pathY = spec['pathX'], spec['pathY']
 
-        y0s = np.array(ast.literal_eval(read(pathY)))
+        y0s = load_dataset(pathX, pathY=pathY).labels
         valid_x0s = self.__get_valid_x0s(model, total_imgs, y0s, pathX, target)
 
         if len(valid_x0s) == 0:
@@ -124,12 +125,26 @@ class BackDoorRepairImpl():
         return indexes
 
 
+    def __get_next_layer(self, model, repair_layer):
+        # the first linear layer after repair_layer, with the outgoing weights of its
+        # neurons; the layers are those of the model, which may be optimized, so the
+        # activation is not always the only layer in between
+        for layer_idx in range(repair_layer + 1, len(model.layers)):
+            if model.layers[layer_idx].is_linear_layer():
+                return layer_idx
+
+        raise NameError('Not support yet!')
+
+
     def __update_new_weights_and_bias(self, new_model, opt, repair_layer, repair_neuron, num_weights):
         # opt.write('model.sol')
+        next_layer = self.__get_next_layer(new_model, repair_layer)
 
         for idx in range(num_weights):
             var = opt.getVarByName('w' + str(idx))
-            new_model.layers[repair_layer + 2].weights[repair_neuron,idx] = var.x
+            new_model.layers[next_layer].weights[repair_neuron,idx] = var.x
+
+        new_model.memo.clear()
 
 
     def __clean_backdoor(self, model, valid_x0s_with_bd, succ_atk_cnt, trigger, mask, spec):
@@ -145,7 +160,7 @@ class BackDoorRepairImpl():
         time_limit = spec['time_limit']
 
         pathX, pathY = spec['pathX'], spec['pathY']
-        y0s = np.array(ast.literal_eval(read(pathY)))
+        y0s = load_dataset(pathX, pathY=pathY).labels
     
         print('\nBegin cleansing')
         
@@ -153,6 +168,10 @@ class BackDoorRepairImpl():
 
         ie_ave_matrix = []
 
+        # the layers before do_layer are computed once for all interventions
+        act_cache = ActivationCache(model, np.array([x_bd for x0, x_bd, output_x0, output_x_bd in valid_x0s_with_bd]))
+        act_cache.preload([i for i in range(number_of_layers - 1) if model.layers[i].is_linear_layer()])
+
         for do_layer in range(number_of_layers - 1): # not consider the last layer
 
             if model.layers[do_layer].is_linear_layer():
@@ -160,7 +179,7 @@ class BackDoorRepairImpl():
 
                 for do_neuron in range(number_of_neurons):
                     start = time.time()
-                    ie, min_val, max_val = self.get_ie_do_h_dy(model, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron)
+                    ie, min_val, max_val = self.get_ie_do_h_dy(act_cache, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron)
                     end = time.time()
 
                     print('time = {}'.format(end - start))
@@ -186,7 +205,7 @@ class BackDoorRepairImpl():
             repair_layers.append(int(ie_ave_matrix[i][1]))
             repair_neurons.append(int(ie_ave_matrix[i][2]))
         
-        print('\nRepair layers: {}'.format(repair_layers))
+        print('\nRepair layers: {}'.format([model.get_spec_layer_idx(layer) for layer in repair_layers]))
         print('Repair neurons: {}'.format(repair_neurons))
 
         min_weight, max_weight = self.__collect_min_max_value(model)
@@ -196,7 +215,7 @@ class BackDoorRepairImpl():
         for repair_layer, repair_neuron in list(zip(repair_layers, repair_neurons)):
             if not model.layers[repair_layer].is_linear_layer(): assert False
 
-            print('\nRepair layer: {}'.format(repair_layer))
+            print('\nRepair layer: {}'.format(model.get_spec_layer_idx(repair_layer)))
             print('Repair neuron: {}'.format(repair_neuron))
             
             for i in range(num_repair):        
@@ -222,7 +241,7 @@ class BackDoorRepairImpl():
                     print('Optimal')
                     
                     new_model = model.copy()
-                    num_weights = model.layers[repair_layer + 2].get_number_neurons()
+                    num_weights = model.layers[self.__get_next_layer(model, repair_layer)].get_number_neurons()
                     
                     self.__update_new_weights_and_bias(new_model, opt, repair_layer, repair_neuron, num_weights)
      
@@ -300,8 +319,10 @@ class BackDoorRepairImpl():
         prob = open(filename, 'w')
 
         # fix outgoing weights
-        num_weights = model.layers[repair_layer + 2].get_number_neurons()
-        old_weights = model.layers[repair_layer + 2].weights[repair_neuron,:].copy()
+        next_layer = self.__get_next_layer(model, repair_layer)
+
+        num_weights = model.layers[next_layer].get_number_neurons()
+        old_weights = model.layers[next_layer].weights[repair_neuron,:].copy()
 
         prob.write('Minimize\n')
         self.__write_objective(prob, num_weights, old_weights)
@@ -315,10 +336,10 @@ class BackDoorRepairImpl():
         # original input
         for x_0, _, output_x0, _ in sample_x0s_with_bd:
             # compute input up to the next layer
-            input_repair = model.apply_to(x_0, repair_layer + 2).reshape(-1)
+            input_repair = model.apply_to(x_0, next_layer).reshape(-1)
             y0 = np.argmax(output_x0)
 
-            lw_list, up_list, num_bins = self.__write_constr(prob, model, input_repair, repair_layer, repair_neuron,
+            lw_list, up_list, num_bins = self.__write_constr(prob, model, input_repair, next_layer, repair_neuron,
                 min_weight, max_weight, cnt_imgs, y0)
 
             if num_bins > 0: has_bins = True
@@ -332,10 +353,10 @@ class BackDoorRepairImpl():
         # input with backdoor
         for _, x_bd, output_x0, _ in sample_x0s_with_bd:
             # compute input up to the next layer
-            input_repair = model.apply_to(x_bd, repair_layer + 2).reshape(-1)
+            input_repair = model.apply_to(x_bd, next_layer).reshape(-1)
             y0 = np.argmax(output_x0)
 
-            lw_list, up_list, num_bins = self.__write_constr(prob, model, input_repair, repair_layer, repair_neuron,
+            lw_list, up_list, num_bins = self.__write_constr(prob, model, input_repair, next_layer, repair_neuron,
                 min_weight, max_weight, cnt_imgs, y0)
 
             if num_bins > 0: has_bins = True
@@ -469,7 +490,7 @@ class BackDoorRepairImpl():
         return lw_layer, up_layer, num_bins
 
 
-    def __write_constr(self, prob, model, input_repair, repair_layer, repair_neuron,
+    def __write_constr(self, prob, model, input_repair, next_layer, repair_neuron,
             min_weight, max_weight, cnt_imgs, y0):
         lw_list, up_list = [], []
         lw_input, up_input = [], []
@@ -485,7 +506,7 @@ class BackDoorRepairImpl():
         curr_var_idx = len(input_repair)
         prev_var_idx = 0
 
-        for layer_idx in range(repair_layer + 2, len(model.layers)):
+        for layer_idx in range(next_layer, len(model.layers)):
             layer = model.layers[layer_idx]
             lw_layer, up_layer = [], []
 
@@ -496,7 +517,7 @@ class BackDoorRepairImpl():
                 number_of_neurons = layer.get_number_neurons()
 
                 # next linear layer
-                if layer_idx == repair_layer + 2:
+                if layer_idx == next_layer:
                     lw_prev, up_prev = lw_list[-1], up_list[-1]
                     lw_layer, up_layer = self.__write_constr_next_layer(prob, repair_neuron, number_of_neurons, lw_prev, up_prev,
                                             weights, bias, min_weight, max_weight, cnt_imgs, prev_var_idx, curr_var_idx)                 
@@ -532,22 +553,10 @@ class BackDoorRepairImpl():
         return flat_lw_list, flat_up_list, num_bins
 
 
-    def get_ie_do_h_dy(self, model, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron):
+    def get_ie_do_h_dy(self, act_cache, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron):
         # get value range of given hidden neuron
-
-        hidden_max, hidden_min = None, None
-
-        for x0, x_bd, output_x0, output_x_bd in valid_x0s_with_bd:
-            _, hidden = model.apply_get_h(x_bd, do_layer, do_neuron)
-
-            if hidden_max is None:
-                hidden_max = hidden
-                hidden_min = hidden
-            else:
-                if hidden > hidden_max:
-                    hidden_max = hidden
-                if hidden < hidden_min:
-                    hidden_min = hidden
+        hidden = act_cache.get(do_layer)[:, do_neuron]
+        hidden_max, hidden_min = np.max(hidden), np.min(hidden)
 
         # now we have hidden_min and hidden_max
 
@@ -557,7 +566,7 @@ class BackDoorRepairImpl():
             ie = [hidden_min] * num_step
         else:
             for h_val in np.linspace(hidden_min, hidden_max, num_step):
-                dy = self.get_dy_do_h(model, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron, h_val)
+                dy = self.get_dy_do_h(act_cache, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron, h_val)
                 ie.append(dy)
 
         return ie, hidden_min, hidden_max
@@ -565,26 +574,23 @@ class BackDoorRepairImpl():
     #
     # get expected value of y with hidden neuron intervention
     #
-    def get_dy_do_h(self, model, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron, do_value):
-        dy_sum = 0.0
+    def get_dy_do_h(self, act_cache, valid_x0s_with_bd, trigger, mask, target, do_layer, do_neuron, do_value):
+        output_do = act_cache.intervene(do_layer, do_neuron, do_value)
+        output_x_bd = np.array([output_x_bd for x0, x_bd, output_x0, output_x_bd in valid_x0s_with_bd])
 
-        for x0, x_bd, output_x0, output_x_bd in valid_x0s_with_bd:
-            output_do = model.apply_intervention(x_bd, do_layer, do_neuron, do_value).reshape(-1)
+        dy = np.abs(output_x_bd[:, target] - output_do[:, target])
 
-            dy = abs(output_x_bd[target] - output_do[target])
-            dy_sum = dy_sum + dy
-
-        avg = dy_sum / len(valid_x0s_with_bd)
+        avg = np.sum(dy) / len(valid_x0s_with_bd)
 
         return avg
 
 
     def __get_valid_x0s(self, model, total_imgs, y0s, path, target):
         valid_x0s = []
+        data = load_dataset(path)
 
         for i in range(total_imgs):
-            pathX = path + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(pathX)))
+            x0 = data[i]
 
             output_x0 = model.apply(x0).reshape(-1)
             y0 = np.argmax(output_x0)
@@ -625,29 +631,31 @@ class BackDoorRepairImpl():
 
 
     def __attack(self, model, valid_x0s, target, dataset):
-        def obj_func(x, model, valid_x0s, target, length, half_len):
-            res, lam = 0.0, 1.0 if len(valid_x0s) >= 100 else 0.1
+        def loss(outputs, target):
+            target_score = outputs[:, target]
 
-            for x0, output_x0 in valid_x0s:
-                trigger = x[:half_len] # trigger
-                mask = x[half_len:] # mask
-                
-                xi = (1 - mask) * x0 + mask * trigger
+            outputs_no_target = outputs - np.eye(outputs.shape[1])[target] * 1e9
+            max_score = np.max(outputs_no_target, axis=1)
 
-                output = model.apply(xi).reshape(-1)
-                target_score = output[target]
+            return np.sum(np.where(target_score > max_score, 0, max_score - target_score + 1e-9))
 
-                output_no_target = output - np.eye(len(output))[target] * 1e9
-                max_score = np.max(output_no_target)
+        def obj_func(x, model, x0s, target, length, half_len):
+            # all the inputs with the trigger are run as one batch and the gradients
+            # of the trigger and the mask are summed over them
+            lam = 1.0 if len(x0s) >= 100 else 0.1
 
-                if target_score > max_score:
-                    res += 0
-                else:
-                    res += max_score - target_score + 1e-9
+            trigger = x[:half_len] # trigger
+            mask = x[half_len:] # mask
+
+            xs = (1 - mask) * x0s + mask * trigger
+
+            res, g = model.value_and_grad(xs, lambda outputs: loss(outputs, target))
 
             res += lam * np.sum(mask)
+            g_trigger = np.sum(g * mask, axis=0)
+            g_mask = np.sum(g * (trigger - x0s), axis=0) + lam
 
-            return res
+            return res, np.concatenate([g_trigger, g_mask])
 
         if dataset == 'mnist':
             length = 2 * 28 * 28
@@ -664,11 +672,12 @@ class BackDoorRepairImpl():
 
         x = np.zeros(length)
 
-        args = (model, valid_x0s, target, length, half_len)
-        jac = grad(obj_func)
+        x0s = np.array([x0 for x0, output_x0 in valid_x0s])
+
+        args = (model, x0s, target, length, half_len)
         bounds = Bounds(lw, up)
 
-        res = minimize(obj_func, x, args=args, jac=jac, bounds=bounds)
+        res = minimize(obj_func, x, args=args, jac=True, bounds=bounds)
         # print('res.fun = {}'.format(res.fun))
 
         return res.x
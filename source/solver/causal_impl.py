@@ -11,6 +11,8 @@ import time
 import pyswarms as ps
 import matplotlib.pyplot as plt
 from solver.dtmc_impl import DTMCImpl
+from model.lib_models import ActivationCache
+from dataset import load_dataset
 #import lib_models
 
 class CausalImpl():
@@ -29,6 +31,7 @@ class CausalImpl():
         self.stepsize = 16      # step size for intervension
         self.do_layer = []
         self.do_neuron = []
+        self.spec_layer = {}    # index in the spec of each do layer
         self.r_layer = []
         self.r_neuron = []
         self.best_pos = []
@@ -45,6 +48,7 @@ class CausalImpl():
         self.delta = 0.1   # confidence
         self.plot = False   # plot figures?
         self.dbgmsg = False
+        self.act_caches = None  # activations of di data
 
     def gaussian(self, mu, sigma):
         return np.random.normal(mu, np.sqrt(sigma))
@@ -117,10 +121,12 @@ class CausalImpl():
             self.resultpath = spec['resultpath']
 
         if 'do_layer' in spec:
-            self.do_layer = np.array(ast.literal_eval(read(spec['do_layer'])))
+            do_layer = ast.literal_eval(read(spec['do_layer']))
+            self.do_layer = np.array(model.get_layer_idxs(do_layer))
+            self.spec_layer = dict(zip(self.do_layer, do_layer))
 
         if 'do_neuron' in spec:
-            self.do_neuron = np.array(ast.literal_eval(read(spec['do_neuron'])))
+            self.do_neuron = read_array(spec['do_neuron'])
 
         if 'error' in spec:
             self.error = (spec['error'])
@@ -192,7 +198,7 @@ class CausalImpl():
                 ax[row, col].set_ylabel('Causal Attributions(ACE)')
 
                 # Baseline is np.mean(expectation_do_x)
-                ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(do_layer) + '_' + str(do_neuron), color='b')
+                ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(self.get_spec_layer(do_layer)) + '_' + str(do_neuron), color='b')
                 ax[row, col].legend()
 
                 row = row + 1
@@ -239,7 +245,7 @@ class CausalImpl():
 
         # get sensitive feature details
         if 'fairness' in spec:
-            self.sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            self.sensitive = read_array(spec['fairness'])
 
         if 'sens_cluster' in spec:
             self.sens_cluster = ast.literal_eval(read(spec['sens_cluster']))
@@ -323,7 +329,7 @@ class CausalImpl():
                     ax[row, col].set_ylabel('Causal Attributions(ACE)')
 
                     # Baseline is np.mean(expectation_do_x)
-                    ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(do_layer) + '_' + str(do_neuron), color='b')
+                    ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(self.get_spec_layer(do_layer)) + '_' + str(do_neuron), color='b')
                     ax[row, col].legend()
 
                     row = row + 1
@@ -355,7 +361,7 @@ class CausalImpl():
                 print(ie_l)
 
         for item in ie_ave_matrix:
-            self.debug_print(item)
+            self.debug_print([item[0], self.get_spec_layer(item[1]), item[2]])
         ie_ave_matrix.sort()
         ie_ave_matrix = ie_ave_matrix[::-1]
 
@@ -403,7 +409,7 @@ class CausalImpl():
 
         print('Repair:')
 
-        print('\nRepair layer: {}'.format(self.r_layer))
+        print('\nRepair layer: {}'.format([self.get_spec_layer(layer) for layer in self.r_layer]))
         print('Repair neuron: {}'.format(self.r_neuron))
 
         # start repair
@@ -444,7 +450,7 @@ class CausalImpl():
 
         # get sensitive feature details
         if 'fairness' in spec:
-            self.sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            self.sensitive = read_array(spec['fairness'])
 
         if 'sens_cluster' in spec:
             self.sens_cluster = ast.literal_eval(read(spec['sens_cluster']))
@@ -502,7 +508,7 @@ class CausalImpl():
         ie_ave_matrix.sort()
         ie_ave_matrix = ie_ave_matrix[::-1]
         for item in ie_ave_matrix:
-            self.debug_print(item)
+            self.debug_print([item[0], self.get_spec_layer(item[1]), item[2]])
 
         self.r_neuron = []
         self.r_layer = []
@@ -547,7 +553,7 @@ class CausalImpl():
 
         print('Repair:')
 
-        print('\nRepair layer: {}'.format(self.r_layer))
+        print('\nRepair layer: {}'.format([self.get_spec_layer(layer) for layer in self.r_layer]))
         print('Repair neuron: {}'.format(self.r_neuron))
 
         # start repair
@@ -585,7 +591,7 @@ class CausalImpl():
 
         # get sensitive feature details
         if 'fairness' in spec:
-            self.sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            self.sensitive = read_array(spec['fairness'])
 
         if 'class_n' in spec:
             self.class_n = spec['class_n']
@@ -636,7 +642,7 @@ class CausalImpl():
             ie_ave_matrix.sort()
             ie_ave_matrix = ie_ave_matrix[::-1]
             for item in ie_ave_matrix:
-                self.debug_print(item)
+                self.debug_print([item[0], self.get_spec_layer(item[1]), item[2]])
 
             self.r_neuron = []
             self.r_layer = []
@@ -646,7 +652,7 @@ class CausalImpl():
 
             print('Repair:')
 
-            print('\nRepair layer: {}'.format(self.r_layer))
+            print('\nRepair layer: {}'.format([self.get_spec_layer(layer) for layer in self.r_layer]))
             print('Repair neuron: {}'.format(self.r_neuron))
 
             # start repair
@@ -689,12 +695,12 @@ class CausalImpl():
                     ie_ave_l.append(np.mean(np.array(ie)))
 
                     # plot ACE
-                    ax[row, col].set_title('N_' + str(do_layer) + '_' + str(do_neuron))
+                    ax[row, col].set_title('N_' + str(self.get_spec_layer(do_layer)) + '_' + str(do_neuron))
                     ax[row, col].set_xlabel('Intervention Value(alpha)')
                     ax[row, col].set_ylabel('Causal Attributions(ACE)')
 
                     # Baseline is np.mean(expectation_do_x)
-                    ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(do_layer) + '_' + str(do_neuron), color='b')
+                    ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(self.get_spec_layer(do_layer)) + '_' + str(do_neuron), color='b')
                     ax[row, col].legend()
 
                     row = row + 1
@@ -738,7 +744,7 @@ class CausalImpl():
 
         # get sensitive feature details
         if 'fairness' in spec:
-            self.sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            self.sensitive = read_array(spec['fairness'])
 
         if 'class_n' in spec:
             self.class_n = spec['class_n']
@@ -818,7 +824,7 @@ class CausalImpl():
                     ax[row, col].set_ylabel('Causal Attributions(ACE)')
 
                     # Baseline is np.mean(expectation_do_x)
-                    ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(do_layer) + '_' + str(do_neuron), color='b')
+                    ax[row, col].plot(np.linspace(min, max, self.stepsize), np.array(ie) - np.mean(np.array(ie)), label = str(self.get_spec_layer(do_layer)) + '_' + str(do_neuron), color='b')
                     ax[row, col].legend()
 
                     row = row + 1
@@ -860,7 +866,7 @@ class CausalImpl():
             self.r_layer.append(int(ie_ave_matrix[i][1]))
             self.r_neuron.append(int(ie_ave_matrix[i][2]))
 
-        print('\nRepair layer: {}'.format(self.r_layer))
+        print('\nRepair layer: {}'.format([self.get_spec_layer(layer) for layer in self.r_layer]))
         print('Repair neuron: {}'.format(self.r_neuron))
 
         # start repair
@@ -894,39 +900,40 @@ class CausalImpl():
         print('Total execution time(s): {}'.format(time.time() - overall_starttime))
 
     #
-    # get expected value of y with hidden neuron intervention
+    # get activation caches of di data, keyed by the value of the sensitive feature
+    # (None for the original data), so interventions only run the suffix of the network
     #
-    def get_y_do_h(self, do_layer, do_neuron, do_value, class_n):
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
+    def get_act_cache(self, sens_idx=None, sens_val=None):
+        if self.act_caches is None:
+            xs = load_dataset(self.datapath).get_batch(range(self.datalen))
 
-        #y0s = np.array(ast.literal_eval(read(pathY)))
+            self.act_caches = dict()
+            self.act_caches[None] = ActivationCache(self.model, xs)
 
-        #l_pass = 0
-        #l_fail = 0
+        key = None if sens_val is None else (sens_idx, sens_val)
 
-        y_sum = 0.0
+        if key not in self.act_caches:
+            xs = self.act_caches[None].get(-1).reshape(self.datalen, -1).copy()
+            xs[:, sens_idx] = sens_val
+            self.act_caches[key] = ActivationCache(self.model, xs)
 
-        for i in range(self.datalen):
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
+        return self.act_caches[key]
 
-            y = self.model.apply_intervention(x0, do_layer, do_neuron, do_value)[0][class_n]
-
-            #lbl_x0 = np.argmax(y, axis=1)[0]
-
-            y_sum = y_sum + y
+    #
+    # get value range of given hidden neuron
+    #
+    def get_h_range(self, do_layer, do_neuron):
+        hidden = self.get_act_cache().get(do_layer)[:, do_neuron]
 
-            # accuracy test
-            #if lbl_x0 == y0s[i]:
-            #    l_pass = l_pass + 1
-            #else:
-            #    l_fail = l_fail + 1
-        #acc = l_pass / (l_pass + l_fail)
+        return np.min(hidden), np.max(hidden)
 
-        avg = y_sum / self.datalen
+    #
+    # get expected value of y with hidden neuron intervention
+    #
+    def get_y_do_h(self, do_layer, do_neuron, do_value, class_n):
+        y = self.get_act_cache().intervene(do_layer, do_neuron, do_value)[:, class_n]
 
-        #self.debug_print("Accuracy of network: %f.\n" % (acc))
+        avg = np.sum(y) / self.datalen
 
         return avg
 
@@ -934,42 +941,16 @@ class CausalImpl():
     # get expected value of y with hidden neuron intervention
     #
     def get_dy_do_h(self, do_layer, do_neuron, do_value, class_n, sens_idx, sens_range):
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
-
-        #y0s = np.array(ast.literal_eval(read(pathY)))
+        y = self.get_act_cache().intervene(do_layer, do_neuron, do_value)[:, class_n]
 
-        #l_pass = 0
-        #l_fail = 0
-
-        dy_sum = 0.0
-
-        for i in range(self.datalen):
-            # random index
-            #i = int(np.random.rand() * self.datalen_tot)
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
+        max_dy = np.zeros(self.datalen)
+        for sens_val in self.sens_value:
+            # data with the same sensitive value give diff_n = 0
+            y_n = self.get_act_cache(sens_idx, sens_val).intervene(do_layer, do_neuron, do_value)[:, class_n]
+            diff_n = np.abs(y_n - y)
+            max_dy = np.maximum(max_dy, diff_n)
 
-            y = self.model.apply_intervention(x0, do_layer, do_neuron, do_value)
-            #lbl_x0 = np.argmax(y, axis=1)[0]
-
-            y = y[0][class_n]
-
-            max_dy = 0.0
-            x_n = x0
-            for sens_val in self.sens_value:
-                if sens_val == x0[sens_idx]:
-                    continue
-                x_n[sens_idx] = sens_val
-                y_n = self.model.apply_intervention(x_n, do_layer, do_neuron, do_value)
-                y_n = y_n[0][class_n]
-                diff_n = np.abs(y_n - y)
-                if max_dy < diff_n:
-                    max_dy = diff_n
-
-            dy_sum = dy_sum + max_dy
-
-        avg = dy_sum / self.datalen
+        avg = np.sum(max_dy) / self.datalen
 
         return avg
 
@@ -978,43 +959,16 @@ class CausalImpl():
     # get expected value of dy with weight intervention
     #
     def get_dy_do_w(self, do_layer, do_neuron, do_value, class_n, sens_idx, sens_range):
-        pathX = self.datapath + '/'
-        #pathY = self.datapath + '/labels.txt'
-
-        #y0s = np.array(ast.literal_eval(read(pathY)))
-
-        #l_pass = 0
-        #l_fail = 0
+        y = self.get_act_cache().scale(do_layer, do_neuron, do_value)[:, class_n]
 
-        dy_sum = 0.0
+        max_dy = np.zeros(self.datalen)
+        for sens_val in self.sens_value:
+            # data with the same sensitive value give diff_n = 0
+            y_n = self.get_act_cache(sens_idx, sens_val).scale(do_layer, do_neuron, do_value)[:, class_n]
+            diff_n = np.abs(y_n - y)
+            max_dy = np.maximum(max_dy, diff_n)
 
-        for i in range(self.datalen):
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
-
-            #y = self.model.apply_intervention(x0, do_layer, do_neuron, do_value)
-            y = self.model.apply_repair_fixed(x0, [do_neuron], [do_value], [do_layer])
-            #y = self.model.apply(x0)
-            #lbl_x0 = np.argmax(y, axis=1)[0]
-
-            y = y[0][class_n]
-
-            max_dy = 0.0
-            x_n = x0
-            for sens_val in self.sens_value:
-                if sens_val == x0[sens_idx]:
-                    continue
-                x_n[sens_idx] = sens_val
-                y_n = self.model.apply_repair_fixed(x_n, [do_neuron], [do_value], [do_layer])
-                #y_n = self.model.apply(x_n)
-                y_n = y_n[0][class_n]
-                diff_n = np.abs(y_n - y)
-                if max_dy < diff_n:
-                    max_dy = diff_n
-
-            dy_sum = dy_sum + max_dy
-
-        avg = dy_sum / self.datalen
+        avg = np.sum(max_dy) / self.datalen
 
         return avg
 
@@ -1033,28 +987,7 @@ class CausalImpl():
     #
     def get_ie_do_h(self, do_layer, do_neuron, num_step=16, class_n=0):
         # get value range of given hidden neuron
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
-
-        #y0s = np.array(ast.literal_eval(read(pathY)))
-
-        hidden_max = 0.0
-        hidden_min = 0.0
-
-        for i in range(self.datalen):
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
-
-            y, hidden = self.model.apply_get_h(x0, do_layer, do_neuron)
-
-            if i == 0:
-                hidden_max = hidden
-                hidden_min = hidden
-            else:
-                if hidden > hidden_max:
-                    hidden_max = hidden
-                if hidden < hidden_min:
-                    hidden_min = hidden
+        hidden_min, hidden_max = self.get_h_range(do_layer, do_neuron)
 
         # now we have hidden_min and hidden_max
 
@@ -1064,8 +997,8 @@ class CausalImpl():
             ie = [hidden_min] * num_step
         else:
             for h_val in np.linspace(hidden_min, hidden_max, num_step):
-                y = self.get_y_do_h(do_layer, do_neuron, h_val)
-                ie.append(y[0][class_n])
+                y = self.get_y_do_h(do_layer, do_neuron, h_val, class_n)
+                ie.append(y)
 
         return ie, hidden_min, hidden_max
 
@@ -1074,28 +1007,7 @@ class CausalImpl():
     #
     def get_ie_do_h_single(self, sample, do_layer, do_neuron, num_step=16, class_n=0):
         # get value range of given hidden neuron
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
-
-        y0s = np.array(ast.literal_eval(read(pathY)))
-
-        hidden_max = 0.0
-        hidden_min = 0.0
-
-        for i in range(self.datalen):
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
-
-            y, hidden = self.model.apply_get_h(x0, do_layer, do_neuron)
-
-            if i == 0:
-                hidden_max = hidden
-                hidden_min = hidden
-            else:
-                if hidden > hidden_max:
-                    hidden_max = hidden
-                if hidden < hidden_min:
-                    hidden_min = hidden
+        hidden_min, hidden_max = self.get_h_range(do_layer, do_neuron)
 
         # now we have hidden_min and hidden_max
 
@@ -1115,31 +1027,7 @@ class CausalImpl():
     #
     def get_ie_do_h_dy(self, do_layer, do_neuron, sens_idx, sens_range, num_step=16, class_n=0):
         # get value range of given hidden neuron
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
-
-        #y0s = np.array(ast.literal_eval(read(pathY)))
-
-        hidden_max = 0.0
-        hidden_min = 0.0
-
-        for i in range(self.datalen):
-            # random index
-            #i = int(np.random.rand() * self.datalen_tot)
-
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
-
-            y, hidden = self.model.apply_get_h(x0, do_layer, do_neuron)
-
-            if i == 0:
-                hidden_max = hidden
-                hidden_min = hidden
-            else:
-                if hidden > hidden_max:
-                    hidden_max = hidden
-                if hidden < hidden_min:
-                    hidden_min = hidden
+        hidden_min, hidden_max = self.get_h_range(do_layer, do_neuron)
 
         # now we have hidden_min and hidden_max
 
@@ -1159,31 +1047,7 @@ class CausalImpl():
     #
     def get_ie_do_h_dy_gradient(self, do_layer, do_neuron, sens_idx, sens_range, num_step=16, class_n=0):
         # get value range of given hidden neuron
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
-
-        #y0s = np.array(ast.literal_eval(read(pathY)))
-
-        hidden_max = 0.0
-        hidden_min = 0.0
-
-        for i in range(self.datalen):
-            # random index
-            #i = int(np.random.rand() * self.datalen_tot)
-
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
-
-            y, hidden = self.model.apply_get_h(x0, do_layer, do_neuron)
-
-            if i == 0:
-                hidden_max = hidden
-                hidden_min = hidden
-            else:
-                if hidden > hidden_max:
-                    hidden_max = hidden
-                if hidden < hidden_min:
-                    hidden_min = hidden
+        hidden_min, hidden_max = self.get_h_range(do_layer, do_neuron)
 
         # now we have hidden_min and hidden_max
 
@@ -1207,12 +1071,6 @@ class CausalImpl():
     # for each weight, randomly pick n number of samples to estimate the ie
     #
     def get_ie_do_w_dy(self, do_layer, do_neuron, sens_idx, sens_range, num_step=16, class_n=0):
-        # get value range of given hidden neuron
-        pathX = self.datapath + '/'
-        #pathY = self.datapath + '/labels.txt'
-
-        #y0s = np.array(ast.literal_eval(read(pathY)))
-
         # compute interventional expectation for each step
         ie = []
         for w_val in np.linspace(-1.0, 1.0, num_step):
@@ -1222,84 +1080,42 @@ class CausalImpl():
         return ie, -1.0, 1.0
 
     def net_accuracy_test(self, r_neuron=0, r_weight=0, r_layer=0):
-        pathX = self.acc_datapath + '/'
-        pathY = self.acc_datapath + '/labels.txt'
+        # random indexes
+        idxs = [int(np.random.rand() * self.acc_datalen_tot) for idx in range(self.acc_datalen)]
 
-        y0s = np.array(ast.literal_eval(read(pathY)))
+        return self.net_accuracy_batch(idxs, r_neuron, r_weight, r_layer)
 
-        l_pass = 0
-        l_fail = 0
+    def net_accuracy_batch(self, idxs, r_neuron, r_weight, r_layer):
+        data = load_dataset(self.acc_datapath, pathY=self.acc_datapath + '/labels.txt')
 
-        for idx in range(self.acc_datalen):
-            
-            # random index
-            i = int(np.random.rand() * self.acc_datalen_tot)
-            
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
-            if len(r_neuron) != 0:
-                y = self.model.apply_repair_fixed(x0, r_neuron, r_weight, r_layer)
-            else:
-                y = self.model.apply(x0)
-
-            lbl_x0 = np.argmax(y, axis=1)[0]
-            #print('lbl:{}, predict:{}'.format(y0s[i], lbl_x0))
-
-            # accuracy test
-            if lbl_x0 == y0s[i]:
-                l_pass = l_pass + 1
-            else:
-                l_fail = l_fail + 1
-        acc = l_pass / (l_pass + l_fail)
+        x0s = data.get_batch(idxs)
+        y0s = data.labels
+
+        if len(r_neuron) != 0:
+            func = lambda xs: self.model.apply_repair_batch(xs, r_neuron, r_weight, r_layer)
+            ys = self.model.apply_many(x0s, func)
+        else:
+            ys = self.model.apply_many(x0s)
+
+        # accuracy test
+        l_pass = np.sum(np.argmax(ys, axis=1) == y0s[idxs])
+        acc = l_pass / len(idxs)
 
         #self.debug_print("Accuracy of network: %f.\n" % (acc))
 
         return acc
 
     def net_accuracy_test_fix(self, r_neuron=0, r_weight=0, r_layer=0):
-        pathX = self.acc_datapath + '/'
-        pathY = self.acc_datapath + '/labels.txt'
-
-        y0s = np.array(ast.literal_eval(read(pathY)))
-
-        l_pass = 0
-        l_fail = 0
-
-        for i in range(self.acc_datalen):
-
-            # random index
-            #i = int(np.random.rand() * self.acc_datalen_tot)
-
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
-            if len(r_neuron) != 0:
-                y = self.model.apply_repair_fixed(x0, r_neuron, r_weight, r_layer)
-            else:
-                y = self.model.apply(x0)
-
-            lbl_x0 = np.argmax(y, axis=1)[0]
-            # print('lbl:{}, predict:{}'.format(y0s[i], lbl_x0))
-
-            # accuracy test
-            if lbl_x0 == y0s[i]:
-                l_pass = l_pass + 1
-            else:
-                l_fail = l_fail + 1
-        acc = l_pass / (l_pass + l_fail)
-
-        # self.debug_print("Accuracy of network: %f.\n" % (acc))
-
-        return acc
+        return self.net_accuracy_batch(list(range(self.acc_datalen)), r_neuron, r_weight, r_layer)
     #
     #   test repair of discriminative instances
     #   @weight: array of fixed weight
     # def get_dy_do_h(self, do_layer, do_neuron, do_value, class_n, sens_idx, sens_range):
 
     def net_fairness_test(self, weight, layer, neuron, class_n, sens_idx, sens_range):
-        pathX = self.datapath + '/'
         pathY = self.datapath + '/labels.txt'
 
-        # y0s = np.array(ast.literal_eval(read(pathY)))
+        # y0s = read_array(pathY)
 
         # l_pass = 0
         # l_fail = 0
@@ -1312,8 +1128,7 @@ class CausalImpl():
             # random index
             i = int(np.random.rand() * self.datalen_tot)
 
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
+            x0 = load_dataset(self.datapath)[i]
 
             y = self.model.apply_repair_fixed(x0, neuron, weight, layer)
 
@@ -1404,6 +1219,10 @@ class CausalImpl():
         if self.sens_analysis and self.dbgmsg:
             print(x)
 
+    def get_spec_layer(self, layer):
+        # the layers are reported by their index in the spec, not in the optimized model
+        return int(self.spec_layer.get(layer, layer))
+
     def debug_print(self, x):
         if self.dbgmsg:
             print(x)
@@ -7,6 +7,7 @@ from autograd import grad
 import os.path
 from os import path
 from utils import *
+from dataset import load_dataset
 import time
 import pyswarms as ps
 
@@ -35,6 +36,7 @@ class DTMCImpl():
         self.feature_cluster = None
         self.intermediate_layers = []  # intermediate layers to analyze
         self.intermediate_layer = None   # current intermediate layer to analyze
+        self.spec_layer = {}    # index in the spec of each intermediate layer
         self.neurons = []  # neuron index at intermediate layer to analyze
         self.neuron = None  # current neuron index at intermediate layer analyzing
         self.hidden_cluster = 2
@@ -78,7 +80,7 @@ class DTMCImpl():
         spec = assertion
 
         if 'fairness' in spec:
-            self.sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            self.sensitive = read_array(spec['fairness'])
         if 'sens_cluster' in spec:
             self.sens_cluster = ast.literal_eval(read(spec['sens_cluster']))
 
@@ -160,10 +162,10 @@ class DTMCImpl():
         print('\nOther Feature Analysis:')
         diff_matrix = []
         if 'feature' in spec:
-            other_features = np.array(ast.literal_eval(read(spec['feature'])))
+            other_features = read_array(spec['feature'])
             feature_clusters = np.array([])
             if 'feature_cluster' in spec:
-                feature_clusters = np.array(ast.literal_eval(read(spec['feature_cluster'])))
+                feature_clusters = read_array(spec['feature_cluster'])
             max_diff = 0.0
             max_feature = other_features[0]
 
@@ -175,7 +177,7 @@ class DTMCImpl():
                 else:
                     self.feature_cluster = feature_clusters[idx]
 
-                #self.feature = np.array(ast.literal_eval(read(spec['feature'])))
+                #self.feature = read_array(spec['feature'])
                 self.starttime = time.time()
                 print('Other feature: {}'.format(self.feature))
 
@@ -216,13 +218,15 @@ class DTMCImpl():
 
         # other neurons
         if 'intermediate' in spec:
-            self.intermediate_layers = np.array(ast.literal_eval(read(spec['intermediate'])))
+            intermediate_layers = ast.literal_eval(read(spec['intermediate']))
+            self.intermediate_layers = np.array(self.model.get_layer_idxs(intermediate_layers))
+            self.spec_layer = dict(zip(self.intermediate_layers, intermediate_layers))
 
         if 'neurons' in spec:
-            self.neurons = np.array(ast.literal_eval(read(spec['neurons'])))
+            self.neurons = read_array(spec['neurons'])
 
         print('\nHidden Neuron Analysis:')
-        print('Intermediate layers: {}'.format(self.intermediate_layers))
+        print('Intermediate layers: {}'.format([self.get_spec_layer(layer) for layer in self.intermediate_layers]))
         #print('Intermediate neuron index: {}'.format(self.neurons))
 
         diff_matrix_h = []
@@ -232,7 +236,7 @@ class DTMCImpl():
             # iterate for each hidden layer under analysis
             for layer_idx in range (0, len(self.intermediate_layers)):
                 self.intermediate_layer = self.intermediate_layers[layer_idx]
-                print('Intermediate layer: {}'.format(self.intermediate_layer))
+                print('Intermediate layer: {}'.format(self.get_spec_layer(self.intermediate_layer)))
                 # iterate for each neuron at this layer
                 for i in range(0, len(self.neurons[layer_idx])):
                     self.neuron = self.neurons[layer_idx][i]
@@ -260,7 +264,7 @@ class DTMCImpl():
             print('\nSensitivity of each hidden neuron:')
             diff_matrix_h.sort()
             for item in diff_matrix_h:
-                print(item)
+                print([item[0], self.get_spec_layer(item[1]), item[2]])
 
         self.neuron = None
         self.intermediate_layer = None
@@ -295,12 +299,12 @@ class DTMCImpl():
             self.repair_layer.append(int(overall_diff[i][1]))
             self.repair_neuron.append(int(overall_diff[i][2]))
 
-        print('\nRepair layer: {}'.format(self.repair_layer))
+        print('\nRepair layer: {}'.format([self.get_spec_layer(layer) for layer in self.repair_layer]))
         print('Repair neuron: {}'.format(self.repair_neuron))
 
         print('Sensitivity of each neuron:')
         for item in overall_diff:
-            print(item)
+            print([item[0], self.get_spec_layer(item[1]), item[2]])
 
 
         if self.repair == True:
@@ -321,7 +325,7 @@ class DTMCImpl():
             print(optimizer.pos_history)
             # Obtain the velocity history
             #print(optimizer.velocity_history)
-            print('neuron to repair: {} at layter: {}'.format(self.repair_neuron, self.repair_layer))
+            print('neuron to repair: {} at layter: {}'.format(self.repair_neuron, [self.get_spec_layer(layer) for layer in self.repair_layer]))
             print('best cost: {}'.format(best_cost))
             print('best pos: {}'.format(best_pos))
         self.repair = False
@@ -346,21 +350,7 @@ class DTMCImpl():
 
         # output repaired network
 
-        r_weights = []
-        for i in range (0, len(self.model.layers)):
-            if i & 1 != 0:
-                continue
-            else:
-                r_weights.append(self.model.layers[i].get_weight())
-
-        for r_idx in range (0, self.repair_num):
-            r_layer = self.repair_layer[r_idx]
-            r_neuron = self.repair_neuron[r_idx]
-            r_weight = best_pos[r_idx]
-
-            j = int((r_layer + 1) / 2)
-            for i in range (0, len(r_weights[j][0])):
-                r_weights[j][r_neuron][i] = (1 + r_weight) * r_weights[j][r_neuron][i]
+        r_weights = self.get_repaired_weights(best_pos)
 
         if path.exists(self.output_path + '/repair') == False:
             os.mkdir(self.output_path + '/repair')
@@ -401,21 +391,18 @@ class DTMCImpl():
         return result
 
     def net_accuracy_test(self, r_neuron=0, r_weight=0, r_layer=0):
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
-
-        y0s = np.array(ast.literal_eval(read(pathY)))
+        data = load_dataset(self.datapath, pathY=self.datapath + '/labels.txt')
+        y0s = data.labels
 
         l_pass = 0
         l_fail = 0
 
         for i in range(100):
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
+            x0 = data[i]
             if len(r_neuron) != 0:
                 y = self.model.apply_repair(x0, r_neuron, r_weight, r_layer)
             else:
-                y = self.model.apply(x0)
+                y = self.model.apply_memo(x0)
 
             lbl_x0 = np.argmax(y, axis=1)[0]
 
@@ -692,15 +679,19 @@ class DTMCImpl():
         generated = self.step
         out = []
 
+        # outputs of all intermediate layers with one pass over the batch
+        xs = np.array([self.__generate_x(self.model.shape, lower, upper) for _ in range(generated)])
+        ys, records = self.model.apply_taps(xs, self.intermediate_layer)
+        ys = np.argmax(ys, axis=1)
+
         while generated:
-            x = self.__generate_x(self.model.shape, lower, upper)
-            y, layer_op = self.model.apply_intermediate(x)
-            y = np.argmax(y, axis=1)[0]
+            x = xs[self.step - generated]
+            y = ys[self.step - generated]
 
             intermediate_result = []
-            for i in range(0, len(layer_op)):
+            for i in range(0, len(self.model.layers)):
                 if i in self.intermediate_layer:
-                    layer_sign = np.sign(layer_op[i])
+                    layer_sign = np.sign(records[i][self.step - generated : self.step - generated + 1])
 
                     # code into one state: each neuron represendted by 2 bits
                     # TODO: only support positive and non-positive now
@@ -762,18 +753,26 @@ class DTMCImpl():
         y_array = []
 
 
+        xs = np.array([self.__generate_x(self.model.shape, lower, upper) for _ in range(generated)])
+
+        if self.repair == False:
+            if self.neuron != None:
+                ys, records = self.model.apply_taps(xs, [self.intermediate_layer])
+                layer_ops = records[self.intermediate_layer]
+            else:
+                ys = self.model.apply_batch(xs)
+            ys = np.argmax(ys, axis=1)
+
         while generated:
-            x = self.__generate_x(self.model.shape, lower, upper)
+            x = xs[self.step - generated]
             y = 0
             if self.repair == False:
+                y = ys[self.step - generated]
                 if self.neuron != None:
-                    y, layer_op = self.model.apply_intermediate(x, self.intermediate_layer)
-                else:
-                    y = self.model.apply(x)
+                    layer_op = layer_ops[self.step - generated]
             else:
                 y = self.model.apply_repair(x, self.repair_neuron, self.repair_w, self.repair_layer)
-
-            y = np.argmax(y, axis=1)[0]
+                y = np.argmax(y, axis=1)[0]
 
             # hidden neuron
             if self.neuron != None:
@@ -1050,13 +1049,8 @@ class DTMCImpl():
         rolling_average = 0.0
 
         for i in range(num_trials):
-            disc_count = 0
-            total_count = 0
-            for j in range(samples):
-                total_count = total_count + 1
-
-                if (self.aeq_test_new_sample()):
-                    disc_count = disc_count + 1
+            disc_count = np.sum(self.aeq_test_new_samples(samples))
+            total_count = samples
 
             estimate = float(disc_count) / total_count
             rolling_average = ((rolling_average * i) + estimate) / (i + 1)
@@ -1068,30 +1062,55 @@ class DTMCImpl():
         return estimate_array
 
 
-    def aeq_test_new_sample(self):
+    def aeq_test_new_samples(self, samples):
+        # a sample is discriminatory if changing its sensitive feature changes the label;
+        # each sample is repeated for every value of the sensitive feature
         lower = self.model.lower
         upper = self.model.upper
 
-        x = self.__generate_x(self.model.shape, lower, upper)
-        y = np.argmax(self.model.apply(x), axis=1)[0]
-        x_g = x
+        xs = np.array([self.__generate_x(self.model.shape, lower, upper) for j in range(samples)])
+        ys = np.argmax(self.model.apply_many(xs), axis=1)
 
         sensitive_feature = self.sensitive[0]
-        sens_range = upper[sensitive_feature] - lower[sensitive_feature] + 1
+        vals = np.arange(int(lower[sensitive_feature]), int(upper[sensitive_feature]) + 1)
+
+        xs_g = np.repeat(xs, len(vals), axis=0)
+        xs_g[:, sensitive_feature] = np.tile(vals, samples)
+
+        ys_g = np.argmax(self.model.apply_many(xs_g), axis=1).reshape(samples, len(vals))
 
-        for val in range(int(lower[sensitive_feature]), int(upper[sensitive_feature]) + 1):
-            if val != x[sensitive_feature]:
-                x_g[sensitive_feature] = float(val)
-                y_g = np.argmax(self.model.apply(x_g), axis=1)[0]
+        return np.any(ys_g != ys.reshape(-1, 1), axis=1)
 
-                if y != y_g:
-                    return 1
-        return 0
+    def get_repaired_weights(self, best_pos):
+        # the weights of the linear layers with the outgoing weights of the repaired
+        # neurons scaled, on copies, the weights of a binary model are read-only
+        linear_idxs = [i for i in range(len(self.model.layers)) if self.model.layers[i].is_linear_layer()]
+
+        r_weights = []
+        for i in linear_idxs:
+            r_weights.append(self.model.layers[i].get_weight().copy())
+
+        for r_idx in range (0, self.repair_num):
+            r_layer = self.repair_layer[r_idx]
+            r_neuron = self.repair_neuron[r_idx]
+            r_weight = best_pos[r_idx]
+
+            # the weights out of the repaired neuron are those of the first linear layer
+            # after its layer, or of the first linear layer for the inputs (layer 0)
+            j = 0 if r_layer == 0 else np.searchsorted(linear_idxs, r_layer, side='right')
+            for i in range (0, len(r_weights[j][0])):
+                r_weights[j][r_neuron][i] = (1 + r_weight) * r_weights[j][r_neuron][i]
+
+        return r_weights
 
     def detail_print(self, x):
         if self.sens_analysis and self.dbgmsg:
             print(x)
 
+    def get_spec_layer(self, layer):
+        # the layers are reported by their index in the spec, not in the optimized model
+        return int(self.spec_layer.get(layer, layer))
+
     def debug_print(self, x):
         if self.dbgmsg:
             print(x)
@@ -4,6 +4,7 @@ import math
 
 from autograd import grad
 from utils import *
+from dataset import load_dataset
 import time
 import ast
 from scipy import spatial
@@ -95,22 +96,16 @@ class DTMCImpl_rnn():
     def __get_x(self):
         # select x0 randomly from training data
         index = self.data_used
-        data = self.data_path + '/' + str(index) + '.txt'
-        x0 = np.array(ast.literal_eval(read(data)))
-
-        data = self.data_path + '_w/' + str(index) + '.txt'
-        x0_w = np.array(ast.literal_eval(read(data)))
+        x0 = load_dataset(self.data_path, prefix='')[index]
+        x0_w = load_dataset(self.data_path + '_w', prefix='')[index]
 
         return x0, x0_w
 
     def __get_x_random(self):
         # select x0 randomly from training data
         index = np.random.randint(self.data_len)
-        data = self.data_path + '/' + str(index) + '.txt'
-        x0 = np.array(ast.literal_eval(read(data)))
-
-        data = self.data_path + '_w/' + str(index) + '.txt'
-        x0_w = np.array(ast.literal_eval(read(data)))
+        x0 = load_dataset(self.data_path, prefix='')[index]
+        x0_w = load_dataset(self.data_path + '_w', prefix='')[index]
 
         return x0, x0_w
 
@@ -131,7 +126,7 @@ class DTMCImpl_rnn():
             sens_path = (spec['sensitive_path'])
 
             input = open(sens_path, 'r')
-            self.sensitive = np.array(ast.literal_eval(input.readline()))
+            self.sensitive = read_array(input.readline())
             input.close()
 
         if 'data_path' in spec:
@@ -218,10 +213,10 @@ class DTMCImpl_rnn():
 
         # other neurons
         if 'intermediate' in spec:
-            self.intermediate_layer = np.array(ast.literal_eval(read(spec['intermediate'])))
+            self.intermediate_layer = read_array(spec['intermediate'])
 
         if 'neurons' in spec:
-            self.neurons = np.array(ast.literal_eval(read(spec['neurons'])))
+            self.neurons = read_array(spec['neurons'])
 
         if 'repair_number' in spec:
             self.repair_num = spec['repair_number']
@@ -350,18 +345,7 @@ class DTMCImpl_rnn():
 
         # output repaired network
         # output repaired network
-        r_weights = []
-        for i in range (0, len(self.model.layers) - 1):
-            r_weights.append(self.model.layers[i].get_weight())
-
-        for r_idx in range (0, self.repair_num):
-            r_layer = self.repair_layer[r_idx]
-            r_neuron = self.repair_neuron[r_idx]
-            r_weight = best_pos[r_idx]
-
-            j = int((r_layer + 1) / 2)
-            for i in range (0, len(r_weights[j][0])):
-                r_weights[j][r_neuron + 50][i] = (1 + r_weight) * r_weights[j][r_neuron][i]
+        r_weights = self.get_repaired_weights(best_pos)
 
         if path.exists(self.output_path + '/repair') == False:
             os.mkdir(self.output_path + '/repair')
@@ -417,22 +401,19 @@ class DTMCImpl_rnn():
         return prob_diff, accuracy
 
     def net_accuracy_test(self, r_neuron=0, r_weight=0, r_layer=0):
-        pathX = self.datapath + '/'
-        pathY = self.datapath + '/labels.txt'
-
-        y0s = np.array(ast.literal_eval(read(pathY)))
+        data = load_dataset(self.datapath, pathY=self.datapath + '/labels.txt')
+        y0s = data.labels
 
         l_pass = 0
         l_fail = 0
 
         for i in range(300):
-            x0_file = pathX + 'data' + str(i) + '.txt'
-            x0 = np.array(ast.literal_eval(read(x0_file)))
+            x0 = data[i]
 
             #print('Data {}'.format(i))
 
             if len(r_neuron) == 0:
-                y = self.model.apply(x0)
+                y = self.model.apply_memo(x0)
             else:
                 y = self.model.apply_lstm_repair(x0, r_neuron, r_weight, r_layer)
             #y = self.model.apply(x0)
@@ -615,6 +596,8 @@ class DTMCImpl_rnn():
         generated = self.step
         out = []
 
+        xs, x_ws = [], []
+
         while generated:
             if self.data_used < self.data_len:
                 x, x_w = self.__get_x() # x_w: word vector
@@ -622,13 +605,23 @@ class DTMCImpl_rnn():
             else:
                 x, x_w = self.__generate_x()
 
-            # intermediate layer
-            if self.repair == False:
-                y, cell = self.model.apply_lstm_inter(x, self.neuron)
-            else:
-                y = self.model.apply_lstm_repair(x, self.repair_neuron, self.repair_w, self.repair_layer)
-            # now cell contain a sequence of hidden cell values of length equal to number of timesteps
-            y = np.argmax(y, axis=1)[0]
+            xs.append(x)
+            x_ws.append(x_w)
+            generated = generated - 1
+
+        # texts have the same number of words, run them as one batch
+        xs = np.array(xs)
+
+        # intermediate layer
+        if self.repair == False:
+            ys, cells = self.model.apply_lstm_inter(xs, self.neuron)
+        else:
+            ys = self.model.apply_lstm_repair(xs, self.repair_neuron, self.repair_w, self.repair_layer)
+        # now cells contain a sequence of hidden cell values of length equal to number of timesteps per text
+        ys = np.argmax(ys, axis=1)
+
+        for k in range(len(xs)):
+            x, x_w, y = xs[k], x_ws[k], ys[k]
 
             path = [self.s0]
 
@@ -643,7 +636,7 @@ class DTMCImpl_rnn():
 
             # add intermediate
             if self.sens_analysis == True and (self.neuron) != None:
-                to_add = cell
+                to_add = list(cells[k])
                 #path.append(to_add)
                 path = path + to_add
 
@@ -651,7 +644,6 @@ class DTMCImpl_rnn():
 
             self.num_of_path = self.num_of_path + 1
             out.append(path)
-            generated = generated - 1
 
         return out
 
@@ -871,6 +863,23 @@ class DTMCImpl_rnn():
                     return 1
         return 0
 
+    def get_repaired_weights(self, best_pos):
+        # the weights are scaled on copies, those of a binary model are read-only
+        r_weights = []
+        for i in range (0, len(self.model.layers) - 1):
+            r_weights.append(self.model.layers[i].get_weight().copy())
+
+        for r_idx in range (0, self.repair_num):
+            r_layer = self.repair_layer[r_idx]
+            r_neuron = self.repair_neuron[r_idx]
+            r_weight = best_pos[r_idx]
+
+            j = int((r_layer + 1) / 2)
+            for i in range (0, len(r_weights[j][0])):
+                r_weights[j][r_neuron + 50][i] = (1 + r_weight) * r_weights[j][r_neuron][i]
+
+        return r_weights
+
     def detail_print(self, x):
         if self.sens_analysis and self.dbgmsg:
             print(x)
@@ -0,0 +1,76 @@
+import autograd.numpy as np
+
+from utils import *
+
+
+class PGDAttack():
+    # projected gradient descent on the margin of the label y0 from several starts
+    # run in lock-step as one batch: the first start is x0, the others are random
+    # in the constraint set, the box [lower, upper] intersected, with eps2, with
+    # the l2 ball of radius eps2 around x0
+    def __init__(self, no_starts=10, no_steps=100, rate=2.5):
+        self.no_starts = no_starts
+        self.no_steps = no_steps
+        self.rate = rate
+
+
+    def __project(self, xs, x0, lower, upper, eps2):
+        if eps2 is not None:
+            # x0 is in the box, so the clip after cannot leave the ball
+            dist = np.sqrt(np.sum((xs - x0) ** 2, axis=1, keepdims=True))
+            xs = x0 + (xs - x0) * np.minimum(1, eps2 / np.maximum(dist, 1e-12))
+
+        return np.clip(xs, lower, upper)
+
+
+    def __loss(self, outputs, y0):
+        # the sum of the margins of y0, the rows are independent
+        y0_score = outputs[:, y0]
+
+        outputs_no_y0 = outputs - np.eye(outputs.shape[1])[y0] * 1e9
+        max_score = np.max(outputs_no_y0, axis=1)
+
+        return np.sum(y0_score - max_score)
+
+
+    def __get_margins(self, outputs, y0):
+        outputs_no_y0 = outputs.copy()
+        outputs_no_y0[:, y0] = -np.inf
+
+        return outputs[:, y0] - np.max(outputs_no_y0, axis=1)
+
+
+    def attack(self, model, x0, y0, lower, upper, eps2=None, strict=False):
+        # return an input of the constraint set whose margin is <= 0, or < 0 if
+        # strict, as soon as one of the starts finds it, or None
+        no_starts = max(1, self.no_starts)
+
+        xs = np.concatenate([x0.reshape(1, -1), generate_x(x0.size, lower, upper, no_starts - 1)])
+        xs = self.__project(xs, x0, lower, upper, eps2)
+
+        # the size of the steps follows the width of the box on each input, so the
+        # fixed inputs, e.g. the non sensitive features for fairness, do not move
+        step = self.rate / self.no_steps * (upper - lower)
+        step2 = None if eps2 is None else self.rate / self.no_steps * eps2
+
+        for i in range(self.no_steps + 1):
+            _, g, outputs = model.value_and_grad(xs, lambda outputs: self.__loss(outputs, y0), True)
+
+            margins = self.__get_margins(outputs, y0)
+            found = margins < 0 if strict else margins <= 0
+
+            if np.any(found):
+                return xs[np.argmax(found)]
+
+            if i == self.no_steps:
+                break
+
+            if eps2 is None:
+                xs = xs - step * np.sign(g)
+            else:
+                norm = np.sqrt(np.sum(g ** 2, axis=1, keepdims=True))
+                xs = xs - step2 * g / np.maximum(norm, 1e-12)
+
+            xs = self.__project(xs, x0, lower, upper, eps2)
+
+        return None
@@ -1,28 +1,26 @@
-from solver.optimize_impl import OptimizeImpl
-from solver.sprt_impl import SPRTImpl
-from solver.refinement_impl import RefinementImpl
-from solver.backdoor_impl import BackDoorImpl
-from solver.backdoor_repair_impl import BackDoorRepairImpl
-from solver.dtmc_impl import DTMCImpl
-from solver.dtmc_rnn import DTMCImpl_rnn
-from solver.verifair_impl import VeriFairimpl
-from solver.causal_impl import CausalImpl
+# the engines and their dependencies, e.g. gurobipy or sklearn, are only
+# imported when a solver of their algorithm is run
 
 class Optimize():
     def solve(self, model, assertion, display=None):
+        from solver.optimize_impl import OptimizeImpl
+
         impl = OptimizeImpl()
         impl.solve(model, assertion, display)
 
 
 class SPRT():
-    def __init__(self, threshold, alpha, beta, delta):
+    def __init__(self, threshold, alpha, beta, delta, batch_size=100):
         self.threshold = threshold
         self.alpha = alpha
         self.beta = beta
         self.delta = delta
+        self.batch_size = batch_size
 
     def solve(self, model, assertion, display=None):
-        impl = SPRTImpl(self.threshold, self.alpha, self.beta, self.delta)
+        from solver.sprt_impl import SPRTImpl
+
+        impl = SPRTImpl(self.threshold, self.alpha, self.beta, self.delta, self.batch_size)
         impl.solve(model, assertion, display)
 
 
@@ -34,18 +32,24 @@ class Refinement():
         self.max_sus = max_sus
 
     def solve(self, model, assertion, display=None):
+        from solver.refinement_impl import RefinementImpl
+
         impl = RefinementImpl(self.has_ref, self.max_ref, self.ref_typ, self.max_sus)
         return impl.solve(model, assertion, display)
 
 
 class BackDoor():
     def solve(self, model, assertion, display=None):
+        from solver.backdoor_impl import BackDoorImpl
+
         impl = BackDoorImpl()
         return impl.solve(model, assertion, display)
 
 
 class BackDoorRepair():
     def solve(self, model, assertion, display=None):
+        from solver.backdoor_repair_impl import BackDoorRepairImpl
+
         impl = BackDoorRepairImpl()
         return impl.solve(model, assertion, display)
 
@@ -54,6 +58,8 @@ class DTMC():
     def __init__(self):
         pass
     def solve(self, model, assertion, display=None):
+        from solver.dtmc_impl import DTMCImpl
+
         impl = DTMCImpl()
         impl.solve(model, assertion, display)
 
@@ -61,6 +67,8 @@ class DTMC_rnn():
     def __init__(self):
         pass
     def solve(self, model, assertion, display=None):
+        from solver.dtmc_rnn import DTMCImpl_rnn
+
         impl = DTMCImpl_rnn()
         impl.solve(model, assertion, display)
 
@@ -68,6 +76,8 @@ class VeriFair():
     def __init__(self):
         pass
     def solve(self, model, assertion, display=None):
+        from solver.verifair_impl import VeriFairimpl
+
         impl = VeriFairimpl()
         impl.solve(model, assertion, display)
 
@@ -75,5 +85,7 @@ class Causal():
     def __init__(self):
         pass
     def solve(self, model, assertion, display=None):
+        from solver.causal_impl import CausalImpl
+
         impl = CausalImpl()
         impl.solve(model, assertion, display)
\ No newline at end of file
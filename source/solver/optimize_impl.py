@@ -3,12 +3,20 @@ import ast
 
 from scipy.optimize import minimize
 from scipy.optimize import Bounds
-from autograd import grad
+from scipy.optimize import OptimizeResult
+from autograd import grad, value_and_grad
 from assertion.lib_functions import d0, d2, di
+from solver.lib_attack import PGDAttack
+from assertion.lib_compiler import compile_assertion
 from utils import *
 
 
 class OptimizeImpl():
+    def __init__(self):
+        # random assignments tried before the search of a general assertion
+        self.no_starts = 1000
+
+
     def __solve_syntactic_sugar(self, model, spec, display):
         if spec['robustness'] == 'local':
             self.__solve_local_robustness(model, spec, display)
@@ -17,13 +25,13 @@ class OptimizeImpl():
 
 
     def __solve_local_robustness(self, model, spec, display):
-        x0 = np.array(ast.literal_eval(read(spec['x0'])))
+        x0 = read_array(spec['x0'])
         y0 = np.argmax(model.apply(x0), axis=1)[0]
 
         res, x = self.__solve_robustness(model, spec, x0, y0)
 
         if not res and display:
-            y = np.argmax(model.apply(x), axis=1)[0]
+            y = np.argmax(model.apply_memo(x), axis=1)[0]
             display.show(model, x0, y0, x, y)
 
 
@@ -59,76 +67,120 @@ class OptimizeImpl():
             upper = np.minimum(upper, x0 + eps)
 
         if 'fairness' in spec:
-            sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            sensitive = read_array(spec['fairness'])
             for index in range(x0.size):
                 if not (index in sensitive):
                     lower[index] = x0[index]
                     upper[index] = x0[index]
 
-        x = x0.copy()
-        args = (model, x0, y0, dfunc, eps)
-        bounds = Bounds(lower, upper)
-        jac = grad(self.__obj_robustness) if model.layers != None else None
+        if model.layers != None and dfunc != d0:
+            # batched projected gradient descent from several starts in the box, and
+            # the l2 ball for d2; the margin of y0 must be negative as for loss2
+            eps2 = eps if dfunc == d2 else None
+            x = PGDAttack().attack(model, x0, y0, lower, upper, eps2, strict=True)
+        else:
+            x = x0.copy()
+            args = (model, x0, y0, dfunc, eps)
+            bounds = Bounds(lower, upper)
+
+            if model.layers != None:
+                # the objective returns its value and gradient together
+                res = minimize(self.__obj_robustness_grad, x, args=args, jac=True, bounds=bounds)
+            else:
+                res = minimize(self.__obj_robustness, x, args=args, bounds=bounds)
 
-        res = minimize(self.__obj_robustness, x, args=args, jac=jac, bounds=bounds)
+            x = res.x if res.fun == 0 else None
 
-        if res.fun == 0: # an adversarial sample is generated
+        if x is not None: # an adversarial sample is generated
             print('The model is not robust around x0.')
 
-            output_x = model.apply(res.x)
+            output_x = model.apply_memo(x)
             lbl_x = np.argmax(output_x, axis=1)[0]
 
-            print('x = {}'.format(res.x))
+            print('x = {}'.format(x))
             print('output_x = {}'.format(output_x))
             print('lbl_x = {}'.format(lbl_x))
 
-            return False, res.x
+            return False, x
         else:
             print('The model is probably robust around x0.')
             return True, np.empty(0)
 
 
     def __obj_robustness(self, x, model, x0, y0, dfunc, eps):
+        loss1 = self.__loss_distance(x, x0, dfunc, eps)
+        loss2 = self.__loss_score(model.apply(x), y0)
+
+        return loss1 + loss2
+
+
+    def __obj_robustness_grad(self, x, model, x0, y0, dfunc, eps):
+        # only the distance goes through autograd, the model has its own gradient
+        loss1, grad1 = value_and_grad(self.__loss_distance)(x, x0, dfunc, eps)
+        loss2, grad2 = model.value_and_grad(x, lambda output: self.__loss_score(output, y0))
+
+        return loss1 + loss2, grad1 + grad2
+
+
+    def __loss_distance(self, x, x0, dfunc, eps):
         loss1 = dfunc(x, x0)
         loss1 = 0 if loss1 <= eps else loss1 - eps
 
-        output = model.apply(x)
+        return loss1 + np.sum(x - x)
+
+
+    def __loss_score(self, output, y0):
         y0_score = output[0][y0]
 
-        output = output - np.eye(output[0].size)[y0] * 1e9
-        max_score = np.max(output)
+        output_no_y0 = output - np.eye(output[0].size)[y0] * 1e9
+        max_score = np.max(output_no_y0)
 
         loss2 = 0 if y0_score < max_score else y0_score - max_score + 1e-9
 
-        loss = loss1 + loss2
+        return loss2 + np.sum(output - output)
 
-        return loss + np.sum(x - x)
 
-
-    def __obj_func(self, x, model, assertion):
+    def __get_vars_dict(self, xs, model, assertion):
+        # xs holds the variables one after another, in one row per assignment
         vars_dict = dict()
         size = np.prod(model.shape)
 
         for i in range(len(assertion.vars)):
             var = assertion.vars[i]
-            vars_dict[var.name] = x[i * size : (i + 1) * size]
+            vars_dict[var.name] = xs[:, i * size : (i + 1) * size]
+
+        return vars_dict
 
-        vars_dict.update(assertion.init_dict)
 
-        return assertion.neg_num_value(vars_dict) + np.sum(x - x)
+    def __obj_func(self, x, model, compiled):
+        vars_dict = self.__get_vars_dict(x.reshape(1, -1), model, compiled)
+
+        return compiled.neg_num_value(vars_dict)[0] + np.sum(x - x)
 
 
     def solve(self, model, assertion, display=None):
         if isinstance(assertion, dict):
             return self.__solve_syntactic_sugar(model, assertion, display)
 
-        x = np.zeros(np.prod(model.shape) * len(assertion.vars))
+        compiled = compile_assertion(assertion, model)
+        size = np.prod(model.shape)
+
+        # start from the best of zeros and a batch of random assignments
+        starts = [generate_x(size, model.lower, model.upper, self.no_starts) for var in assertion.vars]
+        xs = np.concatenate([np.zeros((1, size * len(assertion.vars))), np.concatenate(starts, axis=1)])
 
-        args = (model, assertion)
+        values = compiled.neg_num_value(self.__get_vars_dict(xs, model, compiled))
+        x = xs[np.argmin(values)]
+
+        args = (model, compiled)
         bounds = Bounds(model.lower, model.upper)
         jac = grad(self.__obj_func) if model.layers != None else None
 
-        res = minimize(self.__obj_func, x, args=args, jac=jac, bounds=bounds)
+        if np.min(values) == 0:
+            # the assertion does not hold for a random assignment already
+            res = OptimizeResult(x=x, fun=0)
+        else:
+            res = minimize(self.__obj_func, x, args=args, jac=jac, bounds=bounds)
 
         if res.fun == 0:
             print('The assertion is unsatisfied.'.format(res.x))
@@ -5,12 +5,10 @@ import os
 import time
 import random
 
-from scipy.optimize import minimize
-from scipy.optimize import Bounds
-from autograd import grad
 from assertion.lib_functions import di
 from utils import *
 from poly_utils import *
+from solver.lib_attack import PGDAttack
 
 
 class Poly():
@@ -18,6 +16,8 @@ class Poly():
         self.lw, self.up = None, None
         self.le, self.ge = None, None
         self.shape = None
+        # with is_activation, each neuron only depends on the same neuron of the
+        # previous poly, and le and ge keep its coefficient and the constant
         self.is_activation = False
 
     def copy(self):
@@ -34,20 +34,25 @@ class Poly():
 
         return new_poly
 
-    def back_substitute(self, lst_poly, get_ineq=False):
-        no_neurons = len(self.lw)
-        num_cores = os.cpu_count()
+    def get_dense(self, coefs):
+        # le or ge with one column per neuron of the previous poly and the constant
+        if is_sparse(coefs):
+            return coefs.toarray()
+        elif not self.is_activation:
+            return coefs
 
-        for i in range(no_neurons):
-            args = (i, self.le[i], self.ge[i], lst_poly)
-            _, lw_i, up_i, lst_le_i, lst_ge_i = back_substitute0(args)
-            self.lw[i], self.up[i] = lw_i, up_i
+        dense = np.zeros([len(coefs), len(coefs) + 1], dtype=coefs.dtype)
+        dense[:, :-1] = np.diag(coefs[:, 0])
+        dense[:, -1] = coefs[:, -1]
 
-            if up_i < lw_i: break # unreachable state
+        return dense
+
+    def back_substitute(self, lst_poly, dtype, get_ineq=False):
+        self.lw, self.up, lst_le, lst_ge = back_substitute(self.le, self.ge, lst_poly, dtype, get_ineq)
 
         # get_ineq only happens at the last step
         # no_neurons in this case always be 1
-        if get_ineq: return lst_le_i, lst_ge_i
+        if get_ineq: return [le[0] for le in lst_le], [ge[0] for ge in lst_ge]
 
 
 class Task():
@@ -81,7 +86,7 @@ class RefinementImpl():
 
 
     def __solve_local_robustness(self, model, spec, display):
-        x0 = np.array(ast.literal_eval(read(spec['x0'])))
+        x0 = read_array(spec['x0'])
         y0 = np.argmax(model.apply(x0), axis=1)[0]
 
         eps = ast.literal_eval(read(spec['eps']))
@@ -90,7 +95,7 @@ class RefinementImpl():
         up = np.minimum(model.upper, x0 + eps)
 
         if 'fairness' in spec:
-            sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            sensitive = read_array(spec['fairness'])
             for index in range(len(x0)):
                 if not (index in sensitive):
                     lw[index], up[index] = x0[index], x0[index]
@@ -124,39 +129,22 @@ class RefinementImpl():
 
 
     def __find_adv(self, model, x0, y0, lw, up):
-        def obj_func(x, model, y0):
-            output = model.apply(x).reshape(-1)
-            y0_score = output[y0]
-
-            output_no_y0 = output - np.eye(len(output))[y0] * 1e9
-            max_score = np.max(output_no_y0)
-
-            return y0_score - max_score
-
-        # print('Finding adversarial sample! Try {} times'.format(self.max_sus))
-
-        for i in range(self.max_sus):
-            if self.max_sus == 1:
-                x = x0.copy()
-            else:
-                x = generate_x(len(x0), lw, up)
-
-            args = (model, y0)
-            jac = grad(obj_func)
-            bounds = Bounds(lw, up)
+        # max_sus starts of projected gradient descent, run together as one batch
+        if self.max_sus <= 0:
+            return None
 
-            res = minimize(obj_func, x, args=args, jac=jac, bounds=bounds)
+        x = PGDAttack(self.max_sus).attack(model, x0, y0, lw, up)
 
-            if res.fun <= 0: # an adversarial sample is generated
-                valid = self.__validate_adv(model, res.x, y0)
-                assert valid
-                return res.x
+        if x is not None: # an adversarial sample is generated
+            valid = self.__validate_adv(model, x, y0)
+            assert valid
+            return x
 
         return None
 
 
     def __validate_adv(self, model, x, y0):
-        output = model.apply(x).reshape(-1)
+        output = model.apply_memo(x).reshape(-1)
         y0_score = output[y0]
 
         output_no_y0 = output - np.eye(len(output))[y0] * 1e9
@@ -245,16 +233,16 @@ class RefinementImpl():
                 if y != y0 and poly_out.lw[y0] <= poly_out.up[y]:
                     poly_res = Poly()
 
-                    poly_res.lw = np.zeros(1)
-                    poly_res.up = np.zeros(1)
+                    poly_res.lw = np.zeros(1, dtype=model.dtype)
+                    poly_res.up = np.zeros(1, dtype=model.dtype)
 
-                    poly_res.le = np.zeros([1, no_neurons + 1])
-                    poly_res.ge = np.zeros([1, no_neurons + 1])
+                    poly_res.le = np.zeros([1, no_neurons + 1], dtype=model.dtype)
+                    poly_res.ge = np.zeros([1, no_neurons + 1], dtype=model.dtype)
 
                     poly_res.ge[0,y0] = 1
                     poly_res.ge[0,y] = -1
 
-                    lst_le, lst_ge = poly_res.back_substitute(lst_poly, True)
+                    lst_le, lst_ge = poly_res.back_substitute(lst_poly, model.dtype, True)
 
                     assert len(lst_ge) == len(lst_poly)
 
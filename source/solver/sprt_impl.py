@@ -3,16 +3,20 @@ import ast
 
 from autograd import grad
 from assertion.lib_functions import d0, d2, di
+from assertion.lib_compiler import compile_assertion
 from utils import *
 
 
 class SPRTImpl():
-    def __init__(self, threshold, alpha, beta, delta):
+    def __init__(self, threshold, alpha, beta, delta, batch_size=100):
         self.threshold = threshold
         self.alpha = alpha
         self.beta = beta
         self.delta = delta
 
+        # the number of samples drawn and run through the model at a time
+        self.batch_size = batch_size
+
 
     def __solve_syntactic_sugar(self, model, spec):
         if spec['robustness'] == 'local':
@@ -22,7 +26,7 @@ class SPRTImpl():
 
 
     def __solve_local_robustness(self, model, spec):
-        x0 = np.array(ast.literal_eval(read(spec['x0'])))
+        x0 = read_array(spec['x0'])
         y0 = np.argmax(model.apply(x0), axis=1)[0]
 
         self.__solve_robustness(model, spec, x0, y0)
@@ -60,7 +64,7 @@ class SPRTImpl():
             upper = np.minimum(upper, x0 + eps)
 
         if 'fairness' in spec:
-            sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            sensitive = read_array(spec['fairness'])
             for index in range(x0.size):
                 if not (index in sensitive):
                     lower[index] = x0[index]
@@ -78,12 +82,17 @@ class SPRTImpl():
         size = np.prod(model.shape)
 
         while True:
-            x = generate_x(size, lower, upper)
+            # samples are drawn and run through the model in batches,
+            # but are still consumed one by one by the sequential test
+            xs = generate_x(size, lower, upper, self.batch_size)
+            xs = np.array([x for x in xs if dfunc(x, x0) <= eps])
 
-            if dfunc(x, x0) <= eps:
-                no = no + 1
+            if len(xs) == 0: continue
 
-                y = np.argmax(model.apply(x), axis=1)[0]
+            ys = np.argmax(model.apply_batch(xs), axis=1)
+
+            for y in ys:
+                no = no + 1
 
                 if y == y0:
                     pr = pr * p1 / p0
@@ -113,26 +122,29 @@ class SPRTImpl():
         
         size = np.prod(model.shape)
 
+        # the assignments are drawn and checked in batches, but are still
+        # consumed one by one by the sequential test
+        compiled = compile_assertion(assertion, model)
+
         while True:
             vars_dict = dict()
 
             for var in assertion.vars:
-                x = generate_x(size, model.lower, model.upper)
-                vars_dict[var.name] = x
+                vars_dict[var.name] = generate_x(size, model.lower, model.upper, self.batch_size)
 
-            vars_dict.update(assertion.init_dict)
+            pres, posts = compiled.get_bool_values(vars_dict)
 
-            if assertion.get_pre_bool_value(vars_dict):
+            for post in posts[pres]:
                 no = no + 1
 
-                if assertion.get_post_bool_value(vars_dict):
+                if post:
                     pr = pr * p1 / p0
                 else:
                     pr = pr * (1 - p1) / (1 - p0)
 
                 if pr <= h0:
                     print('Accept H0. The assertion is satisfied with p >= {} after {} tests.'.format(p0, no))
-                    break
+                    return
                 elif pr >= h1:
                     print('Accept H1. The assertion is satisfied with p <= {} after {} tests.'.format(p1, no))
-                    break
+                    return
@@ -70,7 +70,7 @@ class VeriFairimpl():
         self.model = model
         spec = assertion
         if 'fairness' in spec:
-            self.sensitive = np.array(ast.literal_eval(read(spec['fairness'])))
+            self.sensitive = read_array(spec['fairness'])
 
         if 'sens_group0' in spec:
             self.group0 = spec['sens_group0']
@@ -94,7 +94,7 @@ class VeriFairimpl():
 
         generated = self.step
 
-        out = 0
+        xs = []
         while generated:
             total = 0
             x = self.veri_generate_x(self.model.shape, lower, upper, sens_dix, sens_group)
@@ -103,14 +103,16 @@ class VeriFairimpl():
                 x = self.veri_generate_x(self.model.shape, lower, upper, sens_dix, sens_group)
                 total = total + 1
 
-            y = self.model.apply(x)
+            xs.append(x)
 
-            #y = 1 - np.argmax(y, axis=1)[0]
-            y = np.argmax(y, axis=1)[0]
+            generated = generated - 1
 
-            out = out + y
+        y = self.model.apply_batch(np.array(xs))
 
-            generated = generated - 1
+        #y = 1 - np.argmax(y, axis=1)
+        y = np.argmax(y, axis=1)
+
+        out = np.sum(y)
 
         return out, total
 
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from model.lib_layers import Conv2d, Function, Linear, MaxPool2d
+from model.lib_models import Model
+from poly_utils import back_substitute, is_sparse
+from solver.refinement_impl import Poly
+
+
+# the bounds of back_substitute as they were computed neuron by neuron on dense polys
+def back_substitute_loop(le_curr, ge_curr, lst_poly):
+    no_neurons = len(le_curr)
+
+    best_lw = np.full(no_neurons, -1e9)
+    best_up = np.full(no_neurons, 1e9)
+
+    # le and ge in terms of each poly, the last ones are le_curr and ge_curr
+    lst_le = [np.zeros([no_neurons, len(e.lw) + 1]) for e in lst_poly[:-1]] + [le_curr]
+    lst_ge = [np.zeros([no_neurons, len(e.lw) + 1]) for e in lst_poly[:-1]] + [ge_curr]
+
+    for i in range(no_neurons):
+        le, ge = le_curr[i], ge_curr[i]
+
+        for k, e in reversed(list(enumerate(lst_poly))):
+            lw, up = ge[-1], le[-1]
+
+            for j in range(len(e.lw)):
+                lw += ge[j] * (e.lw[j] if ge[j] > 0 else e.up[j])
+                up += le[j] * (e.up[j] if le[j] > 0 else e.lw[j])
+
+            best_lw[i] = max(best_lw[i], lw)
+            best_up[i] = min(best_up[i], up)
+
+            if k > 0:
+                e_le, e_ge = e.get_dense(e.le), e.get_dense(e.ge)
+
+                new_le = np.zeros(e_le.shape[1])
+                new_ge = np.zeros(e_ge.shape[1])
+
+                for j in range(len(e.lw)):
+                    new_le += le[j] * (e_le[j] if le[j] > 0 else e_ge[j])
+                    new_ge += ge[j] * (e_ge[j] if ge[j] > 0 else e_le[j])
+
+                new_le[-1] += le[-1]
+                new_ge[-1] += ge[-1]
+
+                le, ge = new_le, new_ge
+
+                lst_le[k - 1][i] = le
+                lst_ge[k - 1][i] = ge
+
+    return best_lw, best_up, lst_le, lst_ge
+
+
+def get_model(kind, seed):
+    rng = np.random.default_rng(seed)
+
+    if kind == 'dense':
+        shape = [1, 4]
+        layers = [Linear(rng.standard_normal((6, 4)), rng.standard_normal(6), None), Function('relu', None),
+            Linear(rng.standard_normal((5, 6)), rng.standard_normal(5), None), Function('sigmoid', None),
+            Linear(rng.standard_normal((4, 5)), rng.standard_normal(4), None), Function('tanh', None),
+            Linear(rng.standard_normal((3, 4)), rng.standard_normal(3), None)]
+    else:
+        shape = [1, 2, 5, 5]
+        layers = [Conv2d(rng.standard_normal((3, 2, 3, 3)), rng.standard_normal(3), 1, 1), Function('relu', None),
+            Conv2d(rng.standard_normal((2, 3, 2, 2)), rng.standard_normal(2), 1, 0), MaxPool2d((2, 2), 2, 0)]
+
+    size = int(np.prod(shape))
+    lower = rng.uniform(-1, 0, size)
+
+    return Model(np.array(shape), lower, lower + rng.uniform(0, 1, size), layers, None)
+
+def get_polys(model):
+    x_poly = Poly()
+    x_poly.lw, x_poly.up = model.lower.copy(), model.upper.copy()
+    x_poly.shape = tuple(model.shape)
+
+    lst_poly = [x_poly]
+    for idx in range(len(model.layers)):
+        lst_poly.append(model.forward(lst_poly[idx], idx, lst_poly))
+
+    return lst_poly
+
+def get_coefs(poly):
+    # le and ge as back_substitute takes them for the current layer
+    if poly.is_activation:
+        return poly.get_dense(poly.le), poly.get_dense(poly.ge)
+    else:
+        return poly.le, poly.ge
+
+def to_dense(coefs):
+    return coefs.toarray() if is_sparse(coefs) else coefs
+
+
+@pytest.mark.parametrize('kind', ['dense', 'conv'])
+@pytest.mark.parametrize('seed', range(3))
+def test_back_substitute_dense_reference(kind, seed):
+    model = get_model(kind, seed)
+    lst_poly = get_polys(model)
+
+    for k in range(1, len(lst_poly)):
+        le, ge = get_coefs(lst_poly[k])
+
+        lw, up, lst_le, lst_ge = back_substitute(le, ge, lst_poly[:k], np.float64, get_ineq=True)
+        ref_lw, ref_up, ref_le, ref_ge = back_substitute_loop(to_dense(le), to_dense(ge), lst_poly[:k])
+
+        assert np.allclose(lw, ref_lw) and np.allclose(up, ref_up)
+        assert np.all(lw <= up + 1e-9)
+
+        assert len(lst_le) == len(ref_le) == k
+        for i in range(k):
+            assert np.allclose(to_dense(lst_le[i]), ref_le[i]) and np.allclose(to_dense(lst_ge[i]), ref_ge[i])
+
+@pytest.mark.parametrize('kind', ['dense', 'conv'])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_back_substitute_sound(kind, dtype):
+    model = get_model(kind, 0)
+
+    rng = np.random.default_rng(1)
+    xs = rng.uniform(model.lower, model.upper, (2000, len(model.lower)))
+
+    # the corners of the input box reach the bounds of the first layer
+    xs[:16] = np.where(rng.uniform(0, 1, (16, len(model.lower))) < 0.5, model.lower, model.upper)
+
+    model.cast(dtype)
+    lst_poly = get_polys(model)
+
+    # the outputs of the weights in dtype, computed exactly enough in float64
+    exact = get_model(kind, 0)
+    exact.cast(dtype)
+    exact.cast(np.float64)
+
+    _, records = exact.apply_taps(xs)
+
+    for k in range(1, len(lst_poly)):
+        outputs = records[k - 1].reshape(len(xs), -1)
+        poly = lst_poly[k]
+
+        assert np.all(poly.lw <= outputs + 1e-9) and np.all(outputs <= poly.up + 1e-9)
+
+        # the relations of the neurons with the input hold too
+        if not poly.is_activation:
+            le, ge = get_coefs(poly)
+            _, _, lst_le, lst_ge = back_substitute(le, ge, lst_poly[:k], dtype, get_ineq=True)
+
+            le, ge = to_dense(lst_le[0]), to_dense(lst_ge[0])
+
+            assert np.all(outputs <= xs @ le[:, :-1].T + le[:, -1] + 1e-9)
+            assert np.all(xs @ ge[:, :-1].T + ge[:, -1] - 1e-9 <= outputs)
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+import model.lib_cache as lib_cache
+
+from json_parser import parse_cached_model
+from model.lib_binary import save_model
+from solver.backdoor_repair_impl import BackDoorRepairImpl
+from solver.dtmc_impl import DTMCImpl
+from solver.dtmc_rnn import DTMCImpl_rnn
+
+
+def get_linear(rng, no_in, no_out, func=None):
+    layer = {'type': 'linear', 'weights': rng.randn(no_out, no_in), 'bias': rng.randn(no_out)}
+
+    if func is not None:
+        layer['func'] = func
+
+    return layer
+
+
+# a model converted to the binary format, its weights are read-only memmaps
+def get_binary_model(tmp_path, monkeypatch, layers, shape):
+    monkeypatch.setattr(lib_cache, 'CACHE_DIR', '')
+
+    path = str(tmp_path / 'model.bin')
+    save_model(path, layers)
+
+    spec = {'shape': str(shape), 'bounds': '[(-1,1)]', 'binary': path}
+    model = parse_cached_model(spec, None)
+
+    return model
+
+
+@pytest.fixture
+def linear_model(tmp_path, monkeypatch):
+    rng = np.random.RandomState(0)
+
+    layers = [get_linear(rng, 4, 6), {'type': 'function', 'func': 'relu'},
+        get_linear(rng, 6, 5), {'type': 'function', 'func': 'relu'}, get_linear(rng, 5, 2)]
+
+    model = get_binary_model(tmp_path, monkeypatch, layers, [1, 4])
+
+    for layer in model.layers[::2]:
+        assert isinstance(layer.weights.base, np.memmap) and not layer.weights.flags.writeable
+
+    return model
+
+
+def get_weights(model):
+    return [np.array(layer.weights) for layer in model.layers if layer.is_linear_layer()]
+
+
+def test_dtmc_repaired_weights(linear_model):
+    old_weights = get_weights(linear_model)
+
+    impl = DTMCImpl()
+    impl.model = linear_model
+    impl.repair_num = 3
+    impl.repair_layer = [0, 1, 3]
+    impl.repair_neuron = [2, 4, 1]
+
+    r_weights = impl.get_repaired_weights([0.5, -0.25, 2.0])
+
+    assert all(np.array_equal(x, y) for x, y in zip(get_weights(linear_model), old_weights))
+
+    # the inputs scale the first layer, the activations the layer after them
+    for (j, neuron, scale) in [(0, 2, 1.5), (1, 4, 0.75), (2, 1, 3.0)]:
+        expected = old_weights[j].copy()
+        expected[neuron] *= scale
+
+        assert np.allclose(r_weights[j], expected)
+
+
+def test_backdoor_repair_weights(linear_model):
+    old_weights = get_weights(linear_model)
+
+    class Var:
+        def __init__(self, x):
+            self.x = x
+
+    class Opt:
+        def getVarByName(self, name):
+            return Var(float(name[1:]))
+
+    impl = BackDoorRepairImpl()
+    new_model = linear_model.copy()
+
+    impl._BackDoorRepairImpl__update_new_weights_and_bias(new_model, Opt(), 0, 3, 5)
+
+    assert all(np.array_equal(x, y) for x, y in zip(get_weights(linear_model), old_weights))
+    assert np.array_equal(new_model.layers[2].weights[3], np.arange(5))
+
+
+def test_dtmc_rnn_repaired_weights(tmp_path, monkeypatch):
+    rng = np.random.RandomState(0)
+
+    no_in, no_h = 40, 16
+    layers = [{'type': 'lstm', 'weights': rng.randn(4 * no_h, no_in + no_h), 'bias': rng.randn(4 * no_h),
+        'h0': np.zeros(no_h), 'c0': np.zeros(no_h)}, get_linear(rng, no_h, 2)]
+
+    model = get_binary_model(tmp_path, monkeypatch, layers, [1, no_in])
+    assert not model.layers[0].weights.flags.writeable
+
+    old_weights = np.array(model.layers[0].weights)
+
+    impl = DTMCImpl_rnn()
+    impl.model = model
+    impl.repair_num = 1
+    impl.repair_layer = [0]
+    impl.repair_neuron = [2]
+
+    r_weights = impl.get_repaired_weights([0.5])
+
+    assert np.array_equal(model.layers[0].weights, old_weights)
+    assert np.allclose(r_weights[0][52], 1.5 * old_weights[2])
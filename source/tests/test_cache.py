@@ -0,0 +1,99 @@
+import importlib
+import os
+import numpy as np
+import pytest
+
+import model.lib_cache as lib_cache
+
+from model.lib_cache import get_key, load_cached, save_cached
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(lib_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+def get_spec(tmp_path):
+    weights = tmp_path / 'weights.txt'
+    weights.write_text('[[1.0,2.0],[3.0,4.0]]')
+
+    return {'shape': '[1,2]', 'layers': [{'type': 'linear', 'weights': str(weights)}]}, weights
+
+
+def test_key_changes_with_files(tmp_path):
+    spec, weights = get_spec(tmp_path)
+    stat = os.stat(weights)
+    key = get_key(spec, True)
+
+    assert get_key(spec, True) == key
+    assert get_key(spec, False) != key
+
+    # same size, newer modification time
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert get_key(spec, True) != key
+
+    # same modification time, other size
+    weights.write_text('[[1.0,2.0],[3.0,4.25]]')
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert get_key(spec, True) != key
+
+    weights.write_text('[[1.0,2.0],[3.0,4.0]]')
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert get_key(spec, True) == key
+
+def test_key_changes_with_format_version(tmp_path, cache_dir, monkeypatch):
+    spec, _ = get_spec(tmp_path)
+    key = get_key(spec, True)
+
+    save_cached(key, np.arange(3))
+    assert np.array_equal(load_cached(key), np.arange(3))
+
+    monkeypatch.setattr(lib_cache, 'FORMAT_VERSION', lib_cache.FORMAT_VERSION + 1)
+    new_key = get_key(spec, True)
+
+    assert new_key != key and load_cached(new_key) is None
+
+def test_load_broken_entries(cache_dir):
+    assert load_cached('missing') is None
+
+    save_cached('broken', 1)
+    (cache_dir / 'broken.pkl').write_bytes(b'not a pickle')
+
+    assert load_cached('broken') is None
+
+def test_evict_least_recently_used(cache_dir, monkeypatch):
+    value = b'x' * 1000
+
+    save_cached('a', value)
+    size = os.path.getsize(cache_dir / 'a.pkl')
+
+    # room for three entries
+    monkeypatch.setattr(lib_cache, 'CACHE_SIZE', 3 * size + size // 2)
+
+    save_cached('b', value)
+    save_cached('c', value)
+
+    for time, name in enumerate(['a', 'b', 'c']):
+        os.utime(cache_dir / (name + '.pkl'), (1000 * (time + 1), 1000 * (time + 1)))
+
+    # a is used again, so b is now the least recently used
+    assert load_cached('a') == value
+    save_cached('d', value)
+
+    assert sorted(os.listdir(cache_dir)) == ['a.pkl', 'c.pkl', 'd.pkl']
+    assert load_cached('b') is None
+
+def test_cache_size_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOCRATES_CACHE', str(tmp_path))
+    monkeypatch.setenv('SOCRATES_CACHE_SIZE', '0')
+
+    try:
+        importlib.reload(lib_cache)
+        assert lib_cache.CACHE_DIR == str(tmp_path) and lib_cache.CACHE_SIZE == 0
+
+        # no entry fits, each one is evicted as soon as it is written
+        lib_cache.save_cached('a', 1)
+        assert lib_cache.load_cached('a') is None and os.listdir(tmp_path) == []
+    finally:
+        monkeypatch.undo()
+        importlib.reload(lib_cache)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from assertion.lib_compiler import compile_assertion
+from assertion.lib_functions import set_model
+from json_parser import parse_assertion
+from model.lib_layers import Function, Linear
+from model.lib_models import Model
+
+
+ASSERTIONS = [
+    '(FA x, y. d0(x, y) <= 2 && di(x, y) < 0.3 => arg_max(x) = arg_max(y))',
+    '(FA x, y. d2(x, y) > 0.5 || d0(x, y) = 4 => arg_min(x) != arg_min(y))',
+    '(FA x. x[0] >= 0.5 || lin_inp(x, [1.0, -1.0, 0.5, 2.0]) > 1.5 => lin_out(x, [1.0, -2.0, 0.5]) <= 0.5 && x[1] < x[2])',
+    '(FA x. TRUE => x[3] != 0.5 && lin_out(x, [0.5, 1.0, -1.0]) >= 2)',
+    '(FA x, y. x[0] = y[0] && arg_max(x) = 1 => arg_max(y) != 1 || lin_inp(y, [1.0, 1.0, 1.0, 1.0]) < 2)',
+]
+
+
+def get_model():
+    rng = np.random.default_rng(3)
+    layers = [Linear(rng.standard_normal((5, 4)), rng.standard_normal(5), None),
+        Function('relu', None), Linear(rng.standard_normal((3, 5)), rng.standard_normal(3), None)]
+
+    return Model(np.array([1, 4]), np.zeros(4), np.ones(4), layers, None)
+
+def get_assignments(rng, n):
+    # y shares some of the coordinates of x, so that d0 and x[0] = y[0] take several values
+    xs = rng.uniform(0, 1, (n, 4))
+    ys = np.where(rng.uniform(0, 1, (n, 4)) < 0.5, xs, rng.uniform(0, 1, (n, 4)))
+
+    return {'x': xs, 'y': ys}
+
+
+@pytest.mark.parametrize('spec', ASSERTIONS)
+def test_compiled_assertion(spec):
+    model = get_model()
+    set_model(model)
+
+    assertion = parse_assertion(spec)
+    compiled = compile_assertion(assertion, model)
+
+    vars_dict = get_assignments(np.random.default_rng(1), 200)
+    pres, posts = compiled.get_bool_values(vars_dict)
+    values = compiled.neg_num_value(vars_dict)
+
+    assert pres.shape == posts.shape == values.shape == (200,)
+    assert np.array_equal(compiled.get_pre_bool_value(vars_dict), pres)
+    assert np.array_equal(compiled.get_post_bool_value(vars_dict), posts)
+
+    # the interpreted assertion, one assignment at a time
+    for i in range(200):
+        row = {name: value[i] for name, value in vars_dict.items()}
+
+        assert pres[i] == assertion.get_pre_bool_value(row)
+        assert posts[i] == assertion.get_post_bool_value(row)
+        assert np.isclose(values[i], assertion.neg_num_value(row))
+
+def test_compiled_assertion_one_assignment():
+    model = get_model()
+    set_model(model)
+
+    assertion = parse_assertion(ASSERTIONS[2])
+    compiled = compile_assertion(assertion, model)
+
+    # a flattened variable is a batch of one
+    row = {name: value[0] for name, value in get_assignments(np.random.default_rng(2), 1).items()}
+    pres, posts = compiled.get_bool_values(row)
+
+    assert pres.shape == posts.shape == (1,)
+    assert pres[0] == assertion.get_pre_bool_value(row)
+    assert posts[0] == assertion.get_post_bool_value(row)
+    assert np.isclose(compiled.neg_num_value(row)[0], assertion.neg_num_value(row))
@@ -0,0 +1,106 @@
+import sys
+import numpy as np
+import pytest
+
+import dataset
+import import_dataset
+
+from dataset import Dataset, PACKED, load_dataset, save_dataset
+
+
+def write_samples(path, samples, labels=None):
+    for idx, sample in enumerate(samples):
+        (path / 'data{}.txt'.format(idx)).write_text(str(sample.tolist()))
+
+    if labels is not None:
+        (path / 'labels.txt').write_text(str(labels.tolist()))
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-1, 1, (6, 5)), rng.integers(0, 10, 6)
+
+
+def test_text_dataset(tmp_path, samples):
+    xs, ys = samples
+    write_samples(tmp_path, xs, ys)
+
+    data = Dataset(str(tmp_path), pathY=str(tmp_path / 'labels.txt'))
+
+    assert len(data) == 6 and np.array_equal(data.labels, ys)
+    assert np.array_equal(data[2], xs[2])
+    assert np.array_equal(data[[4, 1]], xs[[4, 1]])
+    assert np.array_equal(data[1:5:2], xs[1:5:2])
+
+    # the callers get copies of the parsed samples
+    data[3][:] = 0
+    assert np.array_equal(data[3], xs[3])
+
+def test_text_samples_lru(tmp_path, samples, monkeypatch):
+    monkeypatch.setattr(dataset, 'NO_SAMPLES', 2)
+
+    xs, _ = samples
+    write_samples(tmp_path, xs)
+
+    data = Dataset(str(tmp_path))
+
+    for idx in [0, 1, 0, 2]:
+        data.get(idx)
+
+    assert list(data.samples) == [0, 2]
+
+    assert np.array_equal(data[:], xs)
+    assert len(data.samples) == 2
+
+def test_packed_dataset(tmp_path, samples):
+    xs, ys = samples
+    save_dataset(str(tmp_path / PACKED), xs, ys)
+
+    data = Dataset(str(tmp_path))
+
+    assert len(data) == 6 and data.size == 5
+    assert np.array_equal(data.labels, ys)
+    assert np.array_equal(data[2], xs[2])
+    assert np.array_equal(data[[4, 1]], xs[[4, 1]])
+
+    # a slice is a view of the mapped file, a sample is a copy
+    batch = data[1:5:2]
+    assert np.array_equal(batch, xs[1:5:2]) and not batch.flags.owndata
+
+    sample = data[3]
+    sample[:] = 0
+    assert np.array_equal(data[3], xs[3])
+
+def test_packed_samples_of_different_sizes(tmp_path):
+    xs = [np.arange(3.0), np.arange(5.0), np.arange(1.0)]
+    save_dataset(str(tmp_path / PACKED), xs)
+
+    data = Dataset(str(tmp_path))
+
+    assert len(data) == 3 and data.size is None and data.labels is None
+    for idx in range(3):
+        assert np.array_equal(data[idx], xs[idx])
+
+def test_import_dataset(tmp_path, samples, monkeypatch):
+    xs, ys = samples
+    write_samples(tmp_path, xs, ys)
+
+    monkeypatch.setattr(sys, 'argv', ['import_dataset.py', '--path', str(tmp_path)])
+    import_dataset.main()
+
+    data = Dataset(str(tmp_path))
+
+    assert data.data is not None
+    assert np.array_equal(data[:], xs) and np.array_equal(data.labels, ys)
+
+def test_load_dataset_shared(tmp_path, samples):
+    xs, ys = samples
+    write_samples(tmp_path, xs, ys)
+
+    data = load_dataset(str(tmp_path))
+    assert data.labels is None
+
+    # the labels given later are set on the shared dataset
+    assert load_dataset(str(tmp_path), pathY=str(tmp_path / 'labels.txt')) is data
+    assert np.array_equal(data.labels, ys)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import model.lib_cache as lib_cache
+
+from json_parser import parse_cached_model, parse_model
+from solver.refinement_impl import Poly
+
+
+def get_spec(dtype=None):
+    spec = {'shape': '[1,2]', 'bounds': '[(-1,1)]', 'layers': [{'type': 'linear',
+        'weights': '[[1.0,-1.0],[0.5,2.0]]', 'bias': '[0.1,-0.2]', 'func': 'relu'}]}
+
+    if dtype is not None:
+        spec['dtype'] = dtype
+
+    return spec
+
+
+@pytest.mark.parametrize('cache', [False, True])
+def test_model_without_dtype_is_float64(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(lib_cache, 'CACHE_DIR', str(tmp_path) if cache else '')
+
+    for _ in range(2 if cache else 1):
+        model32 = parse_cached_model(get_spec('float32'), None)
+        assert model32.dtype == np.float32
+
+        model64 = parse_cached_model(get_spec(), None)
+        assert model64.dtype == np.float64
+
+        assert model64.apply(np.array([0.5, -0.5])).dtype == np.float64
+        assert model32.apply(np.array([0.5, -0.5])).dtype == np.float32
+
+
+def get_output_poly(model):
+    x_poly = Poly()
+    x_poly.lw, x_poly.up = model.lower.copy(), model.upper.copy()
+    x_poly.shape = (1, len(model.lower))
+
+    lst_poly = [x_poly]
+    for idx in range(len(model.layers)):
+        lst_poly.append(model.forward(lst_poly[idx], idx, lst_poly))
+
+    return lst_poly[-1]
+
+
+def test_models_keep_their_dtype(tmp_path):
+    # the dtype is read like the other keys, from the text or a file
+    dtype_file = tmp_path / 'dtype.txt'
+    dtype_file.write_text('float32\n')
+
+    model32 = parse_model(get_spec(str(dtype_file)))
+    model64 = parse_model(get_spec())
+
+    # parsing, casting or running one model does not change the polys of the other
+    ref64 = get_output_poly(model64)
+    res32 = get_output_poly(model32)
+    res64 = get_output_poly(model64)
+
+    model32.copy().cast(np.float64)
+    res32_again = get_output_poly(model32)
+
+    assert res32.le.dtype == np.float32 and res32_again.le.dtype == np.float32
+    assert res64.le.dtype == np.float64
+
+    assert res64.lw.tobytes() == ref64.lw.tobytes() and res64.up.tobytes() == ref64.up.tobytes()
+    assert np.all(res32.lw <= res64.lw) and np.all(res32.up >= res64.up)
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+import model.lib_layers as lib_layers
+
+from model.lib_layers import Function
+from solver.refinement_impl import Poly
+from utils import sigmoid, tanh
+
+
+# the relaxations of Function.apply_poly as they were computed neuron by neuron
+def apply_poly_loop(name, x_poly, dtype):
+    no_neurons = len(x_poly.lw)
+
+    res = Poly()
+    res.lw = np.zeros(no_neurons, dtype=dtype)
+    res.up = np.zeros(no_neurons, dtype=dtype)
+    res.le = np.zeros([no_neurons, 2], dtype=dtype)
+    res.ge = np.zeros([no_neurons, 2], dtype=dtype)
+
+    if name == 'relu':
+        for i in range(no_neurons):
+            if x_poly.up[i] <= 0:
+                pass
+            elif x_poly.lw[i] >= 0:
+                res.le[i,0] = 1
+                res.ge[i,0] = 1
+
+                res.lw[i] = x_poly.lw[i]
+                res.up[i] = x_poly.up[i]
+            else:
+                res.le[i,0] = x_poly.up[i] / (x_poly.up[i] - x_poly.lw[i])
+                res.le[i,-1] = - x_poly.up[i] * x_poly.lw[i] / (x_poly.up[i] - x_poly.lw[i])
+
+                lam = 0 if x_poly.up[i] <= -x_poly.lw[i] else 1
+
+                res.ge[i,0] = lam
+                res.lw[i] = 0
+                res.up[i] = x_poly.up[i]
+
+        return res
+
+    if name == 'sigmoid':
+        func = sigmoid
+        deriv = lambda x: sigmoid(x) * (1 - sigmoid(x))
+    else:
+        func = tanh
+        deriv = lambda x: 1 - pow(tanh(x), 2)
+
+    res.lw = func(x_poly.lw)
+    res.up = func(x_poly.up)
+
+    for i in range(no_neurons):
+        if x_poly.lw[i] == x_poly.up[i]:
+            res.le[i][-1] = res.lw[i]
+            res.ge[i][-1] = res.lw[i]
+        else:
+            if x_poly.lw[i] > 0:
+                lam1 = (res.up[i] - res.lw[i]) / (x_poly.up[i] - x_poly.lw[i])
+                if x_poly.up[i] <= 0:
+                    lam2 = lam1
+                else:
+                    lam2 = min(deriv(x_poly.lw[i]), deriv(x_poly.up[i]))
+            else:
+                lam1 = min(deriv(x_poly.lw[i]), deriv(x_poly.up[i]))
+                if x_poly.up[i] <= 0:
+                    lam2 = (res.up[i] - res.lw[i]) / (x_poly.up[i] - x_poly.lw[i])
+                else:
+                    lam2 = lam1
+
+            res.ge[i,0] = lam1
+            res.ge[i,-1] = res.lw[i] - lam1 * x_poly.lw[i]
+
+            res.le[i,0] = lam2
+            res.le[i,-1] = res.up[i] - lam2 * x_poly.up[i]
+
+    return res
+
+
+# dead, active and unstable neurons, neurons with a bound at 0 and lw == up
+def get_poly(seed, dtype, no_neurons=4099):
+    rng = np.random.RandomState(seed)
+
+    a = (rng.randn(no_neurons) * 3).astype(dtype)
+    b = a + (np.abs(rng.randn(no_neurons)) * rng.choice([0, 1e-7, 0.1, 3], no_neurons)).astype(dtype)
+
+    b[::7] = a[::7]
+    a[::11] = 0
+    b[::13] = 0
+
+    x_poly = Poly()
+    x_poly.lw, x_poly.up = np.minimum(a, b), np.maximum(a, b)
+    x_poly.shape = (1, no_neurons)
+
+    assert np.any(x_poly.up <= 0) and np.any(x_poly.lw > 0)
+    assert np.any((x_poly.lw < 0) & (x_poly.up > 0)) and np.any(x_poly.lw == x_poly.up)
+
+    return x_poly
+
+
+@pytest.mark.parametrize('name', ['relu', 'sigmoid', 'tanh'])
+@pytest.mark.parametrize('seed', range(10))
+def test_apply_poly_float64(name, seed):
+    x_poly = get_poly(seed, np.float64)
+
+    res = Function(name, None).apply_poly(x_poly, [x_poly], np.float64)
+    ref = apply_poly_loop(name, x_poly, np.float64)
+
+    for x, y in zip((res.lw, res.up, res.le, res.ge), (ref.lw, ref.up, ref.le, ref.ge)):
+        assert x.dtype == y.dtype
+        assert x.tobytes() == y.tobytes()
+
+
+@pytest.mark.parametrize('name', ['relu', 'sigmoid', 'tanh'])
+def test_apply_poly_float32(name, monkeypatch):
+    # the loop promoted some slopes to float64 through numpy scalar casting,
+    # so compare before widen, within float32 rounding
+    monkeypatch.setattr(lib_layers, 'widen', lambda res, x_poly, dtype: None)
+
+    x_poly = get_poly(0, np.float32)
+
+    res = Function(name, None).apply_poly(x_poly, [x_poly], np.float32)
+    ref = apply_poly_loop(name, x_poly, np.float32)
+
+    for x, y in zip((res.lw, res.up, res.le, res.ge), (ref.lw, ref.up, ref.le, ref.ge)):
+        assert np.allclose(x, y, rtol=1e-5, atol=1e-6)
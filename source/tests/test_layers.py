@@ -0,0 +1,269 @@
+import gc
+import autograd
+import numpy as np
+import pytest
+
+import model.lib_layers as lib_layers
+
+from model.lib_layers import Conv1d, Conv2d, Conv3d, Function, Linear
+from model.lib_layers import MaxPool1d, MaxPool2d, MaxPool3d
+from model.lib_models import Model
+from solver.refinement_impl import Poly
+from utils import windows
+
+
+def apply_conv(layer, x):
+    # the windows contracted with the filters by tensordot
+    k = layer.filters.ndim - 2
+    p = layer.padding
+
+    x_pad = np.pad(x, ((0, 0), (0, 0)) + ((p, p),) * k)
+    res = np.tensordot(windows(x_pad, layer.filters.shape[2:], layer.stride), layer.filters,
+        axes=([1, *range(2 + k, 2 + 2 * k)], list(range(1, 2 + k))))
+
+    return np.moveaxis(res, -1, 1) + layer.bias.reshape(-1, *[1] * k)
+
+
+@pytest.mark.parametrize('conv, k', [(Conv1d, 1), (Conv2d, 2), (Conv3d, 3)])
+@pytest.mark.parametrize('stride, padding', [(1, 0), (2, 1), (3, 2)])
+def test_conv_buffer(conv, k, stride, padding):
+    rng = np.random.default_rng(k)
+    layer = conv(rng.standard_normal((4, 3) + (3,) * k), rng.standard_normal(4), stride, padding)
+
+    # the buffer is reused for the same shape and reallocated for a new one
+    buffers = []
+
+    for n, dtype in [(2, np.float64), (2, np.float64), (5, np.float64), (5, np.float32)]:
+        x = rng.standard_normal((n, 3) + (7,) * k)
+
+        layer.cast(dtype)
+        res = layer.apply(x.astype(dtype))
+
+        assert res.dtype == dtype
+        assert np.allclose(res, apply_conv(layer, x), atol=1e-4)
+
+        buffers.append(lib_layers._buffers.layers[layer])
+
+    assert buffers[0] is buffers[1] and buffers[1] is not buffers[2]
+    assert buffers[3].dtype == np.float32
+
+def test_conv_buffer_threads():
+    rng = np.random.default_rng(0)
+    layer = Conv2d(rng.standard_normal((4, 3, 3, 3)), rng.standard_normal(4), 1, 1)
+    model = Model(np.array([1, 3, 8, 8]), np.zeros(192), np.ones(192), [layer], None)
+
+    xs = rng.standard_normal((97, 192))
+    expected = apply_conv(layer, xs.reshape(-1, 3, 8, 8))
+
+    # each thread writes the windows of its shard to its own buffer
+    for _ in range(10):
+        assert np.allclose(model.apply_many(xs, no_threads=8), expected)
+
+    # the buffers go away with their layer
+    del model, layer
+    gc.collect()
+
+    assert len(lib_layers._buffers.layers) == 0
+
+
+def get_layers(kind, rng):
+    # the input shape and the layers of a model around one layer of kind
+    if kind in ('relu', 'sigmoid', 'tanh'):
+        return [1, 5], [Linear(rng.standard_normal((4, 5)), rng.standard_normal(4), None),
+            Function(kind, None), Linear(rng.standard_normal((3, 4)), rng.standard_normal(3), kind)]
+    elif kind == 'transpose':
+        return [1, 3, 4], [Function('transpose', [0, 2, 1]), Function('reshape', [1, 12])]
+    elif kind == 'conv1d':
+        return [1, 2, 9], [Conv1d(rng.standard_normal((3, 2, 3)), rng.standard_normal(3), 2, 1)]
+    elif kind == 'conv2d':
+        return [1, 2, 7, 7], [Conv2d(rng.standard_normal((3, 2, 3, 3)), rng.standard_normal(3), 2, 1)]
+    elif kind == 'conv3d':
+        return [1, 2, 5, 5, 5], [Conv3d(rng.standard_normal((3, 2, 3, 3, 3)), rng.standard_normal(3), 1, 1)]
+    elif kind == 'maxpool1d':
+        return [1, 2, 9], [MaxPool1d(3, 2, 1)]
+    elif kind == 'maxpool2d':
+        return [1, 2, 7, 7], [MaxPool2d((3, 2), 2, 1)]
+    elif kind == 'maxpool3d':
+        return [1, 2, 5, 5, 5], [MaxPool3d((2, 2, 2), 1, 0)]
+
+
+@pytest.mark.parametrize('kind', ['relu', 'sigmoid', 'tanh', 'transpose', 'conv1d', 'conv2d',
+    'conv3d', 'maxpool1d', 'maxpool2d', 'maxpool3d'])
+def test_value_and_grad(kind):
+    rng = np.random.default_rng(0)
+    shape, layers = get_layers(kind, rng)
+
+    size = int(np.prod(shape))
+
+    # the output is flattened and weighted into one value per input by the loss
+    model = Model(np.array(shape), np.full(size, -1.0), np.full(size, 1.0), layers, None)
+    assert all(layer.has_backward() for layer in model.layers)
+
+    xs = rng.uniform(-1, 1, (4, size))
+    weights = rng.standard_normal(model.apply_batch(xs).size // len(xs))
+
+    def loss(output):
+        return autograd.numpy.sum(autograd.numpy.tanh(output.reshape(len(output), -1) @ weights))
+
+    value, g, output = model.value_and_grad(xs, loss, with_output=True)
+
+    # autograd through the gather plans of apply_batch
+    ref_value, ref_g = autograd.value_and_grad(lambda x: loss(model.apply_batch(x)))(xs)
+
+    assert np.allclose(value, ref_value) and np.allclose(output, model.apply_batch(xs))
+    assert g.shape == xs.shape and np.allclose(g, ref_g)
+
+    # one flattened input
+    value, g = model.value_and_grad(xs[0], loss)
+    ref_g = autograd.grad(lambda x: loss(model.apply_batch(x.reshape(1, -1))))(xs[0])
+
+    assert g.shape == xs[0].shape and np.allclose(g, ref_g)
+
+
+def get_input_poly(shape, rng):
+    x_poly = Poly()
+    x_poly.lw = rng.uniform(-1, 0, int(np.prod(shape)))
+    x_poly.up = x_poly.lw + rng.uniform(0, 1, len(x_poly.lw))
+    x_poly.shape = tuple(shape)
+
+    return x_poly
+
+def get_affine(layer, shape):
+    # the dense matrix and the constants of an affine layer, one row per output
+    size = int(np.prod(shape))
+
+    const = layer.apply(np.zeros((1, *shape[1:]))).reshape(-1)
+    coefs = layer.apply(np.eye(size).reshape(size, *shape[1:])).reshape(size, -1) - const
+
+    return coefs.T, const
+
+
+@pytest.mark.parametrize('stride, padding', [(1, 0), (2, 1), (1, 2)])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_conv_poly(stride, padding, dtype):
+    rng = np.random.default_rng(stride + padding)
+    layer = Conv2d(rng.standard_normal((3, 2, 3, 3)), rng.standard_normal(3), stride, padding)
+    layer.cast(dtype)
+
+    shape = [1, 2, 6, 7]
+    x_poly = get_input_poly(shape, rng)
+
+    res = layer.apply_poly(x_poly, [x_poly], dtype)
+
+    # the weights in dtype, applied in float64
+    layer = Conv2d(layer.filters.astype(np.float64), layer.bias.astype(np.float64), stride, padding)
+    coefs, const = get_affine(layer, shape)
+
+    assert res.shape == (1, 3) + layer.apply(np.zeros(shape)).shape[2:]
+
+    # le and ge are sparse, with the weights of the filters on the inputs they read
+    assert res.le.format == 'csr' and res.le.dtype == dtype
+    assert res.le.nnz <= layer.filters[0].size * len(const) + len(const)
+
+    le = np.concatenate([coefs, const.reshape(-1, 1)], axis=1)
+    assert np.allclose(res.le.toarray(), le, atol=1e-6) and np.allclose(res.ge.toarray(), le, atol=1e-6)
+
+    # the bounds of the affine map on the input box, moved outward in float32
+    lw = np.maximum(coefs, 0) @ x_poly.lw + np.minimum(coefs, 0) @ x_poly.up + const
+    up = np.maximum(coefs, 0) @ x_poly.up + np.minimum(coefs, 0) @ x_poly.lw + const
+
+    assert np.all(res.lw <= lw + 1e-9) and np.all(up <= res.up + 1e-9)
+    assert np.allclose(res.lw, lw, atol=1e-3) and np.allclose(res.up, up, atol=1e-3)
+
+    xs = rng.uniform(x_poly.lw, x_poly.up, (500, len(x_poly.lw)))
+    outputs = layer.apply(xs.reshape(-1, *shape[1:])).reshape(len(xs), -1)
+
+    assert np.all(res.lw <= outputs + 1e-9) and np.all(outputs <= res.up + 1e-9)
+
+
+# the relaxation of MaxPool2d.apply_poly as it was computed window by window,
+# with le and ge on the padded inputs
+def pool_poly_loop(layer, x_poly):
+    k_h, k_w = layer.kernel
+    p, s = layer.padding, layer.stride
+
+    lw = np.pad(x_poly.lw.reshape(x_poly.shape), ((0, 0), (0, 0), (p, p), (p, p)))
+    up = np.pad(x_poly.up.reshape(x_poly.shape), ((0, 0), (0, 0), (p, p), (p, p)))
+    _, x_c, x_h, x_w = lw.shape
+
+    res_h, res_w = (x_h - k_h) // s + 1, (x_w - k_w) // s + 1
+
+    res_lw, res_up = np.zeros(x_c * res_h * res_w), np.zeros(x_c * res_h * res_w)
+    le = np.zeros([len(res_lw), x_c * x_h * x_w + 1])
+    ge = np.zeros([len(res_lw), x_c * x_h * x_w + 1])
+
+    i = 0
+    for c in range(x_c):
+        for o_h in range(res_h):
+            for o_w in range(res_w):
+                mx_lw, mx_idx = -1e9, None
+
+                for h in range(o_h * s, o_h * s + k_h):
+                    for w in range(o_w * s, o_w * s + k_w):
+                        if lw[0, c, h, w] > mx_lw:
+                            mx_lw, mx_idx = lw[0, c, h, w], (c * x_h + h) * x_w + w
+
+                mx_up, cnt = -1e9, 0
+
+                for h in range(o_h * s, o_h * s + k_h):
+                    for w in range(o_w * s, o_w * s + k_w):
+                        mx_up = max(mx_up, up[0, c, h, w])
+
+                        if (c * x_h + h) * x_w + w != mx_idx and up[0, c, h, w] > mx_lw:
+                            cnt += 1
+
+                res_lw[i], res_up[i] = mx_lw, mx_up
+
+                ge[i, mx_idx] = 1
+                if cnt > 0:
+                    le[i, -1] = mx_up
+                else:
+                    le[i, mx_idx] = 1
+
+                i += 1
+
+    return res_lw, res_up, le, ge
+
+def unpad(coefs, shape, p):
+    # the columns of the padded inputs moved to the inputs, the padding is 0
+    _, x_c, x_h, x_w = shape
+    cols = coefs[:, :-1].reshape(-1, x_c, x_h + 2 * p, x_w + 2 * p)[:, :, p:p + x_h, p:p + x_w]
+
+    return np.concatenate([cols.reshape(len(coefs), -1), coefs[:, -1:]], axis=1)
+
+
+@pytest.mark.parametrize('kernel, stride, padding', [((2, 2), 2, 0), ((3, 2), 1, 1), ((3, 3), 2, 1)])
+@pytest.mark.parametrize('seed', range(3))
+def test_pool_poly(kernel, stride, padding, seed):
+    rng = np.random.default_rng(seed)
+    layer = MaxPool2d(kernel, stride, padding)
+
+    shape = [1, 3, 6, 7]
+    x_poly = get_input_poly(shape, rng)
+
+    # some windows have one input above the others, and their max is exact
+    x_poly.lw[::5] += 2
+    x_poly.up[::5] += 2
+
+    res = layer.apply_poly(x_poly, [x_poly], np.float64)
+    lw, up, le, ge = pool_poly_loop(layer, x_poly)
+
+    assert res.shape == layer.apply(np.zeros(shape)).shape
+    assert np.array_equal(res.lw, lw) and np.array_equal(res.up, up)
+
+    # one input or the constant per row
+    assert res.le.format == 'csr' and res.ge.format == 'csr'
+    assert np.all(np.diff(res.le.indptr) <= 1) and np.all(np.diff(res.ge.indptr) <= 1)
+
+    assert np.array_equal(res.le.toarray(), unpad(le, shape, padding))
+    assert np.array_equal(res.ge.toarray(), unpad(ge, shape, padding))
+
+    xs = rng.uniform(x_poly.lw, x_poly.up, (500, len(x_poly.lw)))
+    outputs = layer.apply(xs.reshape(-1, *shape[1:])).reshape(len(xs), -1)
+
+    assert np.all(res.lw <= outputs) and np.all(outputs <= res.up)
+
+    le, ge = res.le.toarray(), res.ge.toarray()
+
+    assert np.all(outputs <= xs @ le[:, :-1].T + le[:, -1] + 1e-9)
+    assert np.all(xs @ ge[:, :-1].T + ge[:, -1] - 1e-9 <= outputs)
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+
+SOLVER_MODULES = ['torch', 'gurobipy', 'sklearn', 'pyswarms', 'gensim', 'matplotlib', 'scipy.optimize']
+
+# seconds to import json_parser with its dependencies, about 0.2 here, while torch
+# alone takes 1.7 and sklearn 0.5
+IMPORT_BUDGET = 1.0
+
+
+def run_python(*args):
+    source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    return subprocess.run([sys.executable, *args], cwd=source_dir,
+        capture_output=True, text=True, check=True)
+
+
+# parsing a spec must not pull in the dependencies of the solvers it may not use
+def test_json_parser_does_not_import_solver_modules():
+    code = 'import sys, json_parser; print(" ".join(m for m in {} if m in sys.modules))'.format(SOLVER_MODULES)
+    output = run_python('-c', code).stdout
+
+    assert output.split() == []
+
+
+def test_json_parser_import_time():
+    # the cumulative time of json_parser reported by -X importtime, in microseconds,
+    # which leaves out the start of the interpreter
+    stderr = run_python('-X', 'importtime', '-c', 'import json_parser').stderr
+    line = [line for line in stderr.splitlines() if line.endswith('| json_parser')][0]
+
+    assert int(line.split('|')[1]) / 1e6 < IMPORT_BUDGET
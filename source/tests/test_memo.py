@@ -0,0 +1,132 @@
+import numpy as np
+
+from json_parser import parse_memo
+from model.lib_layers import Function, Linear
+from model.lib_memo import Memo
+from model.lib_models import Model
+
+
+class Counter:
+    # a function that counts its calls
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, x):
+        self.calls += 1
+        return x * 2
+
+
+def get_model():
+    rng = np.random.default_rng(0)
+    layers = [Linear(rng.standard_normal((3, 4)), rng.standard_normal(3), None),
+        Function('relu', None), Linear(rng.standard_normal((2, 3)), rng.standard_normal(2), None)]
+
+    return Model(np.array([1, 4]), np.zeros(4), np.ones(4), layers, None)
+
+
+def test_hits_and_misses():
+    memo, func = Memo(), Counter()
+    x = np.arange(4.0)
+
+    assert np.array_equal(memo.apply(func, x), x * 2)
+    assert memo.apply(func, x.copy()) is memo.apply(func, x)
+    assert func.calls == 1 and memo.get_stats() == (2, 1, 2 / 3)
+
+    # the same bytes with another shape or dtype are other inputs
+    memo.apply(func, x.reshape(2, 2))
+    memo.apply(func, x.astype(np.float32))
+    assert func.calls == 3 and memo.get_stats()[:2] == (2, 3)
+
+    # the inputs that are not arrays are not kept
+    assert memo.apply(func, 3) == 6 and memo.apply(func, 3) == 6
+    assert func.calls == 5 and len(memo.entries) == 3
+
+def test_least_recently_used_size():
+    memo, func = Memo(size=2), Counter()
+    xs = [np.full(4, i, dtype=float) for i in range(3)]
+
+    memo.apply(func, xs[0])
+    memo.apply(func, xs[1])
+
+    # x0 is used again, so x1 goes out when x2 comes in
+    memo.apply(func, xs[0])
+    memo.apply(func, xs[2])
+    assert len(memo.entries) == 2 and func.calls == 3
+
+    memo.apply(func, xs[0])
+    memo.apply(func, xs[2])
+    assert func.calls == 3
+
+    memo.apply(func, xs[1])
+    assert func.calls == 4 and len(memo.entries) == 2
+
+    # a memo of size 0 keeps nothing
+    memo, func = Memo(size=0), Counter()
+    memo.apply(func, xs[0])
+    memo.apply(func, xs[0])
+    assert func.calls == 2 and len(memo.entries) == 0 and memo.get_stats() == (0, 0, 0.0)
+
+def test_byte_budget():
+    x_nbytes = np.zeros(8).nbytes
+
+    # an entry keeps the input and the output, room for two entries
+    memo, func = Memo(size=100, budget=5 * x_nbytes), Counter()
+    xs = [np.full(8, i, dtype=float) for i in range(3)]
+
+    for x in xs:
+        memo.apply(func, x)
+
+    assert len(memo.entries) == 2 and memo.nbytes == 4 * x_nbytes
+
+    memo.apply(func, xs[0])
+    assert func.calls == 4
+
+    # an entry larger than the budget is computed but not kept
+    big = np.zeros(32)
+    memo.apply(func, big)
+    memo.apply(func, big)
+    assert func.calls == 6 and len(memo.entries) == 2 and memo.nbytes == 4 * x_nbytes
+
+    memo.clear()
+    assert len(memo.entries) == 0 and memo.nbytes == 0
+
+def test_model_memo():
+    model = get_model()
+    x = np.random.default_rng(1).uniform(0, 1, 4)
+
+    output = model.apply_memo(x)
+    assert np.allclose(output, model.apply(x))
+    assert model.apply_memo(x) is output and model.memo.get_stats()[:2] == (1, 1)
+
+    # the outputs of another dtype are not taken from the memo
+    model.cast(np.float32)
+    assert len(model.memo.entries) == 0
+    assert model.apply_memo(x).dtype == np.float32
+
+def test_copy_has_own_memo():
+    model = get_model()
+    model.memo = Memo(size=7, budget=1000)
+
+    x = np.random.default_rng(2).uniform(0, 1, 4)
+    output = model.apply_memo(x)
+
+    new_model = model.copy()
+    memo = new_model.memo
+
+    assert memo is not model.memo and (memo.size, memo.budget) == (7, 1000)
+    assert len(memo.entries) == 0 and memo.get_stats() == (0, 0, 0.0)
+
+    # the copy computes its own outputs and does not fill the memo of the model
+    new_output = new_model.apply_memo(x)
+    assert new_output is not output and np.allclose(new_output, output)
+    assert memo.get_stats()[:2] == (0, 1) and model.memo.get_stats()[:2] == (0, 1)
+
+    new_model.apply_memo(x + 1)
+    assert len(memo.entries) == 2 and len(model.memo.entries) == 1
+
+def test_parse_memo():
+    memo = parse_memo({})
+    assert (memo.size, memo.budget) == (1024, 2 ** 27)
+
+    memo = parse_memo({'memo_size': '16', 'memo_budget': '4096'})
+    assert (memo.size, memo.budget) == (16, 4096)
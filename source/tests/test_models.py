@@ -0,0 +1,95 @@
+import pickle
+import numpy as np
+
+import model.lib_models as lib_models
+
+from model.lib_layers import Function, Linear
+from model.lib_models import Model
+
+
+def get_model(threads=None):
+    rng = np.random.default_rng(0)
+    layers = [Linear(rng.standard_normal((3, 4)), rng.standard_normal(3), None),
+        Function('relu', None), Linear(rng.standard_normal((2, 3)), rng.standard_normal(2), None)]
+
+    return Model(np.array([1, 4]), np.zeros(4), np.ones(4), layers, None, threads)
+
+
+def test_apply_many_reuses_executor(monkeypatch):
+    monkeypatch.setattr(lib_models, 'NO_THREADS', 4)
+
+    model = get_model()
+    xs = np.random.default_rng(1).uniform(0, 1, (50, 4))
+    expected = model.apply_batch(xs)
+
+    assert np.allclose(model.apply_many(xs), expected)
+    executor = model.executor
+
+    assert executor is not None and model.no_workers == 4
+
+    for _ in range(5):
+        assert np.allclose(model.apply_many(xs), expected)
+        assert np.allclose(model.apply_many(xs, no_threads=2), expected)
+
+    assert model.executor is executor
+
+    # more threads than the pool has replace it
+    assert np.allclose(model.apply_many(xs, no_threads=6), expected)
+    assert model.executor is not executor and model.no_workers == 6
+
+def test_apply_many_threads_of_spec():
+    model = get_model(threads=3)
+    xs = np.random.default_rng(2).uniform(0, 1, (50, 4))
+
+    assert np.allclose(model.apply_many(xs), model.apply_batch(xs))
+    assert model.no_workers == 3
+
+    # one shard runs on the calling thread
+    model = get_model(threads=1)
+
+    assert np.allclose(model.apply_many(xs), model.apply_batch(xs))
+    assert model.executor is None
+
+def test_executor_not_shared():
+    model = get_model()
+    xs = np.random.default_rng(3).uniform(0, 1, (50, 4))
+    model.apply_many(xs, no_threads=2)
+
+    new_model = model.copy()
+    assert new_model.executor is None and new_model.threads == model.threads
+
+    loaded = pickle.loads(pickle.dumps(model))
+    assert loaded.executor is None and model.executor is not None
+
+    assert np.allclose(loaded.apply_many(xs, no_threads=2), model.apply_batch(xs))
+    assert loaded.executor is not model.executor
+
+
+def test_reshape_single_and_batch():
+    rng = np.random.default_rng(4)
+    linear = Linear(rng.standard_normal((3, 4)), rng.standard_normal(3), None)
+
+    # one input whose leading axis is not 1 in the middle of the model
+    layers = [Function('reshape', [4, 1]), Function('transpose', [1, 0]),
+        Function('reshape', [1, 4]), linear]
+    model = Model(np.array([1, 4]), np.zeros(4), np.ones(4), layers, None)
+
+    x = rng.uniform(0, 1, 4)
+    assert np.allclose(model.apply(x), x.reshape(1, 4) @ linear.weights + linear.bias)
+
+    # a batch keeps its leading axis through the reshapes
+    layers = [Function('reshape', [1, 2, 2]), Function('reshape', [1, 4]), linear]
+    model = Model(np.array([1, 4]), np.zeros(4), np.ones(4), layers, None)
+
+    xs = rng.uniform(0, 1, (5, 4))
+    assert np.allclose(model.apply_batch(xs), xs @ linear.weights + linear.bias)
+    assert np.allclose(model.apply_batch(xs[:1]), model.apply(xs[0]))
+
+def test_sprt_batch_size():
+    from json_parser import parse_solver
+
+    spec = {'algorithm': 'sprt', 'threshold': '0.9', 'alpha': '0.01', 'beta': '0.01',
+        'delta': '0.005'}
+
+    assert parse_solver(spec).batch_size == 100
+    assert parse_solver(dict(spec, batch_size='250')).batch_size == 250
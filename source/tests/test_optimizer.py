@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+
+from model.lib_layers import Function, Linear
+from model.lib_models import Model
+from model.lib_optimizer import optimize_model
+from solver.refinement_impl import Poly
+
+
+def get_model(seed, name):
+    rng = np.random.RandomState(seed)
+    sizes = [4, 8, 6, 3]
+
+    layers = [Linear(rng.randn(sizes[1], sizes[0]), rng.randn(sizes[1]), None), Function(name, None),
+        Linear(rng.randn(sizes[2], sizes[1]), rng.randn(sizes[2]), None), Function('relu', None),
+        Linear(rng.randn(sizes[3], sizes[2]), rng.randn(sizes[3]), None)]
+
+    lower = rng.rand(sizes[0]) - 1
+    upper = lower + rng.rand(sizes[0])
+
+    return Model(np.array([1, sizes[0]]), lower, upper, layers, None)
+
+
+def get_output_poly(model):
+    x_poly = Poly()
+    x_poly.lw, x_poly.up = model.lower.copy(), model.upper.copy()
+    x_poly.shape = (1, len(model.lower))
+
+    lst_poly = [x_poly]
+    for idx in range(len(model.layers)):
+        lst_poly.append(model.forward(lst_poly[idx], idx, lst_poly))
+
+    return lst_poly[-1]
+
+
+@pytest.mark.parametrize('name', ['relu', 'sigmoid', 'tanh'])
+@pytest.mark.parametrize('seed', range(5))
+def test_fused_apply_poly(name, seed):
+    model = get_model(seed, name)
+
+    fused = model.copy()
+    optimize_model(fused, True)
+    assert len(fused.layers) == 3 and fused.layers[0].func != None
+
+    res = get_output_poly(model)
+    res_fused = get_output_poly(fused)
+
+    assert np.allclose(res.lw, res_fused.lw) and np.allclose(res.up, res_fused.up)
+
+    xs = model.lower + np.random.RandomState(seed).rand(1000, len(model.lower)) * (model.upper - model.lower)
+    ys = fused.apply_batch(xs)
+
+    assert np.all(ys >= res_fused.lw) and np.all(ys <= res_fused.up)
+
+
+@pytest.mark.parametrize('name', ['relu', 'sigmoid', 'tanh'])
+def test_fused_apply_poly_float32(name):
+    model = get_model(0, name)
+
+    fused = model.copy()
+    optimize_model(fused, True)
+
+    fused.cast(np.float32)
+    res_fused = get_output_poly(fused)
+    assert res_fused.le.dtype == np.float32
+
+    xs = model.lower + np.random.RandomState(0).rand(1000, len(model.lower)) * (model.upper - model.lower)
+    ys = model.apply_batch(xs)
+
+    assert np.all(ys >= res_fused.lw) and np.all(ys <= res_fused.up)
+
+
+def test_layer_map():
+    def get_linear(no_in, no_out):
+        return Linear(np.ones((no_out, no_in)), np.ones(no_out), None)
+
+    # a leading no-op reshape, two linear layers folded into one,
+    # and a no-op reshape after the activation
+    layers = [Function('reshape', [1, 4]), get_linear(4, 5), get_linear(5, 3), Function('relu', None),
+        Function('reshape', [1, 3]), get_linear(3, 2)]
+
+    model = Model(np.array([1, 4]), np.zeros(4), np.ones(4), layers, None)
+    optimize_model(model, False)
+
+    assert [type(layer) for layer in model.layers] == [Linear, Function, Linear]
+
+    assert [model.get_layer_idx(idx) for idx in [-1, 2, 3, 4, 5]] == [-1, 0, 1, 1, 2]
+    assert [model.get_spec_layer_idx(idx) for idx in [-1, 0, 1, 2]] == [-1, 2, 3, 5]
+
+    for idx in [0, 1]:
+        with pytest.raises(NameError):
+            model.get_layer_idx(idx)
+
+    assert model.get_layer_idxs([3, 5]) == [1, 2]
+
+    with pytest.raises(NameError):
+        model.get_layer_idxs([3, 4])
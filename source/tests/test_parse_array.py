@@ -0,0 +1,102 @@
+import ast
+import numpy as np
+import pytest
+
+import utils
+
+from utils import parse_array
+
+
+def literal_array(text):
+    try:
+        return np.array(ast.literal_eval(text))
+    except Exception as e:
+        return type(e)
+
+def parsed_array(text):
+    try:
+        return parse_array(text)
+    except Exception as e:
+        return type(e)
+
+def check(text):
+    expected, result = literal_array(text), parsed_array(text)
+
+    if isinstance(expected, type):
+        assert result is expected, text
+    else:
+        assert isinstance(result, np.ndarray), text
+        assert result.dtype == expected.dtype and result.shape == expected.shape, text
+        if expected.dtype == object:
+            assert result.tolist() == expected.tolist(), text
+        else:
+            assert result.tobytes() == expected.tobytes(), text
+
+
+def random_number(rng, is_float):
+    # mostly plain numbers, so most lists take the fast path
+    if not is_float:
+        if rng.random() < 0.05:
+            return rng.choice(['0', '00', '-0', '+7', '01', '-007'])
+        return str(rng.integers(-10 ** 6, 10 ** 6))
+    else:
+        if rng.random() < 0.05:
+            return rng.choice(['-.25', '1.', '+1e5', '1E-5', '007.5', '01e5',
+                               '-0.0', '1e400', '1e-06'])
+        return repr(rng.standard_normal() * 10.0 ** rng.integers(-8, 8))
+
+def random_list(rng, shape, is_float, ragged):
+    if len(shape) == 0:
+        return random_number(rng, is_float)
+
+    n = shape[0] + (rng.integers(-1, 2) if ragged and rng.random() < 0.3 else 0)
+    items = [random_list(rng, shape[1:], is_float, ragged) for _ in range(max(n, 1))]
+
+    sep = rng.choice([',', ', ', ' ,', ',\n  '])
+    text = sep.join(items) + (',' if rng.random() < 0.05 else '')
+
+    return '(' + text + ')' if rng.random() < 0.2 else '[' + text + ']'
+
+def random_text(rng):
+    shape = rng.integers(1, 4, size=rng.integers(1, 4))
+    return random_list(rng, shape, rng.random() < 0.5, rng.random() < 0.2)
+
+def mutate(rng, text):
+    chars = list(text)
+    i = rng.integers(len(chars))
+    op = rng.integers(3)
+
+    if op == 0:
+        del chars[i]
+    elif op == 1:
+        chars.insert(i, rng.choice(list('0123456789.eE+-,[]() ')))
+    else:
+        chars[i] = rng.choice(list('0123456789.eE+-,[]() '))
+
+    return ''.join(chars)
+
+
+@pytest.mark.parametrize('text', ['[1 2]', '[1,,2]', '[1, 2 ]', '[[1,2][3,4]]',
+    '[[1,2],[3,4]5]', '[[1,2],3]', '[1,2)', '[(1),(2)]', '[(1,2),(3,4)]', '(1,2)',
+    '[1,2,]', '[,1]', '[]', '[[]]', '[01]', '[00,0]', '[-01]', '[1e-06,01e5]',
+    '[1. 5]', '[1 .5]', '[1e 5]', '[- 1]', '[--1]', '[1]]', '[1]][[2]', '[1e400]', '[-0,1.5]', '[1.5,-00]',
+    '[12345678901234567890]', '[1.5,-12345678901234567890123]', '[1,2.5]', '  [1, 2]\n', '[1_0]', '[inf]', ''])
+def test_parse_array_edge_cases(text):
+    check(text)
+
+@pytest.mark.parametrize('chunk', [1, 2, 3, 16, 1 << 20])
+def test_parse_array_matches_literal_eval(chunk, monkeypatch):
+    monkeypatch.setattr(utils, 'CHUNK', chunk)
+    rng = np.random.default_rng(chunk)
+
+    for _ in range(300):
+        text = random_text(rng)
+        check(text)
+        check(mutate(rng, text))
+
+def test_parse_array_long_numbers_tiny_chunk(monkeypatch):
+    # no separator in the window, it has to grow
+    monkeypatch.setattr(utils, 'CHUNK', 2)
+
+    check('[[123456789.123456789,-987654321.5],[1e-300,2.5e300]]')
+    check('[[[1234567]],[[7654321]]]')
@@ -0,0 +1,85 @@
+import threading
+import numpy as np
+import pytest
+
+from model.lib_models import Model
+
+torch = pytest.importorskip('torch')
+
+
+def get_model(tmp_path):
+    torch.manual_seed(0)
+
+    module = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(4, 3), torch.nn.ReLU(),
+        torch.nn.Linear(3, 2))
+    path = str(tmp_path / 'model.pt')
+    torch.save(module, path)
+
+    shape = np.array([1, 2, 2])
+    lower, upper = np.full(4, -1.0), np.full(4, 1.0)
+
+    return Model(shape, lower, upper, None, path, threads=1), module
+
+def get_expected(module, xs):
+    with torch.no_grad():
+        return module(torch.tensor(xs, dtype=torch.float32).reshape(-1, 2, 2)).numpy()
+
+
+def test_torch_apply(tmp_path):
+    model, module = get_model(tmp_path)
+    xs = np.random.default_rng(0).uniform(-1, 1, (8, 4))
+
+    assert np.allclose(model.apply(xs[0]), get_expected(module, xs[:1]))
+    assert np.allclose(model.apply_batch(xs), get_expected(module, xs))
+    assert np.allclose(model.apply_many(xs, no_threads=3), get_expected(module, xs))
+
+def test_torch_buffers_per_thread(tmp_path):
+    model, _ = get_model(tmp_path)
+    ptmodel = model.ptmodel
+
+    # one buffer per thread, reused while the batch size does not change
+    buffer = ptmodel.get_buffer(5)
+    assert ptmodel.get_buffer(5) is buffer
+    assert ptmodel.get_buffer(2) is not buffer and len(ptmodel.get_buffer(2)) == 2
+
+    buffers = {}
+
+    def get_buffer(i):
+        buffers[i] = ptmodel.get_buffer(5)
+
+    threads = [threading.Thread(target=get_buffer, args=(i,)) for i in range(4)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = set(id(buffer) for buffer in buffers.values())
+    assert len(ids) == 4 and id(ptmodel.get_buffer(2)) not in ids
+
+def test_torch_apply_many_threads(tmp_path):
+    model, module = get_model(tmp_path)
+    xs = np.random.default_rng(1).uniform(-1, 1, (64, 4))
+    expected = get_expected(module, xs)
+
+    # the threads share the module but write their inputs to their own buffers
+    for _ in range(10):
+        assert np.allclose(model.apply_many(xs, no_threads=8), expected)
+
+def test_torch_copy(tmp_path):
+    model, module = get_model(tmp_path)
+    xs = np.random.default_rng(2).uniform(-1, 1, (8, 4))
+
+    new_model = model.copy()
+
+    assert new_model.ptmodel.module is not model.ptmodel.module
+    assert new_model.ptmodel.dtype == model.ptmodel.dtype
+    assert np.allclose(new_model.apply_batch(xs), model.apply_batch(xs))
+
+    # the copy has its own weights and buffers
+    with torch.no_grad():
+        new_model.ptmodel.module[1].bias.add_(1.0)
+
+    assert np.allclose(model.apply_batch(xs), get_expected(module, xs))
+    assert not np.allclose(new_model.apply_batch(xs), model.apply_batch(xs))
+    assert new_model.ptmodel.get_buffer(8) is not model.ptmodel.get_buffer(8)
@@ -1,8 +1,13 @@
 import autograd.numpy as np
+import ast
+import io
 import os
+import re
+import warnings
 
 from functools import partial, update_wrapper
-
+from itertools import product
+from numpy.lib.stride_tricks import sliding_window_view
 
 def read(text):
     if os.path.isfile(text):
@@ -10,6 +15,183 @@ def read(text):
     else:
         return text
 
+def read_array(text):
+    # arrays, e.g. samples of a dataset, are used directly, text is parsed
+    if isinstance(text, np.ndarray):
+        return text
+    else:
+        return parse_array(read(text))
+
+# size of the pieces of text scanned at a time by parse_array
+CHUNK = 1 << 20
+
+NUMBER = b'0123456789.eE+-,[]()'
+OPENS = b'[('
+WHITESPACE = b' \t\r\n'
+
+# number characters to n and whitespace to spaces, a number can not be split
+SPLIT = bytes.maketrans(b'0123456789.eE+-\t\r\n', b'n' * 15 + b'   ')
+
+# the kinds of the characters, 0 for numbers, 1 for opening brackets, 2 for
+# closing brackets and 3 for commas, and the pairs of kinds, 4 * previous +
+# next, which can not follow each other, e.g. empty fields or lists
+KINDS = bytes(b'[(])'.find(c) // 2 + 1 if c in b'[(])' else 3 * (c == ord(',')) for c in range(256))
+INVALID = bytes(pair in (1, 6, 7, 8, 9, 14, 15) for pair in range(16))
+
+# the integers, after the signs are removed, with leading zeros, e.g. 01 or
+# -007, and those which may not fit in int64, even among floats
+DIGITS = bytes.maketrans(b',[(0123456789.eE', b'ssszdddddddddfff')
+LEADING_ZERO = re.compile(b'sz[zd]*d[zd]*(?![zdf])')
+LONG_INTEGER = re.compile(b's[zd]{19,}(?![zdf])')
+
+def parse_array(text):
+    # same as np.array(ast.literal_eval(text)) for a nested list of numbers with
+    # a regular shape, without building the python lists: the text is scanned
+    # once to count the brackets and commas per depth, which give the shape, and
+    # once to write the numbers into the preallocated array; any other literal,
+    # or anything the scans are unsure of, falls back to literal_eval
+    import numpy as rnp
+
+    raw = text.encode('ascii', 'replace')
+    data = raw.translate(None, WHITESPACE)
+
+    depth = len(data) - len(data.lstrip(OPENS))
+
+    if depth == 0 or len(data.translate(None, NUMBER)) > 0:
+        return np.array(ast.literal_eval(text))
+
+    marks = raw.translate(SPLIT)
+    digits = data.translate(DIGITS, b'+-')
+
+    if (b'n ' in marks and re.search(b'n +n', marks)) \
+        or LEADING_ZERO.search(digits) or LONG_INTEGER.search(digits):
+        return np.array(ast.literal_eval(text))
+
+    # opens[d] is the number of lists at depth d, the lists at the same depth
+    # must all have the same number of commas, the current list at each depth
+    # carries its count over to the next chunk; with both kinds of brackets,
+    # the brackets and their levels are kept to match them after the scan
+    opens = rnp.zeros(depth + 2, dtype=rnp.int64)
+    level, kind = 0, 3
+    counts, carry = [None] * (depth + 1), [0] * (depth + 1)
+
+    is_mixed = b'(' in data or b')' in data
+    brackets, bracket_levels = [], []
+
+    kinds_of = rnp.frombuffer(KINDS, rnp.uint8)
+    is_invalid = rnp.frombuffer(INVALID, rnp.bool_)
+
+    for start in range(0, len(data), CHUNK):
+        chars = rnp.frombuffer(data, rnp.uint8, min(CHUNK, len(data) - start), start)
+
+        kinds = kinds_of[chars]
+        is_open, is_close, is_comma = kinds == 1, kinds == 2, kinds == 3
+
+        if rnp.any(is_invalid[4 * rnp.concatenate(([kind], kinds[:-1])) + kinds]):
+            return np.array(ast.literal_eval(text))
+
+        kind = kinds[-1]
+
+        levels = level + rnp.cumsum(is_open.astype(rnp.int16) - is_close, dtype=rnp.int16)
+        level = int(levels[-1])
+
+        if levels.min() < 0:
+            return np.array(ast.literal_eval(text))
+
+        if is_mixed:
+            is_bracket = is_open | is_close
+            brackets.append(chars[is_bracket])
+            bracket_levels.append(levels[is_bracket] + is_close[is_bracket])
+
+        for d in range(1, depth + 1):
+            at_d = levels == d
+            events = is_open[(is_open | is_comma) & at_d]
+
+            # the index, from the current list, of the list of each comma
+            ids = rnp.cumsum(events)[~events]
+            no_lists = int(rnp.count_nonzero(events))
+
+            local = rnp.bincount(ids, minlength=no_lists + 1)
+            local[0] += carry[d]
+
+            done = local[:no_lists] if opens[d] > 0 else local[1:no_lists]
+            carry[d] = int(local[no_lists])
+
+            if len(done) > 0:
+                if counts[d] is None:
+                    counts[d] = int(done[0])
+                if rnp.any(done != counts[d]):
+                    return np.array(ast.literal_eval(text))
+
+            opens[d] += no_lists
+
+        opens[depth + 1] += int(rnp.count_nonzero(levels[is_open] > depth))
+
+    # the last list at each depth, whose count was carried, gives the shape
+    shape = [carry[d] + 1 for d in range(1, depth + 1)]
+    size = int(opens[depth]) * shape[-1]
+
+    if level != 0 or opens[1] != 1 or opens[depth + 1] > 0 \
+        or any(counts[d] is not None and counts[d] != carry[d] for d in range(1, depth + 1)) \
+        or any(opens[d + 1] != opens[d] * shape[d - 1] for d in range(1, depth)):
+        return np.array(ast.literal_eval(text))
+
+    if is_mixed:
+        # sorted by level, the brackets of each level alternate between an
+        # opening and its closing bracket; (1) is a number, not a tuple
+        order = rnp.argsort(rnp.concatenate(bracket_levels), kind='stable')
+        chars = rnp.concatenate(brackets)[order]
+        pairs = chars[0::2].astype(rnp.int16) * 256 + chars[1::2]
+
+        if 1 in shape or not rnp.all((pairs == ord('[') * 256 + ord(']')) |
+                                     (pairs == ord('(') * 256 + ord(')'))):
+            return np.array(ast.literal_eval(text))
+
+    is_float = any(c in data for c in b'.eE')
+
+    if is_float and re.search(b'-0+[],)]', data):
+        # the integer -0 is 0.0 among floats, not -0.0
+        return np.array(ast.literal_eval(text))
+
+    array = rnp.empty(size, dtype=rnp.float64 if is_float else rnp.int64)
+
+    count, start = 0, 0
+
+    while start < len(data):
+        # cut the chunks after a separator, so no number is split, the window
+        # grows until it holds one
+        end, window = start, CHUNK
+
+        while end <= start:
+            if start + window >= len(data):
+                end = len(data)
+            else:
+                end = max(data.rfind(c, start, start + window) for c in b',])') + 1
+                window *= 2
+
+        numbers = data[start:end].translate(None, b'[]()').strip(b',')
+        start = end
+
+        if len(numbers) > 0:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error')
+                    values = rnp.loadtxt(io.BytesIO(numbers), delimiter=',',
+                                         dtype=array.dtype, ndmin=1)
+            except (ValueError, Warning):
+                return np.array(ast.literal_eval(text))
+
+            if count + len(values) > size:
+                return np.array(ast.literal_eval(text))
+
+            array[count:count + len(values)] = values
+            count += len(values)
+
+    if count != size:
+        return np.array(ast.literal_eval(text))
+
+    return array.reshape(shape)
+
 def wrapped_partial(func, *args, **kwargs):
     partial_func = partial(func, *args, **kwargs)
     update_wrapper(partial_func, func)
@@ -27,6 +209,19 @@ def tanh(x):
 def softmax(x):
     return np.exp(x) / np.sum(np.exp(x))
 
+def backward_func(func, output, g):
+    # gradient of the input of an activation from its output and the gradient g of the output
+    if func is None:
+        return g
+    elif func == relu:
+        return g * (output > 0)
+    elif func == sigmoid:
+        return g * output * (1 - output)
+    elif func == tanh:
+        return g * (1 - output * output)
+    else:
+        raise NameError('Not support yet!')
+
 def reshape(params):
     import numpy as rnp
     return wrapped_partial(rnp.reshape, newshape=params)
@@ -138,8 +333,23 @@ def index3d(channel, stride, kshape, xshape):
 
     return c_idx, d_idx, h_idx, w_idx
     
-def generate_x(size, lower, upper):
-    x = np.random.rand(size)
+def windows(x, kshape, stride):
+    # zero-copy view (n, c, *res, *kshape) of the sliding windows over the trailing axes of x
+    axes = tuple(range(2, x.ndim))
+    view = sliding_window_view(x, kshape, axis=axes)
+
+    return view[(slice(None), slice(None)) + (slice(None, None, stride),) * len(kshape)]
+
+def window_slices(res, kshape, stride):
+    # for each offset in the kernel, the slices of the padded input read by the
+    # windows at that offset, the res windows per axis; used to go back from windows
+    for offset in product(*[range(k) for k in kshape]):
+        idx = [slice(o, o + stride * (r - 1) + 1, stride) for o, r in zip(offset, res)]
+        yield offset, (slice(None), slice(None), *idx)
+
+def generate_x(size, lower, upper, n=None):
+    # with n given, return a batch of n samples, one per row
+    x = np.random.rand(size) if n is None else np.random.rand(n, size)
     x = (upper - lower) * x + lower
 
     return x